@@ -0,0 +1,658 @@
+"""
+This script file lists the benchmark cases.
+
+A case is a function timed against a dataset, an optional setup run before each timed call (outside the timing),
+and the public functions the case exercises. get_uncovered_functions() compares those with the public functions
+of the persistence and service modules, so a new function without a benchmark shows up in the report.
+
+Functions with a cache are timed cold, the setup clears the cache before each call, and warm in a separate case.
+Write cases use a day after the end of the dataset and put it back the way it was, so the dataset stays the same
+from one case to the next.
+"""
+import importlib
+import inspect
+import os
+from collections import namedtuple
+from datetime import date, timedelta
+
+from database import finance_data_persistence as finance_persistence
+from database import journal_data_persistence as journal_persistence
+from database import mindfulness_data_persistence as mindfulness_persistence
+from database import snapshot_persistence
+from database.migrations import upgrade_database, get_schema_version, create_log_tables, add_finance_rollup, \
+    add_mood_rollup, add_journal_search_index, make_journal_search_index_contentless
+from wellness_service import analytics, dashboard, data_export, data_import, financial_wellness, journal, \
+    mindfulness, wellness_visual
+
+BenchmarkCase = namedtuple('BenchmarkCase', ['name', 'run', 'setup', 'covers'])
+
+# The modules whose public functions should all be benchmarked
+BENCHMARKED_MODULES = (
+    'database.finance_data_persistence', 'database.mindfulness_data_persistence',
+    'database.journal_data_persistence', 'database.snapshot_persistence', 'database.migrations',
+    'wellness_service.financial_wellness', 'wellness_service.mindfulness', 'wellness_service.journal',
+    'wellness_service.dashboard', 'wellness_service.analytics', 'wellness_service.data_import',
+    'wellness_service.data_export', 'wellness_service.wellness_visual',
+)
+
+# Public functions that are not worth timing on their own
+NOT_BENCHMARKED = {
+    # parquet export needs the optional pyarrow package, it is benchmarked when pyarrow is installed
+    'write_parquet',
+}
+
+# The day the write cases insert, update and delete. It is after the end of every dataset
+WRITE_DAY = date(2100, 1, 1)
+
+
+class BenchmarkContext(object):
+    """
+    BenchmarkContext holds the dates and words of the dataset the cases run against
+    """
+
+    def __init__(self, first_day, last_day, search_word, work_directory):
+        self.first_day = first_day
+        self.last_day = last_day
+        self.mid_day = first_day + (last_day - first_day) / 2
+        # the last month and the last year of the dataset
+        self.month_range = (last_day.replace(day=1), last_day)
+        self.year_range = (last_day - timedelta(days=364), last_day)
+        self.search_word = search_word
+        self.work_directory = work_directory
+
+    def work_path(self, name):
+        """
+        returns the path of a scratch file in the work directory
+        :param name:
+        :return:
+        """
+        return os.path.join(self.work_directory, name)
+
+
+def clear_caches():
+    """
+    empties the chart and analytics caches so the next call is timed cold
+    :return:
+    """
+    wellness_visual.chart_cache.clear()
+    analytics.clear_analytics_cache()
+
+
+def draw_headless(prepare_chart):
+    """
+    returns a function that prepares a chart and draws it on an off screen figure the size of the chart canvases
+    :param prepare_chart:
+    :return:
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    def run():
+        figure = Figure(figsize=(5, 4), dpi=100)
+        canvas = FigureCanvasAgg(figure)
+        wellness_visual.draw_chart(figure, prepare_chart())
+        canvas.draw()
+    return run
+
+
+def show_headless(show_chart):
+    """
+    returns a function that calls one of the wellness_visual show functions on an off screen figure and renders it
+    :param show_chart: function(figure)
+    :return:
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    def run():
+        figure = Figure(figsize=(5, 4), dpi=100)
+        canvas = FigureCanvasAgg(figure)
+        show_chart(figure)
+        canvas.draw()
+    return run
+
+
+def get_finance_cases(context):
+    """
+    returns the cases of the finance persistence and service functions
+    :param context:
+    :return:
+    """
+    first_day, last_day, mid_day = context.first_day, context.last_day, context.mid_day
+    month_range, year_range = context.month_range, context.year_range
+    amounts = (100.0, 10.0, 5.0, 30.0, 12.0, 3.0)
+    existing_rows = [{'log_date': log_date, **dict(zip(finance_persistence.FINANCE_AMOUNT_COLUMNS, values))}
+                     for log_date, *values in finance_persistence.get_finance_amount_rows(*year_range)]
+
+    def ensure_write_day(exists):
+        def setup():
+            finance_persistence.delete_finance_log(WRITE_DAY)
+            if exists:
+                finance_persistence.insert_finance_data(*amounts, WRITE_DAY)
+        return setup
+
+    return [
+        BenchmarkCase('finance.get_all_finance_data', finance_persistence.get_all_finance_data, None,
+                      ['get_all_finance_data']),
+        BenchmarkCase('finance.get_all_finance_data_between_dates[month]',
+                      lambda: finance_persistence.get_all_finance_data_between_dates(*month_range), None,
+                      ['get_all_finance_data_between_dates']),
+        BenchmarkCase('finance.get_finance_amount_rows', finance_persistence.get_finance_amount_rows, None,
+                      ['get_finance_amount_rows']),
+        BenchmarkCase('finance.iter_finance_logs', lambda: sum(1 for _ in finance_persistence.iter_finance_logs()),
+                      None, ['iter_finance_logs']),
+        BenchmarkCase('finance.get_finance_log_dates[first page]', finance_persistence.get_finance_log_dates, None,
+                      ['get_finance_log_dates']),
+        BenchmarkCase('finance.get_finance_log_dates[middle page]',
+                      lambda: finance_persistence.get_finance_log_dates(mid_day), None, ['get_finance_log_dates']),
+        BenchmarkCase('finance.get_finance_log_by_date', lambda: finance_persistence.get_finance_log_by_date(mid_day),
+                      None, ['get_finance_log_by_date']),
+        BenchmarkCase('finance.get_finance_rollup_totals', finance_persistence.get_finance_rollup_totals, None,
+                      ['get_finance_rollup_totals']),
+        BenchmarkCase('finance.get_finance_totals[all]', finance_persistence.get_finance_totals, None,
+                      ['get_finance_totals']),
+        BenchmarkCase('finance.get_finance_totals[year]', lambda: finance_persistence.get_finance_totals(*year_range),
+                      None, ['get_finance_totals']),
+        BenchmarkCase('finance.get_finance_log_date_range', finance_persistence.get_finance_log_date_range, None,
+                      ['get_finance_log_date_range']),
+        BenchmarkCase('finance.get_finance_totals_grouped[all by month]',
+                      lambda: finance_persistence.get_finance_totals_grouped(first_day, last_day, 'month'), None,
+                      ['get_finance_totals_grouped']),
+        BenchmarkCase('finance.get_finance_totals_grouped[year by day]',
+                      lambda: finance_persistence.get_finance_totals_grouped(*year_range, 'day'), None,
+                      ['get_finance_totals_grouped']),
+        BenchmarkCase('finance.rebuild_finance_rollup', finance_persistence.rebuild_finance_rollup, None,
+                      ['rebuild_finance_rollup']),
+        BenchmarkCase('finance.upsert_finance_logs[year]',
+                      lambda: finance_persistence.upsert_finance_logs(existing_rows), None, ['upsert_finance_logs']),
+        BenchmarkCase('finance.insert_finance_data',
+                      lambda: finance_persistence.insert_finance_data(*amounts, WRITE_DAY), ensure_write_day(False),
+                      ['insert_finance_data']),
+        BenchmarkCase('finance.update_finance_log', lambda: finance_persistence.update_finance_log(*amounts, WRITE_DAY),
+                      ensure_write_day(True), ['update_finance_log']),
+        BenchmarkCase('finance.delete_finance_log', lambda: finance_persistence.delete_finance_log(WRITE_DAY),
+                      ensure_write_day(True), ['delete_finance_log']),
+
+        BenchmarkCase('financial_wellness.calculate_financial_breakdown',
+                      financial_wellness.calculate_financial_breakdown, None, ['calculate_financial_breakdown']),
+        BenchmarkCase('financial_wellness.calculate_financial_breakdown_by_date[year]',
+                      lambda: financial_wellness.calculate_financial_breakdown_by_date(*year_range), None,
+                      ['calculate_financial_breakdown_by_date']),
+        BenchmarkCase('financial_wellness.calculate_financial_breakdown_grouped[all by month]',
+                      lambda: financial_wellness.calculate_financial_breakdown_grouped(first_day, last_day), None,
+                      ['calculate_financial_breakdown_grouped', 'get_finance_breakdown_dictionary_from_totals']),
+        BenchmarkCase('financial_wellness.calculate_financial_trend[all by week]',
+                      lambda: financial_wellness.calculate_financial_trend(first_day, last_day, 'week'), None,
+                      ['calculate_financial_trend', 'get_bucket_start_date']),
+        BenchmarkCase('financial_wellness.get_financial_wellness_date_range',
+                      financial_wellness.get_financial_wellness_date_range, None,
+                      ['get_financial_wellness_date_range']),
+        BenchmarkCase('financial_wellness.get_finance_breakdown_dictionary[month]',
+                      lambda: financial_wellness.get_finance_breakdown_dictionary(
+                          financial_wellness.get_all_financial_wellness_data()[-31:]), None,
+                      ['get_finance_breakdown_dictionary']),
+        BenchmarkCase('financial_wellness.get_all_financial_wellness_data',
+                      financial_wellness.get_all_financial_wellness_data, None, ['get_all_financial_wellness_data']),
+        BenchmarkCase('financial_wellness.get_financial_wellness_dates',
+                      financial_wellness.get_financial_wellness_dates, None, ['get_financial_wellness_dates']),
+        BenchmarkCase('financial_wellness.get_financial_wellness_data',
+                      lambda: financial_wellness.get_financial_wellness_data(mid_day), None,
+                      ['get_financial_wellness_data']),
+        BenchmarkCase('financial_wellness.insert_financial_wellness_data',
+                      lambda: financial_wellness.insert_financial_wellness_data(*amounts, WRITE_DAY),
+                      ensure_write_day(False), ['insert_financial_wellness_data']),
+        BenchmarkCase('financial_wellness.update_financial_wellness_data',
+                      lambda: financial_wellness.update_financial_wellness_data(*amounts, WRITE_DAY),
+                      ensure_write_day(True), ['update_financial_wellness_data']),
+        BenchmarkCase('financial_wellness.delete_financial_wellness_data',
+                      lambda: financial_wellness.delete_financial_wellness_data(WRITE_DAY),
+                      ensure_write_day(True), ['delete_financial_wellness_data']),
+    ]
+
+
+def get_mindfulness_cases(context):
+    """
+    returns the cases of the mindfulness persistence and service functions
+    :param context:
+    :return:
+    """
+    first_day, last_day, mid_day = context.first_day, context.last_day, context.mid_day
+    month_range, year_range = context.month_range, context.year_range
+    month_key = mindfulness_persistence.get_mood_period_key('month', mid_day)
+    week_key = mindfulness_persistence.get_mood_period_key('week', mid_day)
+    existing_rows = [{'log_date': log_date, 'user_mood': user_mood}
+                     for log_date, user_mood in mindfulness_persistence.get_mood_rows(*year_range)]
+
+    def ensure_write_day(exists):
+        def setup():
+            mindfulness_persistence.delete_mindfulness_log(WRITE_DAY)
+            if exists:
+                mindfulness_persistence.insert_mindfulness_data('HAPPY', WRITE_DAY)
+        return setup
+
+    return [
+        BenchmarkCase('mindfulness.normalize_mood', lambda: mindfulness_persistence.normalize_mood(' happy '), None,
+                      ['normalize_mood']),
+        BenchmarkCase('mindfulness.get_all_mindfulness_data', mindfulness_persistence.get_all_mindfulness_data, None,
+                      ['get_all_mindfulness_data']),
+        BenchmarkCase('mindfulness.get_all_mindfulness_data_between_dates[month]',
+                      lambda: mindfulness_persistence.get_all_mindfulness_data_between_dates(*month_range), None,
+                      ['get_all_mindfulness_data_between_dates']),
+        BenchmarkCase('mindfulness.iter_mindfulness_logs',
+                      lambda: sum(1 for _ in mindfulness_persistence.iter_mindfulness_logs()), None,
+                      ['iter_mindfulness_logs']),
+        BenchmarkCase('mindfulness.get_mindfulness_log_dates[middle page]',
+                      lambda: mindfulness_persistence.get_mindfulness_log_dates(mid_day), None,
+                      ['get_mindfulness_log_dates']),
+        BenchmarkCase('mindfulness.get_mindfulness_log_by_date',
+                      lambda: mindfulness_persistence.get_mindfulness_log_by_date(mid_day), None,
+                      ['get_mindfulness_log_by_date']),
+        BenchmarkCase('mindfulness.get_mood_rows', mindfulness_persistence.get_mood_rows, None, ['get_mood_rows']),
+        BenchmarkCase('mindfulness.get_mindfulness_log_date_range',
+                      mindfulness_persistence.get_mindfulness_log_date_range, None,
+                      ['get_mindfulness_log_date_range']),
+        BenchmarkCase('mindfulness.get_mood_counts_by_day[year]',
+                      lambda: mindfulness_persistence.get_mood_counts_by_day(*year_range), None,
+                      ['get_mood_counts_by_day']),
+        BenchmarkCase('mindfulness.get_mood_counts[all]', mindfulness_persistence.get_mood_counts, None,
+                      ['get_mood_counts']),
+        BenchmarkCase('mindfulness.get_mood_counts[year]',
+                      lambda: mindfulness_persistence.get_mood_counts(*year_range), None, ['get_mood_counts']),
+        BenchmarkCase('mindfulness.normalize_stored_moods', mindfulness_persistence.normalize_stored_moods, None,
+                      ['normalize_stored_moods']),
+        BenchmarkCase('mindfulness.get_mood_period_keys',
+                      lambda: mindfulness_persistence.shift_mood_period_key(
+                          'week', mindfulness_persistence.get_mood_period_key('week', mid_day), 1), None,
+                      ['get_mood_period_key', 'shift_mood_period_key']),
+        BenchmarkCase('mindfulness.get_mood_period_start',
+                      lambda: mindfulness_persistence.get_mood_period_start('week', week_key), None,
+                      ['get_mood_period_start']),
+        BenchmarkCase('mindfulness.get_mood_rollup_series[all by month]',
+                      lambda: mindfulness_persistence.get_mood_rollup_series('month', first_day, last_day), None,
+                      ['get_mood_rollup_series']),
+        BenchmarkCase('mindfulness.get_mood_rollup_series[all by week]',
+                      lambda: mindfulness_persistence.get_mood_rollup_series('week', first_day, last_day), None,
+                      ['get_mood_rollup_series']),
+        BenchmarkCase('mindfulness.get_mood_rollup_counts',
+                      lambda: mindfulness_persistence.get_mood_rollup_counts('month', month_key), None,
+                      ['get_mood_rollup_counts']),
+        BenchmarkCase('mindfulness.rebuild_mood_rollup', mindfulness_persistence.rebuild_mood_rollup, None,
+                      ['rebuild_mood_rollup']),
+        BenchmarkCase('mindfulness.upsert_mindfulness_logs[year]',
+                      lambda: mindfulness_persistence.upsert_mindfulness_logs(existing_rows), None,
+                      ['upsert_mindfulness_logs']),
+        BenchmarkCase('mindfulness.insert_mindfulness_data',
+                      lambda: mindfulness_persistence.insert_mindfulness_data('HAPPY', WRITE_DAY),
+                      ensure_write_day(False), ['insert_mindfulness_data']),
+        BenchmarkCase('mindfulness.update_mindfulness_log',
+                      lambda: mindfulness_persistence.update_mindfulness_log('SAD', WRITE_DAY),
+                      ensure_write_day(True), ['update_mindfulness_log']),
+        BenchmarkCase('mindfulness.delete_mindfulness_log',
+                      lambda: mindfulness_persistence.delete_mindfulness_log(WRITE_DAY),
+                      ensure_write_day(True), ['delete_mindfulness_log']),
+
+        BenchmarkCase('mindfulness_service.get_mindfulness_breakdown_dictionary[month]',
+                      lambda: mindfulness.get_mindfulness_breakdown_dictionary(
+                          mindfulness_persistence.get_all_mindfulness_data_between_dates(*month_range)), None,
+                      ['get_mindfulness_breakdown_dictionary', 'build_mood_histogram']),
+        BenchmarkCase('mindfulness_service.get_mindfulness_data_history', mindfulness.get_mindfulness_data_history,
+                      None, ['get_mindfulness_data_history']),
+        BenchmarkCase('mindfulness_service.get_mindfulness_dates', mindfulness.get_mindfulness_dates, None,
+                      ['get_mindfulness_dates']),
+        BenchmarkCase('mindfulness_service.calculate_mood_breakdown', mindfulness.calculate_mood_breakdown, None,
+                      ['calculate_mood_breakdown']),
+        BenchmarkCase('mindfulness_service.calculate_mood_breakdown_by_date[year]',
+                      lambda: mindfulness.calculate_mood_breakdown_by_date(*year_range), None,
+                      ['calculate_mood_breakdown_by_date']),
+        BenchmarkCase('mindfulness_service.calculate_mood_breakdown_by_period[all by month]',
+                      lambda: mindfulness.calculate_mood_breakdown_by_period('month', first_day, last_day), None,
+                      ['calculate_mood_breakdown_by_period']),
+        BenchmarkCase('mindfulness_service.calculate_mood_trend[year by day]',
+                      lambda: mindfulness.calculate_mood_trend(*year_range, 'day'), None, ['calculate_mood_trend']),
+        BenchmarkCase('mindfulness_service.calculate_mood_trend[all by year]',
+                      lambda: mindfulness.calculate_mood_trend(first_day, last_day, 'year'), None,
+                      ['calculate_mood_trend']),
+        BenchmarkCase('mindfulness_service.get_mindfulness_date_range', mindfulness.get_mindfulness_date_range, None,
+                      ['get_mindfulness_date_range']),
+        BenchmarkCase('mindfulness_service.calculate_mood_breakdown_for_period',
+                      lambda: mindfulness.calculate_mood_breakdown_for_period('week', week_key), None,
+                      ['calculate_mood_breakdown_for_period']),
+        BenchmarkCase('mindfulness_service.mood_period_navigation',
+                      lambda: mindfulness.get_mood_period_start_date(
+                          'month', mindfulness.step_mood_period('month', mindfulness.get_mood_period('month', mid_day),
+                                                                -1)), None,
+                      ['get_mood_period', 'step_mood_period', 'get_mood_period_start_date']),
+        BenchmarkCase('mindfulness_service.get_mindfulness_data', lambda: mindfulness.get_mindfulness_data(mid_day),
+                      None, ['get_mindfulness_data']),
+        BenchmarkCase('mindfulness_service.insert_mindfulness_log',
+                      lambda: mindfulness.insert_mindfulness_log('HAPPY', WRITE_DAY), ensure_write_day(False),
+                      ['insert_mindfulness_log']),
+        BenchmarkCase('mindfulness_service.update_mindfulness_data',
+                      lambda: mindfulness.update_mindfulness_data('SAD', WRITE_DAY), ensure_write_day(True),
+                      ['update_mindfulness_data']),
+        BenchmarkCase('mindfulness_service.delete_mindfulness_data',
+                      lambda: mindfulness.delete_mindfulness_data(WRITE_DAY), ensure_write_day(True),
+                      ['delete_mindfulness_data']),
+    ]
+
+
+def get_journal_cases(context):
+    """
+    returns the cases of the journal persistence and service functions
+    :param context:
+    :return:
+    """
+    mid_day, month_range, year_range = context.mid_day, context.month_range, context.year_range
+    search_word = context.search_word
+    existing_rows = [{'journal_date': journal.journal_date, 'journal_title': journal.journal_title,
+                      'journal_entry': journal.journal_entry}
+                     for journal in journal_persistence.get_all_journal_data_between_dates(*month_range)]
+    entry = "A benchmark journal entry about the day. " * 40
+
+    def ensure_write_day(exists):
+        def setup():
+            journal_persistence.delete_journal_log(WRITE_DAY)
+            if exists:
+                journal_persistence.insert_journal_data("Benchmark", entry, WRITE_DAY)
+        return setup
+
+    return [
+        BenchmarkCase('journal.get_all_journal_data', journal_persistence.get_all_journal_data, None,
+                      ['get_all_journal_data']),
+        BenchmarkCase('journal.get_all_journal_data_between_dates[month]',
+                      lambda: journal_persistence.get_all_journal_data_between_dates(*month_range), None,
+                      ['get_all_journal_data_between_dates']),
+        BenchmarkCase('journal.iter_journal_logs', lambda: sum(1 for _ in journal_persistence.iter_journal_logs()),
+                      None, ['iter_journal_logs']),
+        BenchmarkCase('journal.get_journal_log_dates[middle page]',
+                      lambda: journal_persistence.get_journal_log_dates(mid_day), None, ['get_journal_log_dates']),
+        BenchmarkCase('journal.get_journal_log_summaries[middle page]',
+                      lambda: journal_persistence.get_journal_log_summaries(mid_day), None,
+                      ['get_journal_log_summaries']),
+        BenchmarkCase('journal.get_journal_log_by_date', lambda: journal_persistence.get_journal_log_by_date(mid_day),
+                      None, ['get_journal_log_by_date']),
+        BenchmarkCase('journal.build_journal_search_query',
+                      lambda: journal_persistence.build_journal_search_query('walk by the "river" (AND)'), None,
+                      ['build_journal_search_query']),
+        BenchmarkCase('journal.search_journal_logs[common word]',
+                      lambda: journal_persistence.search_journal_logs(search_word), None, ['search_journal_logs']),
+        BenchmarkCase('journal.search_journal_logs[common word, year]',
+                      lambda: journal_persistence.search_journal_logs(search_word, *year_range), None,
+                      ['search_journal_logs']),
+        BenchmarkCase('journal.search_journal_logs[no match]',
+                      lambda: journal_persistence.search_journal_logs('zzzzzz'), None, ['search_journal_logs']),
+        BenchmarkCase('journal.create_journal_search_index', journal_persistence.create_journal_search_index, None,
+                      ['create_journal_search_index']),
+        BenchmarkCase('journal.rebuild_journal_search_index', journal_persistence.rebuild_journal_search_index, None,
+                      ['rebuild_journal_search_index']),
+        BenchmarkCase('journal.upsert_journal_logs[month]',
+                      lambda: journal_persistence.upsert_journal_logs(existing_rows), None, ['upsert_journal_logs']),
+        BenchmarkCase('journal.insert_journal_data',
+                      lambda: journal_persistence.insert_journal_data("Benchmark", entry, WRITE_DAY),
+                      ensure_write_day(False), ['insert_journal_data']),
+        BenchmarkCase('journal.update_journal_log',
+                      lambda: journal_persistence.update_journal_log("Benchmark", entry + "More.", WRITE_DAY),
+                      ensure_write_day(True), ['update_journal_log']),
+        BenchmarkCase('journal.delete_journal_log', lambda: journal_persistence.delete_journal_log(WRITE_DAY),
+                      ensure_write_day(True), ['delete_journal_log']),
+
+        BenchmarkCase('journal_service.get_journal_logs', journal.get_journal_logs, None, ['get_journal_logs']),
+        BenchmarkCase('journal_service.get_journal_dates', journal.get_journal_dates, None, ['get_journal_dates']),
+        BenchmarkCase('journal_service.get_journal_summaries', journal.get_journal_summaries, None,
+                      ['get_journal_summaries']),
+        BenchmarkCase('journal_service.get_journal_by_date', lambda: journal.get_journal_by_date(mid_day), None,
+                      ['get_journal_by_date']),
+        BenchmarkCase('journal_service.search_journals[common word]', lambda: journal.search_journals(search_word),
+                      None, ['search_journals']),
+        BenchmarkCase('journal_service.get_journals_between_dates[month]',
+                      lambda: journal.get_journals_between_dates(*month_range), None, ['get_journals_between_dates']),
+        BenchmarkCase('journal_service.insert_journal_log',
+                      lambda: journal.insert_journal_log("Benchmark", entry, WRITE_DAY), ensure_write_day(False),
+                      ['insert_journal_log']),
+        BenchmarkCase('journal_service.update_journal',
+                      lambda: journal.update_journal("Benchmark", entry + "More.", WRITE_DAY), ensure_write_day(True),
+                      ['update_journal']),
+        BenchmarkCase('journal_service.delete_journal', lambda: journal.delete_journal(WRITE_DAY),
+                      ensure_write_day(True), ['delete_journal']),
+    ]
+
+
+def get_overview_cases(context):
+    """
+    returns the cases of the snapshot, dashboard and analytics functions
+    :param context:
+    :return:
+    """
+    first_day, last_day, mid_day = context.first_day, context.last_day, context.mid_day
+    month_range, year_range = context.month_range, context.year_range
+    arrays = analytics.load_wellness_arrays()
+    snapshot = snapshot_persistence.get_daily_snapshot(last_day)
+
+    return [
+        BenchmarkCase('snapshot.get_daily_snapshots[month]',
+                      lambda: snapshot_persistence.get_daily_snapshots(*month_range), None, ['get_daily_snapshots']),
+        BenchmarkCase('snapshot.get_daily_snapshots[year]',
+                      lambda: snapshot_persistence.get_daily_snapshots(*year_range), None, ['get_daily_snapshots']),
+        BenchmarkCase('snapshot.get_daily_snapshot', lambda: snapshot_persistence.get_daily_snapshot(mid_day), None,
+                      ['get_daily_snapshot']),
+        BenchmarkCase('dashboard.get_day_overview', lambda: dashboard.get_day_overview(mid_day), None,
+                      ['get_day_overview']),
+        BenchmarkCase('dashboard.get_days_overview[month with empty days]',
+                      lambda: dashboard.get_days_overview(*dashboard.get_month_range(last_day.year, last_day.month),
+                                                          include_empty_days=True), None,
+                      ['get_days_overview', 'get_month_range']),
+        BenchmarkCase('dashboard.step_month', lambda: dashboard.step_month(2024, 1, -13), None, ['step_month']),
+        BenchmarkCase('dashboard.get_total_expense',
+                      lambda: dashboard.get_total_expense(snapshot.finance if snapshot and snapshot.finance else {}),
+                      None, ['get_total_expense']),
+
+        BenchmarkCase('migrations.get_schema_version', get_schema_version, None, ['get_schema_version']),
+        BenchmarkCase('migrations.upgrade_database[current]', upgrade_database, None, ['upgrade_database']),
+
+        BenchmarkCase('analytics.load_wellness_arrays[cold]', analytics.load_wellness_arrays, clear_caches,
+                      ['load_wellness_arrays', 'clear_analytics_cache']),
+        BenchmarkCase('analytics.get_spending_series', lambda: analytics.get_spending_series(arrays), None,
+                      ['get_spending_series']),
+        BenchmarkCase('analytics.get_valence_series', lambda: analytics.get_valence_series(arrays), None,
+                      ['get_valence_series']),
+        BenchmarkCase('analytics.calculate_spending_by_mood[cold]', analytics.calculate_spending_by_mood,
+                      clear_caches, ['calculate_spending_by_mood']),
+        BenchmarkCase('analytics.calculate_spending_by_mood[warm]', analytics.calculate_spending_by_mood, None,
+                      ['calculate_spending_by_mood']),
+        BenchmarkCase('analytics.calculate_mood_spending_correlation[cold]',
+                      analytics.calculate_mood_spending_correlation, clear_caches,
+                      ['calculate_mood_spending_correlation']),
+        BenchmarkCase('analytics.calculate_rolling_mood_spending_correlation[cold]',
+                      analytics.calculate_rolling_mood_spending_correlation, clear_caches,
+                      ['calculate_rolling_mood_spending_correlation']),
+        BenchmarkCase('analytics.calculate_mood_spending_lag_effects[cold]',
+                      analytics.calculate_mood_spending_lag_effects, clear_caches,
+                      ['calculate_mood_spending_lag_effects']),
+        BenchmarkCase('analytics.calculate_spending_by_mood[cold, year]',
+                      lambda: analytics.calculate_spending_by_mood(*year_range), clear_caches,
+                      ['calculate_spending_by_mood']),
+        BenchmarkCase('analytics.calculate_mood_spending_correlation[cold, all dates given]',
+                      lambda: analytics.calculate_mood_spending_correlation(first_day, last_day), clear_caches,
+                      ['calculate_mood_spending_correlation']),
+    ]
+
+
+def get_import_export_cases(context):
+    """
+    returns the cases of the import and export functions
+    :param context:
+    :return:
+    """
+    finance_csv = context.work_path('finance.csv')
+    mindfulness_jsonl = context.work_path('mindfulness.jsonl')
+    cases = [
+        BenchmarkCase('data_export.export_domain[finance csv]',
+                      lambda: data_export.export_domain('finance', finance_csv), None,
+                      ['export_domain', 'write_csv', 'get_export_format', 'to_export_value']),
+        BenchmarkCase('data_export.export_domain[mindfulness jsonl]',
+                      lambda: data_export.export_domain('mindfulness', mindfulness_jsonl), None,
+                      ['export_domain', 'write_jsonl']),
+        BenchmarkCase('data_export.export_domain[journal columnar]',
+                      lambda: data_export.export_domain('journal', context.work_path('journal.columnar.jsonl.gz')),
+                      None, ['export_domain', 'write_columnar', 'chunked']),
+        BenchmarkCase('data_export.export_all[csv]',
+                      lambda: data_export.export_all(context.work_path('export_all')), None, ['export_all']),
+        # the exports above run first, so the files imported below exist
+        BenchmarkCase('data_import.import_file[finance csv]',
+                      lambda: data_import.import_file('finance', finance_csv), None,
+                      ['import_file', 'import_rows', 'read_rows', 'read_csv_rows', 'validate_row', 'batched']),
+        BenchmarkCase('data_import.import_file[mindfulness jsonl]',
+                      lambda: data_import.import_file('mindfulness', mindfulness_jsonl), None,
+                      ['import_file', 'read_jsonl_rows']),
+    ]
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return cases
+    return cases + [BenchmarkCase('data_export.export_domain[finance parquet]',
+                                  lambda: data_export.export_domain('finance', context.work_path('finance.parquet')),
+                                  None, ['export_domain', 'write_parquet'])]
+
+
+def get_chart_cases(context):
+    """
+    returns the cases of the chart functions. Charts are drawn on off screen figures with the Agg backend, the
+    same renderer the Tk canvas uses
+    :param context:
+    :return:
+    """
+    first_day, last_day = context.first_day, context.last_day
+    year_range = context.year_range
+    period_key = mindfulness_persistence.get_mood_period_key('month', context.mid_day)
+    finance_breakdown = financial_wellness.calculate_financial_breakdown()
+    mood_breakdown = mindfulness.calculate_mood_breakdown()
+    finance_trend = financial_wellness.calculate_financial_trend(first_day, last_day, 'month')
+    mood_trend = mindfulness.calculate_mood_trend(first_day, last_day, 'month')
+
+    return [
+        BenchmarkCase('wellness_visual.get_financial_pie_chart',
+                      lambda: wellness_visual.get_financial_pie_chart(finance_breakdown), None,
+                      ['get_financial_pie_chart']),
+        BenchmarkCase('wellness_visual.get_mood_pie_chart', lambda: wellness_visual.get_mood_pie_chart(mood_breakdown),
+                      None, ['get_mood_pie_chart']),
+        BenchmarkCase('wellness_visual.get_financial_trend_chart',
+                      lambda: wellness_visual.get_financial_trend_chart(finance_trend, 'month'), None,
+                      ['get_financial_trend_chart']),
+        BenchmarkCase('wellness_visual.get_mood_trend_chart',
+                      lambda: wellness_visual.get_mood_trend_chart(mood_trend, 'month'), None,
+                      ['get_mood_trend_chart']),
+        BenchmarkCase('wellness_visual.choose_trend_group',
+                      lambda: wellness_visual.choose_trend_group(first_day, last_day), None, ['choose_trend_group']),
+        BenchmarkCase('wellness_visual.get_trend_range',
+                      lambda: wellness_visual.get_trend_range(None, None,
+                                                              financial_wellness.get_financial_wellness_date_range),
+                      None, ['get_trend_range']),
+        BenchmarkCase('wellness_visual.prepare_financial_wellness_pie_chart[cold]',
+                      wellness_visual.prepare_financial_wellness_pie_chart, clear_caches,
+                      ['prepare_financial_wellness_pie_chart']),
+        BenchmarkCase('wellness_visual.prepare_financial_wellness_pie_chart[warm]',
+                      wellness_visual.prepare_financial_wellness_pie_chart, None,
+                      ['prepare_financial_wellness_pie_chart']),
+        BenchmarkCase('wellness_visual.prepare_financial_wellness_pie_chart[cold, year]',
+                      lambda: wellness_visual.prepare_financial_wellness_pie_chart(*year_range), clear_caches,
+                      ['prepare_financial_wellness_pie_chart']),
+        BenchmarkCase('wellness_visual.prepare_mood_wellness_pie_chart[cold]',
+                      wellness_visual.prepare_mood_wellness_pie_chart, clear_caches,
+                      ['prepare_mood_wellness_pie_chart']),
+        BenchmarkCase('wellness_visual.prepare_mood_wellness_pie_chart[cold, year]',
+                      lambda: wellness_visual.prepare_mood_wellness_pie_chart(*year_range), clear_caches,
+                      ['prepare_mood_wellness_pie_chart']),
+        BenchmarkCase('wellness_visual.prepare_mood_wellness_pie_chart_by_period[cold]',
+                      lambda: wellness_visual.prepare_mood_wellness_pie_chart_by_period('month', period_key),
+                      clear_caches, ['prepare_mood_wellness_pie_chart_by_period']),
+        BenchmarkCase('wellness_visual.prepare_financial_trend_chart[cold]',
+                      wellness_visual.prepare_financial_trend_chart, clear_caches,
+                      ['prepare_financial_trend_chart']),
+        BenchmarkCase('wellness_visual.prepare_mood_trend_chart[cold]', wellness_visual.prepare_mood_trend_chart,
+                      clear_caches, ['prepare_mood_trend_chart']),
+        BenchmarkCase('wellness_visual.draw_pie_chart[financial, rendered]',
+                      draw_headless(wellness_visual.prepare_financial_wellness_pie_chart), None,
+                      ['draw_chart', 'draw_pie_chart']),
+        BenchmarkCase('wellness_visual.draw_trend_chart[financial, rendered]',
+                      draw_headless(wellness_visual.prepare_financial_trend_chart), None,
+                      ['draw_chart', 'draw_trend_chart']),
+        BenchmarkCase('wellness_visual.draw_trend_chart[mood, rendered]',
+                      draw_headless(wellness_visual.prepare_mood_trend_chart), None,
+                      ['draw_chart', 'draw_trend_chart']),
+        BenchmarkCase('wellness_visual.show_financial_wellness_pie_chart[rendered]',
+                      show_headless(wellness_visual.show_financial_wellness_pie_chart), None,
+                      ['show_financial_wellness_pie_chart']),
+        BenchmarkCase('wellness_visual.show_financial_wellness_by_date[year, rendered]',
+                      show_headless(lambda figure: wellness_visual.show_financial_wellness_by_date(figure,
+                                                                                                   *year_range)),
+                      None, ['show_financial_wellness_by_date']),
+        BenchmarkCase('wellness_visual.show_mood_wellness_pie_chart[rendered]',
+                      show_headless(wellness_visual.show_mood_wellness_pie_chart), None,
+                      ['show_mood_wellness_pie_chart']),
+        BenchmarkCase('wellness_visual.show_mood_wellness_pie_chart_date_filter[year, rendered]',
+                      show_headless(lambda figure: wellness_visual.show_mood_wellness_pie_chart_date_filter(
+                          figure, *year_range)), None, ['show_mood_wellness_pie_chart_date_filter']),
+        BenchmarkCase('wellness_visual.show_mood_wellness_pie_chart_by_period[rendered]',
+                      show_headless(lambda figure: wellness_visual.show_mood_wellness_pie_chart_by_period(
+                          figure, 'month', period_key)), None, ['show_mood_wellness_pie_chart_by_period']),
+        BenchmarkCase('wellness_visual.show_financial_trend_chart[rendered]',
+                      show_headless(wellness_visual.show_financial_trend_chart), None,
+                      ['show_financial_trend_chart']),
+        BenchmarkCase('wellness_visual.show_mood_trend_chart[rendered]',
+                      show_headless(wellness_visual.show_mood_trend_chart), None, ['show_mood_trend_chart']),
+    ]
+
+
+def get_maintenance_cases(context):
+    """
+    returns the cases that rewrite whole tables. They run last so the other cases time the dataset as generated
+    :param context:
+    :return:
+    """
+    return [
+        # journals are compressed as they are written, so this times the pass over rows with nothing left to do
+        BenchmarkCase('journal.compress_journal_entries[already compressed]',
+                      lambda: journal_persistence.compress_journal_entries(vacuum=False), None,
+                      ['compress_journal_entries']),
+        BenchmarkCase('migrations.migration_steps',
+                      lambda: [step() for step in (create_log_tables, add_finance_rollup, add_mood_rollup,
+                                                   add_journal_search_index)], None,
+                      ['create_log_tables', 'add_finance_rollup', 'add_mood_rollup', 'add_journal_search_index']),
+        BenchmarkCase('migrations.make_journal_search_index_contentless', make_journal_search_index_contentless,
+                      None, ['make_journal_search_index_contentless', 'recreate_journal_search_index']),
+    ]
+
+
+def get_benchmark_cases(context):
+    """
+    returns every benchmark case in the order they run
+    :param context:
+    :return:
+    """
+    return (get_finance_cases(context) + get_mindfulness_cases(context) + get_journal_cases(context)
+            + get_overview_cases(context) + get_import_export_cases(context) + get_chart_cases(context)
+            + get_maintenance_cases(context))
+
+
+def get_public_functions():
+    """
+    returns the names of the public functions defined in the benchmarked modules
+    :return:
+    """
+    names = set()
+    for module_name in BENCHMARKED_MODULES:
+        module = importlib.import_module(module_name)
+        names.update(name for name, function in inspect.getmembers(module, inspect.isfunction)
+                     if not name.startswith('_') and function.__module__ == module_name)
+    return names
+
+
+def get_uncovered_functions(cases):
+    """
+    returns the public functions of the benchmarked modules that no case exercises
+    :param cases:
+    :return:
+    """
+    covered = {name for case in cases for name in case.covers}
+    return sorted(get_public_functions() - covered - NOT_BENCHMARKED)
+
@@ -0,0 +1,247 @@
+"""
+This script file runs the benchmarks and compares the results with an earlier run.
+
+Every case in benchmarks/cases.py is timed against synthetic databases of each requested size. The databases are
+generated once into the data directory and reused by later runs with the same parameters; each run works on a
+copy, so the write cases never change the stored dataset. The results are written as JSON and, given a baseline
+from an earlier run, any case that got slower than the threshold allows is reported and the run exits with 1.
+
+    python -m benchmarks.run_benchmarks --years 1 5 20 --output results.json
+    python -m benchmarks.run_benchmarks --years 1 5 20 --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import matplotlib
+
+# charts are drawn off screen, the benchmarks never open a window
+matplotlib.use('Agg')
+
+from database.database import DBConnection  # noqa: E402
+from database.migrations import upgrade_database  # noqa: E402
+from benchmarks.cases import BenchmarkContext, clear_caches, get_benchmark_cases, get_uncovered_functions  # noqa: E402
+from benchmarks.synthetic_data import DEFAULT_JOURNAL_WORDS, DEFAULT_SEED, generate_database, get_common_word, \
+    get_dataset_name, get_dataset_range  # noqa: E402
+
+DEFAULT_YEARS = [1, 5, 20]
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 1.25
+DEFAULT_DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), 'data')
+
+# Cases without a setup are called in loops of growing size until a loop takes this long, like timeit does, so
+# fast functions are not timed below the resolution of the clock
+MIN_LOOP_SECONDS = 0.05
+
+# Cases faster than this are not reported as regressions, their timings are too noisy
+MIN_COMPARED_SECONDS = 0.0001
+
+
+def time_case(case, repeat):
+    """
+    times a case and returns the seconds per call of each repetition
+    :param case: BenchmarkCase
+    :param repeat: the number of repetitions
+    :return:
+    """
+    if case.setup is not None:
+        timings = []
+        for _ in range(repeat):
+            case.setup()
+            start = time.perf_counter()
+            case.run()
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    case.run()  # warm up, the first call pays for imports and statement compilation
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            case.run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_LOOP_SECONDS:
+            break
+        loops *= 10 if elapsed < MIN_LOOP_SECONDS / 10 else 2
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            case.run()
+        timings.append((time.perf_counter() - start) / loops)
+    return timings
+
+
+def prepare_dataset(data_directory, years, journal_words, seed, regenerate):
+    """
+    returns the path of a dataset's database, generating it when it does not exist yet
+    :param data_directory:
+    :param years:
+    :param journal_words:
+    :param seed:
+    :param regenerate: generate the database even when it exists
+    :return: (path, row counts or None when the database was reused)
+    """
+    os.makedirs(data_directory, exist_ok=True)
+    path = os.path.join(data_directory, get_dataset_name(years, journal_words, seed) + '.db')
+    if os.path.exists(path) and not regenerate:
+        return path, None
+    temporary_path = path + '.tmp'
+    counts = generate_database(temporary_path, years, journal_words, seed)
+    DBConnection().use_database(None)
+    os.replace(temporary_path, path)
+    return path, counts
+
+
+def run_dataset(path, years, journal_words, seed, repeat, only):
+    """
+    runs every case against a copy of a dataset's database
+    :param path:
+    :param years:
+    :param journal_words:
+    :param seed:
+    :param repeat:
+    :param only: run only the cases whose name contains this text, None for every case
+    :return: (dictionary of case name to timing dictionary, list of cases)
+    """
+    connection = DBConnection()
+    with tempfile.TemporaryDirectory(prefix='wellness_benchmark_') as work_directory:
+        work_path = os.path.join(work_directory, os.path.basename(path))
+        shutil.copyfile(path, work_path)
+        connection.use_database(work_path)
+        # datasets generated before a schema migration are brought up to date, outside the timings
+        upgrade_database()
+        clear_caches()
+        try:
+            first_day, last_day = get_dataset_range(years)
+            context = BenchmarkContext(first_day, last_day, get_common_word(seed), work_directory)
+            cases = get_benchmark_cases(context)
+            results = {}
+            for case in cases:
+                if only and only not in case.name:
+                    continue
+                timings = time_case(case, repeat)
+                results[case.name] = {'min': min(timings), 'median': statistics.median(timings),
+                                      'max': max(timings)}
+                print(f"  {case.name:<80} {format_seconds(results[case.name]['median']):>10}", flush=True)
+        finally:
+            connection.use_database(None)
+            clear_caches()
+    return results, cases
+
+
+def format_seconds(seconds):
+    """
+    returns a duration with a unit that keeps it readable
+    :param seconds:
+    :return:
+    """
+    if seconds < 0.001:
+        return f"{seconds * 1000000:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1000:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def get_environment():
+    """
+    returns the versions the results were measured with
+    :return:
+    """
+    return {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def compare_results(results, baseline, threshold):
+    """
+    returns the cases that are slower than the baseline by more than the threshold. Medians are compared, and
+    cases that are missing from either run are ignored.
+    :param results:
+    :param baseline:
+    :param threshold: the largest allowed ratio of the new median to the baseline median
+    :return: list of (dataset, case name, baseline median, new median) tuples
+    """
+    regressions = []
+    for dataset, cases in results['datasets'].items():
+        baseline_cases = baseline.get('datasets', {}).get(dataset, {}).get('cases', {})
+        for name, timing in cases['cases'].items():
+            if name not in baseline_cases:
+                continue
+            old_median, new_median = baseline_cases[name]['median'], timing['median']
+            if new_median >= MIN_COMPARED_SECONDS and new_median > old_median * threshold:
+                regressions.append((dataset, name, old_median, new_median))
+    return regressions
+
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run_benchmarks',
+                                     description="Time the persistence and service functions on synthetic data.")
+    parser.add_argument('--years', type=int, nargs='+', default=DEFAULT_YEARS,
+                        help="the dataset sizes in years of daily logs (default: %(default)s)")
+    parser.add_argument('--journal-words', type=int, nargs=2, metavar=('FEWEST', 'MOST'),
+                        default=list(DEFAULT_JOURNAL_WORDS), help="the length of the journals in words")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="the seed of the synthetic data")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="the number of timings per case")
+    parser.add_argument('--only', help="run only the cases whose name contains this text")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare with the results of an earlier run")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="the slow down over the baseline that counts as a regression (default: %(default)s)")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIRECTORY, help="where the datasets are kept")
+    parser.add_argument('--regenerate', action='store_true', help="generate the datasets even if they exist")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    arguments = parse_arguments(arguments)
+    journal_words = tuple(arguments.journal_words)
+    results = {'environment': get_environment(), 'repeat': arguments.repeat, 'datasets': {}}
+    cases = []
+
+    for years in arguments.years:
+        name = get_dataset_name(years, journal_words, arguments.seed)
+        path, counts = prepare_dataset(arguments.data_dir, years, journal_words, arguments.seed,
+                                       arguments.regenerate)
+        print(f"{name}: " + (f"generated {counts}" if counts else f"reusing {path}"), flush=True)
+        timings, cases = run_dataset(path, years, journal_words, arguments.seed, arguments.repeat, arguments.only)
+        results['datasets'][name] = {'years': years, 'journal_words': list(journal_words), 'seed': arguments.seed,
+                                     'cases': timings}
+
+    uncovered = get_uncovered_functions(cases) if cases else []
+    results['uncovered_functions'] = uncovered
+    if uncovered:
+        print("Public functions without a benchmark: " + ", ".join(uncovered))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"Results written to {arguments.output}")
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(results, baseline, arguments.threshold)
+        for dataset, name, old_median, new_median in regressions:
+            print(f"REGRESSION {dataset} {name}: {format_seconds(old_median)} -> {format_seconds(new_median)} "
+                  f"({new_median / old_median:.2f}x)")
+        if regressions:
+            return 1
+        print(f"No case is more than {arguments.threshold}x slower than {arguments.compare}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
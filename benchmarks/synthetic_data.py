@@ -0,0 +1,149 @@
+"""
+This script file generates synthetic wellness databases for the benchmarks.
+
+A dataset covers a number of years of daily logs ending on END_DATE. Each day gets a finance log, a mood and a
+journal with a fixed probability, and the amounts, moods and journal words are drawn from a seeded random
+generator, so the same parameters always produce the same database.
+"""
+import os
+import random
+from datetime import date, timedelta
+
+from database.database import DBConnection
+from database.enumerations import Mood
+from database.finance_data_persistence import upsert_finance_logs
+from database.journal_data_persistence import upsert_journal_logs
+from database.migrations import upgrade_database
+from database.mindfulness_data_persistence import upsert_mindfulness_logs
+
+# The last day of every dataset, so datasets of the same size cover the same dates
+END_DATE = date(2024, 12, 31)
+
+# The chance that a day has each kind of log
+FINANCE_LOG_CHANCE = 0.9
+MOOD_LOG_CHANCE = 0.9
+JOURNAL_LOG_CHANCE = 0.5
+
+# The number of distinct words journals are written with
+VOCABULARY_SIZE = 2000
+
+# The number of days written per upsert batch
+BATCH_SIZE = 1000
+
+DEFAULT_JOURNAL_WORDS = (50, 400)
+DEFAULT_SEED = 42
+
+
+def get_dataset_name(years, journal_words=DEFAULT_JOURNAL_WORDS, seed=DEFAULT_SEED):
+    """
+    returns the name identifying a dataset, used for its database file and in the results
+    :param years:
+    :param journal_words: (fewest, most) words per journal
+    :param seed:
+    :return:
+    """
+    return f"{years}y_{journal_words[0]}-{journal_words[1]}w_seed{seed}"
+
+
+def get_dataset_range(years):
+    """
+    returns the first and last day of a dataset covering a number of years
+    :param years:
+    :return:
+    """
+    return END_DATE - timedelta(days=round(365.25 * years) - 1), END_DATE
+
+
+def build_vocabulary(generator):
+    """
+    returns VOCABULARY_SIZE made up words of two to four syllables
+    :param generator:
+    :return:
+    """
+    syllables = [consonant + vowel for consonant in "bdfgklmnprstvz" for vowel in "aeiou"]
+    vocabulary = set()
+    while len(vocabulary) < VOCABULARY_SIZE:
+        vocabulary.add("".join(generator.choice(syllables) for _ in range(generator.randint(2, 4))))
+    return sorted(vocabulary)
+
+
+def generate_rows(years, journal_words=DEFAULT_JOURNAL_WORDS, seed=DEFAULT_SEED):
+    """
+    yields (finance rows, mindfulness rows, journal rows) batches of up to BATCH_SIZE days
+    :param years:
+    :param journal_words: (fewest, most) words per journal
+    :param seed:
+    :return:
+    """
+    generator = random.Random(seed)
+    vocabulary = build_vocabulary(generator)
+    # a few words are far more common than the rest, like in real writing
+    word_weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    moods = [mood.name for mood in Mood]
+    first_day, last_day = get_dataset_range(years)
+
+    finance_rows, mindfulness_rows, journal_rows = [], [], []
+    day = first_day
+    while day <= last_day:
+        if generator.random() < FINANCE_LOG_CHANCE:
+            finance_rows.append({
+                'log_date': day,
+                'income': round(generator.uniform(0, 300), 2),
+                'grocery_expense': round(generator.uniform(0, 80), 2),
+                'utility_expense': round(generator.uniform(0, 20), 2),
+                'rent': round(generator.uniform(0, 60), 2),
+                'food_expense': round(generator.uniform(0, 50), 2),
+                'misc_expense': round(generator.uniform(0, 40), 2),
+            })
+        if generator.random() < MOOD_LOG_CHANCE:
+            mindfulness_rows.append({'log_date': day, 'user_mood': generator.choice(moods)})
+        if generator.random() < JOURNAL_LOG_CHANCE:
+            words = generator.choices(vocabulary, weights=word_weights,
+                                      k=generator.randint(journal_words[0], journal_words[1]))
+            journal_rows.append({'journal_date': day,
+                                 'journal_title': " ".join(generator.sample(vocabulary, 3)).capitalize(),
+                                 'journal_entry': " ".join(words) + "."})
+        if (day - first_day).days % BATCH_SIZE == BATCH_SIZE - 1:
+            yield finance_rows, mindfulness_rows, journal_rows
+            finance_rows, mindfulness_rows, journal_rows = [], [], []
+        day += timedelta(days=1)
+    yield finance_rows, mindfulness_rows, journal_rows
+
+
+def generate_database(path, years, journal_words=DEFAULT_JOURNAL_WORDS, seed=DEFAULT_SEED):
+    """
+    writes a synthetic database to path, replacing any file already there. The connection is left pointing at
+    the new database.
+    :param path:
+    :param years:
+    :param journal_words: (fewest, most) words per journal
+    :param seed:
+    :return: dictionary of the number of finance, mindfulness and journal logs written
+    """
+    connection = DBConnection()
+    connection.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    connection.use_database(path)
+    upgrade_database()
+
+    counts = {'finance': 0, 'mindfulness': 0, 'journal': 0}
+    for finance_rows, mindfulness_rows, journal_rows in generate_rows(years, journal_words, seed):
+        upsert_finance_logs(finance_rows)
+        upsert_mindfulness_logs(mindfulness_rows)
+        upsert_journal_logs(journal_rows)
+        counts['finance'] += len(finance_rows)
+        counts['mindfulness'] += len(mindfulness_rows)
+        counts['journal'] += len(journal_rows)
+    connection.optimize()
+    return counts
+
+
+def get_common_word(seed=DEFAULT_SEED):
+    """
+    returns the most common journal word of a dataset, used as the search term by the benchmarks
+    :param seed:
+    :return:
+    """
+    return build_vocabulary(random.Random(seed))[0]
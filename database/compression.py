@@ -0,0 +1,72 @@
+"""
+This script file holds the compressed text column type used for journal entries.
+
+Text shorter than the threshold is stored as plain text. Longer text is zlib compressed and stored as a BLOB that
+starts with a version tag, so the format can change later without breaking rows that were already written.
+Plain text rows written before compression existed are read back unchanged, so compression can be switched on for
+an existing database and the old rows compressed later with compress_journal_entries().
+"""
+import zlib
+
+from sqlalchemy import String
+from sqlalchemy.types import TypeDecorator
+
+# version tag written in front of the compressed bytes: (compress, decompress)
+COMPRESSION_FORMATS = {
+    b"WZ1:": (lambda data: zlib.compress(data, 6), zlib.decompress),
+}
+CURRENT_COMPRESSION_FORMAT = b"WZ1:"
+
+
+def compress_text(value, threshold):
+    """
+    compresses text that is at least threshold bytes long when compressing makes it smaller
+    :param value:
+    :param threshold: the smallest size in bytes that is compressed, None to never compress
+    :return: the compressed bytes starting with the version tag, or the text unchanged
+    """
+    if value is None or threshold is None:
+        return value
+    encoded = value.encode("utf-8")
+    if len(encoded) < threshold:
+        return value
+    compress = COMPRESSION_FORMATS[CURRENT_COMPRESSION_FORMAT][0]
+    compressed = CURRENT_COMPRESSION_FORMAT + compress(encoded)
+    return compressed if len(compressed) < len(encoded) else value
+
+
+def decompress_text(value):
+    """
+    returns the text of a stored value, decompressing it when it was stored compressed
+    :param value:
+    :return:
+    """
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    tag = value[:4]
+    if tag not in COMPRESSION_FORMATS:
+        raise ValueError(f"unknown compression format {tag!r}")
+    return COMPRESSION_FORMATS[tag][1](value[4:]).decode("utf-8")
+
+
+class CompressedText(TypeDecorator):
+    """
+    Text column that transparently compresses long values. The column is still declared as text in the schema,
+    SQLite keeps the compressed values as BLOBs.
+    """
+    impl = String
+    cache_ok = True
+
+    # Values at least this many bytes long are compressed. Set to None to store every value as plain text
+    COMPRESSION_THRESHOLD = 512
+
+    @property
+    def python_type(self):
+        return str
+
+    def process_bind_param(self, value, dialect):
+        return compress_text(value, self.COMPRESSION_THRESHOLD)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
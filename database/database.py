@@ -2,11 +2,15 @@
 This python script holds the database instance and the models used in the
 database for data persistence
 """
-import os.path
+import threading
+from contextlib import contextmanager
 from datetime import date
 
-from sqlalchemy import Float, Integer, Date, String, create_engine
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import Float, Integer, Date, String, create_engine, event
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, scoped_session, sessionmaker
+
+from database.compression import CompressedText
+from database.instrumentation import instrument_engine
 
 
 class DBConnection(object):
@@ -14,14 +18,200 @@ class DBConnection(object):
     This class just holds the DBConnection. For now, it is a disk based database interacted with SQLAlchemy ORM.
     This class will allow for the developer to easily add another database connection type in the future.
     SQLAlchemy supports other databases sucha as SQLite, Postgresql, MySQL, MariaDB, Oracle, and MS-SQL
+
+    DBConnection is a singleton. The engine (and its connection pool) and the session factory are built once
+    per process and shared by every caller, so the persistence functions no longer pay for engine
+    construction and dialect initialization on every call.
     """
     DB_FILENAME = 'personalWellness.db'
+    # The number of connections kept open in the pool. Up to twice as many more are opened when every pooled
+    # connection is busy, and closed again once they are returned
+    POOL_SIZE = 5
+    # PRAGMAs applied to every new connection, in order.
+    # WAL journaling lets the history and chart screens read while an entry screen writes, and with
+    # synchronous=NORMAL a commit no longer waits for an fsync (a power cut can lose the last commits, but never
+    # corrupts the database). Reads are served from a memory map and a 32 MB page cache, temporary tables and
+    # sorts stay in memory, and a connection waits up to 5 seconds for another one's lock instead of failing.
+    # Set to an empty dictionary to use the SQLite defaults.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -32 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    }
+
+    _instance = None
+    _engine = None
+    _session_factory = None
+    # path of the database file when use_database() pointed the connection somewhere else
+    _database_path = None
+    # how many session_scope() and read_session() blocks are open on each thread
+    _session_depths = threading.local()
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
 
     def get_sqlalchemy_sqlite_connection(self):
+        if DBConnection._database_path is not None:
+            return "sqlite:///" + DBConnection._database_path
         return "sqlite:///database/" + self.DB_FILENAME
 
+    def get_database_path(self):
+        """
+        Returns the path of the database file, for code that opens its own sqlite3 connection
+        :return:
+        """
+        return self.get_sqlalchemy_engine().url.database
+
+    def use_database(self, path):
+        """
+        Points the connection at another database file, for example a copy used by the benchmarks. The pooled
+        connections to the previous file are released. Pass None to go back to the application database.
+        :param path:
+        :return:
+        """
+        self.dispose()
+        DBConnection._database_path = path
+
+    def set_pool_size(self, pool_size):
+        """
+        Changes the number of pooled connections, for example to match the threads of a server. The pooled
+        connections are released and the next call builds a new engine with the new pool.
+        :param pool_size:
+        :return:
+        """
+        self.dispose()
+        DBConnection.POOL_SIZE = pool_size
+
     def get_sqlalchemy_engine(self):
-        return create_engine(self.get_sqlalchemy_sqlite_connection(), echo=True)
+        """
+        Returns the process wide engine, creating it on first use
+        :return:
+        """
+        if DBConnection._engine is None:
+            engine = create_engine(self.get_sqlalchemy_sqlite_connection(), pool_size=self.POOL_SIZE,
+                                   max_overflow=self.POOL_SIZE * 2)
+            event.listen(engine, "connect", self.apply_connection_profile)
+            # every statement is timed and attributed to its screen and persistence function, see
+            # database/instrumentation.py
+            instrument_engine(engine)
+            DBConnection._engine = engine
+        return DBConnection._engine
+
+    def apply_connection_profile(self, dbapi_connection, connection_record):
+        """
+        Engine connect event handler. Applies SQLITE_PRAGMAS to a new connection
+        :param dbapi_connection:
+        :param connection_record:
+        :return:
+        """
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma, value in self.SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {pragma} = {value}")
+        finally:
+            cursor.close()
+
+    def optimize(self):
+        """
+        Runs PRAGMA optimize, which refreshes the query planner statistics of the tables whose contents changed
+        enough to need it. It is cheap when there is nothing to do, and is meant to be run every few hours by long
+        running processes and when they close.
+        :return:
+        """
+        with self.get_sqlalchemy_engine().connect() as connection:
+            connection.exec_driver_sql("PRAGMA optimize")
+
+    def get_scoped_session(self):
+        """
+        Returns the scoped session registry. Each thread gets its own session from the registry.
+        :return:
+        """
+        if DBConnection._session_factory is None:
+            DBConnection._session_factory = scoped_session(
+                sessionmaker(bind=self.get_sqlalchemy_engine(), expire_on_commit=False))
+        return DBConnection._session_factory
+
+    @contextmanager
+    def session_scope(self):
+        """
+        Provides a transactional scope around a series of operations. The transaction is committed when the
+        block exits normally and rolled back if an exception is raised. The session is released when the outermost
+        block on the thread exits. A session_scope() inside another one shares its session and transaction, so it
+        is committed or rolled back with the outer one.
+        :return:
+        """
+        depths = self._session_depths
+        outermost_transaction = getattr(depths, 'transactions', 0) == 0
+        depths.transactions = getattr(depths, 'transactions', 0) + 1
+        with self._thread_session() as session:
+            try:
+                yield session
+                if outermost_transaction:
+                    session.commit()
+            except Exception:
+                if outermost_transaction:
+                    session.rollback()
+                raise
+            finally:
+                depths.transactions -= 1
+
+    @contextmanager
+    def read_session(self):
+        """
+        Provides a session for read only operations. Objects loaded in the block stay usable after the block
+        exits, and the connection is returned to the pool when the outermost block on the thread exits.
+        :return:
+        """
+        with self._thread_session() as session:
+            yield session
+
+    @contextmanager
+    def _thread_session(self):
+        """
+        Provides the session of the current thread, released when the outermost block using it exits. Releasing
+        it in a nested block would close the session the enclosing block is still using
+        :return:
+        """
+        depths = self._session_depths
+        registry = self.get_scoped_session()
+        session = registry()
+        depths.sessions = getattr(depths, 'sessions', 0) + 1
+        try:
+            yield session
+        finally:
+            depths.sessions -= 1
+            if depths.sessions == 0:
+                registry.remove()
+
+    def stream_rows(self, statement, chunk_size=1000):
+        """
+        Yields the rows of a select statement, fetching chunk_size rows at a time so memory use does not grow with
+        the size of the table. A dedicated connection is used, so other queries can run while the rows are read.
+        :param statement:
+        :param chunk_size:
+        :return:
+        """
+        with self.get_sqlalchemy_engine().connect() as connection:
+            result = connection.execution_options(yield_per=chunk_size).execute(statement)
+            for partition in result.partitions():
+                yield from partition
+
+    def dispose(self):
+        """
+        Releases the pooled connections and forgets the engine. The next call builds a new engine.
+        :return:
+        """
+        if DBConnection._session_factory is not None:
+            DBConnection._session_factory.remove()
+            DBConnection._session_factory = None
+        if DBConnection._engine is not None:
+            DBConnection._engine.dispose()
+            DBConnection._engine = None
 
 
 class Base(DeclarativeBase):
@@ -52,6 +242,30 @@ class Finance(Base):
                 f" misc={self.misc_expense} log_date={self.log_date})")
 
 
+class FinanceRollup(Base):
+    """
+        The FinanceRollup class holds running totals of the finance table. There is one row for all time
+        (period_type 'all'), one row per year (period_type 'year', period_key 'YYYY') and one row per month
+        (period_type 'month', period_key 'YYYY-MM'). The rows are kept up to date by the finance persistence
+        functions in the same transaction as the finance row they change.
+    """
+    __tablename__ = "finance_rollup"
+
+    period_type: Mapped[str] = mapped_column(String, primary_key=True)
+    period_key: Mapped[str] = mapped_column(String, primary_key=True)
+    income: Mapped[float] = mapped_column(Float, default=0)
+    grocery_expense: Mapped[float] = mapped_column(Float, default=0)
+    utility_expense: Mapped[float] = mapped_column(Float, default=0)
+    rent: Mapped[float] = mapped_column(Float, default=0)
+    food_expense: Mapped[float] = mapped_column(Float, default=0)
+    misc_expense: Mapped[float] = mapped_column(Float, default=0)
+    entry_count: Mapped[int] = mapped_column(Integer, default=0)
+
+    def __repr__(self) -> str:
+        return (f"FinanceRollup(period_type={self.period_type}, period_key={self.period_key}, "
+                f"income={self.income}, entry_count={self.entry_count})")
+
+
 class Mindfulness(Base):
     """
     The Mindfulness class is a descriptor for the Mindfulness object that the application will be using
@@ -66,6 +280,24 @@ class Mindfulness(Base):
         return f"Mindfulness(user_mood={self.user_mood}, log_date={self.log_date})"
 
 
+class MoodRollup(Base):
+    """
+        The MoodRollup class holds the number of times each mood was logged per calendar period. period_type is
+        'week' (period_key is the ISO week 'YYYY-Www') or 'month' (period_key 'YYYY-MM'). The rows are kept up to
+        date by the mindfulness persistence functions in the same transaction as the mindfulness row they change.
+    """
+    __tablename__ = "mood_rollup"
+
+    period_type: Mapped[str] = mapped_column(String, primary_key=True)
+    period_key: Mapped[str] = mapped_column(String, primary_key=True)
+    user_mood: Mapped[str] = mapped_column(String, primary_key=True)
+    mood_count: Mapped[int] = mapped_column(Integer, default=0)
+
+    def __repr__(self):
+        return (f"MoodRollup(period_type={self.period_type}, period_key={self.period_key}, "
+                f"user_mood={self.user_mood}, mood_count={self.mood_count})")
+
+
 class Journal(Base):
     """
         The Journal class is a descriptor for the Mindfulness object that the application will be using
@@ -73,7 +305,9 @@ class Journal(Base):
         """
     __tablename__ = "journal"
 
-    journal_entry: Mapped[str] = mapped_column(String)
+    # the entry body is only loaded when asked for, so listing journals does not read every body. Long bodies
+    # are stored compressed
+    journal_entry: Mapped[str] = mapped_column(CompressedText, deferred=True)
     journal_title: Mapped[str] = mapped_column(String)
     journal_date: Mapped[date] = mapped_column(Date, primary_key=True)
 
@@ -83,11 +317,8 @@ class Journal(Base):
 
 def create_all_tables():
     """
-    This function creates all tables
+    This function creates all tables, upgrading the schema of an existing database without touching its data
     :return:
     """
-    conn = DBConnection()
-    if os.path.exists(conn.DB_FILENAME):
-        os.remove(conn.DB_FILENAME)
-    engine = conn.get_sqlalchemy_engine()
-    Base.metadata.create_all(engine)
+    from database.migrations import upgrade_database
+    upgrade_database()
@@ -2,19 +2,30 @@
     This script contains the functions related to finance data persistence.
 
 """
-from sqlalchemy.orm import Session
+from collections import defaultdict
 
-from database.database import DBConnection, Finance
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.database import DBConnection, Finance, FinanceRollup
+
+# The finance columns that hold an amount of money. These are the columns summed by the rollup table
+FINANCE_AMOUNT_COLUMNS = ('income', 'grocery_expense', 'utility_expense', 'rent', 'food_expense', 'misc_expense')
+
+# The SQL expressions used to bucket finance logs when aggregating. A week is keyed by the date of its Monday
+FINANCE_GROUP_BY_EXPRESSIONS = {
+    'day': func.date(Finance.log_date),
+    'week': func.date(Finance.log_date, 'weekday 0', '-6 days'),
+    'month': func.strftime('%Y-%m', Finance.log_date),
+    'year': func.strftime('%Y', Finance.log_date),
+}
 
 
 def insert_finance_data(income, grocery, utility, rent, food, misc, date):
     """
     This function is used for inserting data into the finance table
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-
-    with Session(engine) as session:
+    with DBConnection().session_scope() as session:
         firstEntry = Finance(
             income=income,
             grocery_expense=grocery,
@@ -25,36 +36,69 @@ def insert_finance_data(income, grocery, utility, rent, food, misc, date):
             log_date=date
         )
         session.add(firstEntry)
-        session.commit()
+        # flush so a duplicate date fails before the rollup is touched
+        session.flush()
+        _apply_finance_rollup_delta(session, date, _get_finance_amounts(firstEntry), 1)
 
 
 def get_all_finance_data():
     """
     This function is used for getting all the finance data
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    financeList = []
-    for finance in session.query(Finance):
-        financeList.append(finance)
-
-    return financeList
+    with DBConnection().read_session() as session:
+        return session.query(Finance).all()
 
 
 def get_all_finance_data_between_dates(date1, date2):
     """
         This function returns all the finance data between two dates
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
+    with DBConnection().read_session() as session:
+        return session.query(Finance).filter(Finance.log_date.between(date1, date2)).all()
 
-    financeList = []
-    for finance in session.query(Finance).filter(Finance.log_date.between(date1, date2)):
-        financeList.append(finance)
 
-    return financeList
+def get_finance_amount_rows(date1=None, date2=None):
+    """
+    This function returns (log_date, income, grocery_expense, utility_expense, rent, food_expense, misc_expense)
+    tuples in date order, without building Finance objects. When both dates are given only the logs between them
+    are returned.
+    :param date1:
+    :param date2:
+    :return:
+    """
+    statement = select(Finance.log_date, *[getattr(Finance, column) for column in FINANCE_AMOUNT_COLUMNS]) \
+        .order_by(Finance.log_date)
+    if date1 is not None and date2 is not None:
+        statement = statement.where(Finance.log_date.between(date1, date2))
+    with DBConnection().read_session() as session:
+        return [tuple(row) for row in session.execute(statement)]
+
+
+def iter_finance_logs(chunk_size=1000):
+    """
+    This function yields every finance log as a row of column values in date order, reading chunk_size rows at a
+    time instead of loading the whole table
+    :param chunk_size:
+    :return:
+    """
+    statement = select(*Finance.__table__.columns).order_by(Finance.log_date)
+    yield from DBConnection().stream_rows(statement, chunk_size)
+
+
+def get_finance_log_dates(before_date=None, limit=50):
+    """
+    This function returns up to limit finance log dates, newest first. Pass the last date of the previous page as
+    before_date to get the next page. The query walks the primary key index so a page costs the same no matter
+    how many logs there are.
+    :param before_date:
+    :param limit:
+    :return:
+    """
+    statement = select(Finance.log_date).order_by(Finance.log_date.desc()).limit(limit)
+    if before_date is not None:
+        statement = statement.where(Finance.log_date < before_date)
+    with DBConnection().read_session() as session:
+        return session.scalars(statement).all()
 
 
 def get_finance_log_by_date(date):
@@ -63,36 +107,214 @@ def get_finance_log_by_date(date):
     :param date:
     :return:
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    return session.query(Finance).filter(Finance.log_date == date).first()
+    with DBConnection().read_session() as session:
+        return session.query(Finance).filter(Finance.log_date == date).first()
 
 
 def update_finance_log(income, grocery, utility, rent, food, misc, date):
     """
         This function updates a finance log
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    session.query(Finance).filter(Finance.log_date == date).update({
-        'income': income,
-        'grocery_expense': grocery,
-        'utility_expense': utility,
-        'rent': rent,
-        'food_expense': food,
-        'misc_expense': misc
-    })
-    session.commit()
+    with DBConnection().session_scope() as session:
+        finance = session.get(Finance, date)
+        if finance is None:
+            return
+        old_amounts = _get_finance_amounts(finance)
+        finance.income = income
+        finance.grocery_expense = grocery
+        finance.utility_expense = utility
+        finance.rent = rent
+        finance.food_expense = food
+        finance.misc_expense = misc
+        new_amounts = _get_finance_amounts(finance)
+        _apply_finance_rollup_delta(session, date,
+                                    {column: new_amounts[column] - old_amounts[column]
+                                     for column in FINANCE_AMOUNT_COLUMNS}, 0)
 
 
 def delete_finance_log(date):
     """
         This function deletes a finance log
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    session.query(Finance).filter(Finance.log_date == date).delete()
-    session.commit()
+    with DBConnection().session_scope() as session:
+        finance = session.get(Finance, date)
+        if finance is None:
+            return
+        old_amounts = _get_finance_amounts(finance)
+        session.delete(finance)
+        _apply_finance_rollup_delta(session, date,
+                                    {column: -old_amounts[column] for column in FINANCE_AMOUNT_COLUMNS}, -1)
+
+
+def upsert_finance_logs(rows):
+    """
+    This function writes a batch of finance logs in one transaction with a single executemany upsert. A row whose
+    log_date already exists replaces the stored amounts. The rollup table is updated once per period touched by
+    the batch rather than once per row.
+    :param rows: list of dictionaries keyed by the Finance column names
+    :return:
+    """
+    if not rows:
+        return
+    with DBConnection().session_scope() as session:
+        dates = {row['log_date'] for row in rows}
+        stored_amounts = {finance.log_date: _get_finance_amounts(finance)
+                          for finance in session.query(Finance).filter(Finance.log_date.in_(dates))}
+
+        statement = sqlite_insert(Finance)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Finance.log_date],
+            set_={column: getattr(statement.excluded, column) for column in FINANCE_AMOUNT_COLUMNS})
+        session.execute(statement, rows)
+
+        # add up what the batch changed per rollup period
+        period_deltas = defaultdict(lambda: ({column: 0.0 for column in FINANCE_AMOUNT_COLUMNS}, [0]))
+        for row in rows:
+            old_amounts = stored_amounts.get(row['log_date'])
+            new_amounts = {column: row[column] for column in FINANCE_AMOUNT_COLUMNS}
+            for period in _get_rollup_periods(row['log_date']):
+                amounts, count = period_deltas[period]
+                for column in FINANCE_AMOUNT_COLUMNS:
+                    amounts[column] += new_amounts[column] - (old_amounts[column] if old_amounts else 0)
+                count[0] += 0 if old_amounts else 1
+            # a date repeated later in the batch replaces this row
+            stored_amounts[row['log_date']] = new_amounts
+        _apply_finance_period_deltas(session, [
+            dict(amounts, period_type=period_type, period_key=period_key, entry_count=count[0])
+            for (period_type, period_key), (amounts, count) in period_deltas.items()])
+
+
+def get_finance_rollup_totals(period_type='all', period_key='all'):
+    """
+    This function returns the running totals of a rollup period as a dictionary keyed by the finance column
+    names plus 'entry_count'. period_type is 'all', 'year' (key 'YYYY') or 'month' (key 'YYYY-MM').
+    Returns None when the rollup row does not exist.
+    :param period_type:
+    :param period_key:
+    :return:
+    """
+    with DBConnection().read_session() as session:
+        rollup = session.get(FinanceRollup, (period_type, period_key))
+        if rollup is None:
+            return None
+        totals = {column: getattr(rollup, column) for column in FINANCE_AMOUNT_COLUMNS}
+        totals['entry_count'] = rollup.entry_count
+        return totals
+
+
+def get_finance_totals(date1=None, date2=None):
+    """
+    This function sums the finance columns inside the database and returns a dictionary keyed by the finance
+    column names plus 'entry_count'. When both dates are given only the logs between them are summed.
+    :param date1:
+    :param date2:
+    :return:
+    """
+    statement = select(*_get_finance_sum_columns(), func.count())
+    if date1 is not None and date2 is not None:
+        statement = statement.where(Finance.log_date.between(date1, date2))
+    with DBConnection().read_session() as session:
+        row = session.execute(statement).one()
+    return _row_to_totals(row)
+
+
+def get_finance_log_date_range():
+    """
+    This function returns the dates of the first and last finance logs, (None, None) when there are none
+    :return:
+    """
+    with DBConnection().read_session() as session:
+        return tuple(session.execute(select(func.min(Finance.log_date), func.max(Finance.log_date))).one())
+
+
+def get_finance_totals_grouped(date1, date2, group_by='day'):
+    """
+    This function sums the finance columns between two dates grouped by 'day', 'week', 'month' or 'year'.
+    It returns a list of (bucket key, totals dictionary) tuples ordered by bucket. Day and week buckets are
+    keyed 'YYYY-MM-DD' (a week by its Monday), months 'YYYY-MM' and years 'YYYY'.
+    :param date1:
+    :param date2:
+    :param group_by:
+    :return:
+    """
+    if group_by not in FINANCE_GROUP_BY_EXPRESSIONS:
+        raise ValueError(f"group_by must be one of {', '.join(FINANCE_GROUP_BY_EXPRESSIONS)}")
+    bucket = FINANCE_GROUP_BY_EXPRESSIONS[group_by]
+    statement = (select(bucket, *_get_finance_sum_columns(), func.count())
+                 .where(Finance.log_date.between(date1, date2))
+                 .group_by(bucket)
+                 .order_by(bucket))
+    with DBConnection().read_session() as session:
+        return [(row[0], _row_to_totals(row[1:])) for row in session.execute(statement)]
+
+
+def rebuild_finance_rollup():
+    """
+    This function recalculates every rollup row from the finance table. It is used to fill the rollup table
+    for databases created before the rollup table existed.
+    :return:
+    """
+    with DBConnection().session_scope() as session:
+        _rebuild_finance_rollup(session)
+
+
+def _rebuild_finance_rollup(session):
+    session.execute(delete(FinanceRollup))
+    rollup_columns = ['period_type', 'period_key', *FINANCE_AMOUNT_COLUMNS, 'entry_count']
+    sums = [func.sum(getattr(Finance, column)) for column in FINANCE_AMOUNT_COLUMNS]
+    period_selects = [
+        select(literal('all'), literal('all'), *sums, func.count()).having(func.count() > 0),
+        select(literal('year'), func.strftime('%Y', Finance.log_date), *sums, func.count())
+        .group_by(func.strftime('%Y', Finance.log_date)),
+        select(literal('month'), func.strftime('%Y-%m', Finance.log_date), *sums, func.count())
+        .group_by(func.strftime('%Y-%m', Finance.log_date)),
+    ]
+    for period_select in period_selects:
+        session.execute(insert(FinanceRollup).from_select(rollup_columns, period_select))
+
+
+def _get_finance_sum_columns():
+    return [func.coalesce(func.sum(getattr(Finance, column)), 0.0) for column in FINANCE_AMOUNT_COLUMNS]
+
+
+def _row_to_totals(row):
+    # row holds the sums in FINANCE_AMOUNT_COLUMNS order followed by the count
+    totals = dict(zip(FINANCE_AMOUNT_COLUMNS, row))
+    totals['entry_count'] = row[len(FINANCE_AMOUNT_COLUMNS)]
+    return totals
+
+
+def _get_finance_amounts(finance):
+    return {column: getattr(finance, column) for column in FINANCE_AMOUNT_COLUMNS}
+
+
+def _get_rollup_periods(log_date):
+    return (('all', 'all'),
+            ('year', log_date.strftime('%Y')),
+            ('month', log_date.strftime('%Y-%m')))
+
+
+def _apply_finance_rollup_delta(session, log_date, amounts, count_delta):
+    """
+    Adds the amounts to every rollup period the log date belongs to. The addition happens inside the
+    database with an upsert so concurrent writers cannot lose an update.
+    """
+    _apply_finance_period_deltas(session, [
+        dict(amounts, period_type=period_type, period_key=period_key, entry_count=count_delta)
+        for period_type, period_key in _get_rollup_periods(log_date)])
+
+
+def _apply_finance_period_deltas(session, period_deltas):
+    """
+    Adds each delta row (period_type, period_key, the finance amounts and entry_count) to its rollup row with a
+    single executemany upsert
+    """
+    statement = sqlite_insert(FinanceRollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=[FinanceRollup.period_type, FinanceRollup.period_key],
+        set_={column: getattr(FinanceRollup, column) + getattr(statement.excluded, column)
+              for column in (*FINANCE_AMOUNT_COLUMNS, 'entry_count')})
+    session.execute(statement, period_deltas)
+    if any(period_delta['entry_count'] < 0 for period_delta in period_deltas):
+        # drop periods that no longer have any logs so rounding leftovers do not linger
+        session.execute(delete(FinanceRollup).where(FinanceRollup.entry_count <= 0))
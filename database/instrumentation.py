@@ -0,0 +1,438 @@
+"""
+This script file measures the SQL statements the application runs.
+
+The engine's before_cursor_execute and after_cursor_execute events time every statement. Each statement is
+recorded under the screen that asked for it, the persistence function that ran it and its SQL text, with a
+latency histogram, the number of rows it returned or changed and how many calls were slow. Statements slower than
+the slow query threshold are also logged as warnings through the logging module.
+
+The screen is the origin set with query_origin(), which the background worker sets to the channel of each task.
+Statements run on the GUI thread take the name of the screen class found on the call stack.
+
+Rows returned by a statement are counted by a row factory installed on its cursor. It costs one Python call per
+row fetched, about 100 ns, which is 10 to 15% of the time SQLAlchemy takes to fetch narrow rows. Lists of
+parameters, such as an expanded IN (...), are collapsed so every list length shares one statement, and the number
+of statements kept is bounded.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Set this environment variable to the number of milliseconds after which a statement is logged as slow
+SLOW_QUERY_ENV = "WELLNESS_SLOW_QUERY_MS"
+DEFAULT_SLOW_QUERY_SECONDS = 0.1
+
+# Upper bounds in seconds of the latency histogram buckets. The last bucket holds everything slower
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   float('inf'))
+
+# The origin and call site of statements that could not be traced to a screen or a persistence function
+UNKNOWN = "unknown"
+
+# How many frames are searched for the persistence function and the screen
+MAX_STACK_DEPTH = 40
+
+# The modules under database/ that are plumbing rather than persistence functions
+_PLUMBING_MODULES = {'database.database', 'database.instrumentation', 'database.compression'}
+
+# The most statements recorded. Once reached, new statements are recorded under OTHER_STATEMENTS per call site
+MAX_RECORDED_STATEMENTS = 2000
+OTHER_STATEMENTS = "(other statements)"
+
+# A parenthesized list of two or more parameters, and repeated rows of parameters of a multi row VALUES
+_PARAMETER_LIST = re.compile(r"\(\?(?:, \?)+\)")
+_REPEATED_PARAMETER_ROWS = re.compile(r"(\(\?(?:, \?)*\))(?:, \1)+")
+
+# The statistics of one statement issued from one call site on behalf of one origin
+QueryStatistics = namedtuple('QueryStatistics', ['origin', 'call_site', 'statement', 'calls', 'total_seconds',
+                                                 'max_seconds', 'rows', 'slow_calls', 'histogram'])
+
+
+class QueryStatisticsEntry(object):
+    """
+    QueryStatisticsEntry accumulates the timings of one statement from one call site
+    """
+    __slots__ = ('calls', 'total_seconds', 'max_seconds', 'rows', 'slow_calls', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.slow_calls = 0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+
+class RowCounter(object):
+    """
+    RowCounter counts the rows fetched from one cursor. Only the thread using the cursor adds to rows, and the
+    recorder moves the new rows to the statement's entry under its lock
+    """
+    __slots__ = ('entry', 'rows', 'recorded')
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.rows = 0
+        self.recorded = 0
+
+    def count_row(self, cursor, row):
+        """
+        sqlite3 row factory
+        :param cursor:
+        :param row:
+        :return: the row unchanged
+        """
+        self.rows += 1
+        return row
+
+
+def collapse_statement(statement):
+    """
+    returns the SQL text a statement is recorded under: whitespace collapsed, and parameter lists of any length
+    written as (?, ...)
+    :param statement:
+    :return:
+    """
+    text = " ".join(statement.split())
+    text = _REPEATED_PARAMETER_ROWS.sub(r"\1, ...", text)
+    return _PARAMETER_LIST.sub("(?, ...)", text)
+
+
+class QueryRecorder(object):
+    """
+    QueryRecorder holds the statistics of every statement run since the application started or the statistics
+    were reset. It is shared by every thread
+    """
+
+    def __init__(self, slow_query_seconds=DEFAULT_SLOW_QUERY_SECONDS):
+        self.enabled = True
+        self.slow_query_seconds = slow_query_seconds
+        self.entries = {}
+        self.lock = threading.Lock()
+        # the RowCounter of the last statement of each checked out connection
+        self.row_counters = set()
+        # collapsed SQL text by the statement string SQLAlchemy sent, at most MAX_RECORDED_STATEMENTS of them
+        self.statement_texts = {}
+        self.local = threading.local()
+        # functions(origin, call_site, seconds) told about every statement, for example by the UI profiler
+        self.statement_listeners = []
+
+    def get_entry(self, origin, call_site, statement):
+        """
+        returns the entry of a statement, creating it on first use
+        :param origin:
+        :param call_site:
+        :param statement:
+        :return:
+        """
+        text = self.statement_texts.get(statement)
+        if text is None:
+            text = collapse_statement(statement)
+            with self.lock:
+                if len(self.statement_texts) >= MAX_RECORDED_STATEMENTS:
+                    self.statement_texts.clear()
+                self.statement_texts[statement] = text
+        key = (origin, call_site, text)
+        entry = self.entries.get(key)
+        if entry is None:
+            with self.lock:
+                if key not in self.entries and len(self.entries) >= MAX_RECORDED_STATEMENTS:
+                    key = (origin, call_site, OTHER_STATEMENTS)
+                entry = self.entries.setdefault(key, QueryStatisticsEntry())
+        return entry
+
+    def start_counting_rows(self, connection, cursor, entry):
+        """
+        installs a RowCounter for the statement a cursor is about to run. The rows of the connection's previous
+        statement are recorded first
+        :param connection:
+        :param cursor:
+        :param entry:
+        :return:
+        """
+        counter = RowCounter(entry)
+        cursor.row_factory = counter.count_row
+        previous = connection.info.get('row_counter')
+        connection.info['row_counter'] = counter
+        with self.lock:
+            if previous is not None:
+                self.record_rows(previous)
+                self.row_counters.discard(previous)
+            self.row_counters.add(counter)
+
+    def stop_counting_rows(self, connection_info):
+        """
+        records the rows of the last statement of a connection returned to the pool
+        :param connection_info:
+        :return:
+        """
+        counter = connection_info.pop('row_counter', None)
+        if counter is not None:
+            with self.lock:
+                self.record_rows(counter)
+                self.row_counters.discard(counter)
+
+    @staticmethod
+    def record_rows(counter):
+        """
+        adds the rows a counter counted since it was last recorded to its entry. Called with the lock held
+        :param counter:
+        :return:
+        """
+        rows = counter.rows
+        counter.entry.rows += rows - counter.recorded
+        counter.recorded = rows
+
+    def record(self, entry, seconds, rows, statement, call_site, origin):
+        """
+        adds the timing of one call to an entry and logs it when it was slow
+        :param entry:
+        :param seconds:
+        :param rows: the rows changed, or 0 for statements that return rows (those are counted as they are fetched)
+        :param statement:
+        :param call_site:
+        :param origin:
+        :return:
+        """
+        bucket = 0
+        while seconds > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        slow = seconds >= self.slow_query_seconds
+        with self.lock:
+            entry.calls += 1
+            entry.total_seconds += seconds
+            entry.max_seconds = max(entry.max_seconds, seconds)
+            entry.rows += rows
+            entry.histogram[bucket] += 1
+            if slow:
+                entry.slow_calls += 1
+        if slow:
+            logger.warning("Slow query (%.1f ms) from %s in %s: %s", seconds * 1000, call_site, origin,
+                           self.statement_texts.get(statement, statement))
+        for listener in self.statement_listeners:
+            listener(origin, call_site, seconds)
+
+    def get_statistics(self):
+        """
+        returns a QueryStatistics per statement, slowest in total first
+        :return:
+        """
+        with self.lock:
+            for counter in self.row_counters:
+                self.record_rows(counter)
+            statistics = [QueryStatistics(origin, call_site, statement, entry.calls, entry.total_seconds,
+                                          entry.max_seconds, entry.rows, entry.slow_calls, list(entry.histogram))
+                          for (origin, call_site, statement), entry in self.entries.items()]
+        return sorted(statistics, key=lambda statistic: statistic.total_seconds, reverse=True)
+
+    def reset(self):
+        """
+        forgets every recorded statement
+        :return:
+        """
+        with self.lock:
+            self.entries.clear()
+            self.statement_texts.clear()
+            # counters of statements still being fetched add to entries that are no longer reported
+            self.row_counters.clear()
+
+
+query_recorder = QueryRecorder()
+
+
+def get_slow_query_seconds_from_environment():
+    """
+    returns the slow query threshold set in the SLOW_QUERY_ENV environment variable, or the default
+    :return:
+    """
+    value = os.environ.get(SLOW_QUERY_ENV)
+    if not value:
+        return DEFAULT_SLOW_QUERY_SECONDS
+    try:
+        return float(value) / 1000
+    except ValueError:
+        logger.warning("%s must be a number of milliseconds, not %r", SLOW_QUERY_ENV, value)
+        return DEFAULT_SLOW_QUERY_SECONDS
+
+
+query_recorder.slow_query_seconds = get_slow_query_seconds_from_environment()
+
+
+def set_slow_query_threshold(seconds):
+    """
+    sets how long a statement may take before it is logged as slow
+    :param seconds:
+    :return:
+    """
+    query_recorder.slow_query_seconds = seconds
+
+
+def add_statement_listener(listener):
+    """
+    calls listener(origin, call_site, seconds) after every statement recorded
+    :param listener:
+    :return:
+    """
+    query_recorder.statement_listeners.append(listener)
+
+
+def set_instrumentation_enabled(enabled):
+    """
+    turns the recording of statements on or off. Statements already recorded are kept
+    :param enabled:
+    :return:
+    """
+    query_recorder.enabled = enabled
+
+
+@contextmanager
+def query_origin(origin):
+    """
+    records the statements run by the current thread inside the block under the given origin, for example the
+    name of the screen a background task works for
+    :param origin:
+    :return:
+    """
+    local = query_recorder.local
+    previous = getattr(local, 'origin', None)
+    local.origin = origin
+    try:
+        yield
+    finally:
+        local.origin = previous
+
+
+def get_call_site():
+    """
+    returns (origin, call site) of the statement being run: the query_origin() of the thread or the screen class
+    on the call stack, and the persistence function that ran the statement
+    :return:
+    """
+    origin = getattr(query_recorder.local, 'origin', None)
+    call_site = private_call_site = None
+    frame = sys._getframe(2)
+    depth = 0
+    while frame is not None and depth < MAX_STACK_DEPTH and (call_site is None or origin is None):
+        module = frame.f_globals.get('__name__', '')
+        # co_name rather than co_qualname, which only exists from Python 3.11 on
+        name = frame.f_code.co_name
+        if call_site is None and module.startswith('database.') and module not in _PLUMBING_MODULES:
+            # private helpers are reported under the public function that called them
+            if name.startswith('_'):
+                private_call_site = private_call_site or f"{module[len('database.'):]}.{name}"
+            else:
+                call_site = f"{module[len('database.'):]}.{name}"
+        elif origin is None and module in ('ui', '__main__'):
+            # methods of the screens, named after the class of their self
+            instance = frame.f_locals.get('self')
+            if instance is not None:
+                origin = type(instance).__name__
+        frame = frame.f_back
+        depth += 1
+    return origin or UNKNOWN, call_site or private_call_site or UNKNOWN
+
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    """
+    Engine event handler. Notes the start time and the entry of the statement
+    :return:
+    """
+    if not query_recorder.enabled:
+        return
+    origin, call_site = get_call_site()
+    entry = query_recorder.get_entry(origin, call_site, statement)
+    query_recorder.start_counting_rows(connection, cursor, entry)
+    connection.info.setdefault('query_timings', []).append((time.perf_counter(), entry, origin, call_site))
+
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    """
+    Engine event handler. Records how long the statement took and the rows it changed
+    :return:
+    """
+    timings = connection.info.get('query_timings')
+    if not timings:
+        return
+    start, entry, origin, call_site = timings.pop()
+    seconds = time.perf_counter() - start
+    # rowcount is -1 for statements that return rows, their rows are counted as they are fetched
+    rows = max(cursor.rowcount, 0)
+    query_recorder.record(entry, seconds, rows, statement, call_site, origin)
+
+
+def handle_error(exception_context):
+    """
+    Engine event handler. Drops the start time of a statement that failed
+    :param exception_context:
+    :return:
+    """
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_timings'):
+        connection.info['query_timings'].pop()
+
+
+def record_fetched_rows(dbapi_connection, connection_record):
+    """
+    Pool checkin event handler. Records the rows fetched by the last statement of the connection returned
+    :param dbapi_connection:
+    :param connection_record: None when the connection was detached from the pool
+    :return:
+    """
+    if connection_record is not None:
+        query_recorder.stop_counting_rows(connection_record.info)
+
+
+def instrument_engine(engine):
+    """
+    hooks the statement timing into an engine
+    :param engine:
+    :return:
+    """
+    event.listen(engine, "checkin", record_fetched_rows)
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+def estimate_percentile(histogram, fraction):
+    """
+    returns the upper bound of the histogram bucket holding the given fraction of the calls
+    :param histogram: counts per LATENCY_BUCKETS bucket
+    :param fraction: for example 0.95 for the 95th percentile
+    :return: seconds, None when there are no calls
+    """
+    total = sum(histogram)
+    if total == 0:
+        return None
+    target = fraction * total
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS, histogram):
+        cumulative += count
+        if cumulative >= target:
+            return bound
+    return LATENCY_BUCKETS[-1]
+
+
+def get_query_statistics():
+    """
+    returns the statistics of every statement recorded, slowest in total first
+    :return: list of QueryStatistics
+    """
+    return query_recorder.get_statistics()
+
+
+def reset_query_statistics():
+    """
+    forgets every statement recorded
+    :return:
+    """
+    query_recorder.reset()
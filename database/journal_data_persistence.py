@@ -1,53 +1,149 @@
 """
  This script contains the functions related to journal data persistence
 """
-from sqlalchemy.orm import Session
+import json
+import re
+import unicodedata
+from collections import namedtuple
+from datetime import date as date_type
 
+from sqlalchemy import select, text
+from sqlalchemy.orm import undefer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.compression import CompressedText, compress_text, decompress_text
 from database.database import DBConnection, Journal
 
+# The fields of a journal listed without its entry body
+JournalSummary = namedtuple('JournalSummary', ['journal_date', 'journal_title', 'entry_length', 'entry_preview'])
+
+# The number of characters of the entry body included in a journal summary
+JOURNAL_PREVIEW_LENGTH = 60
+
+# The journal search index is a contentless FTS5 table: it holds only the index of the words, not a copy of each
+# title and entry, so compressing the entries shrinks the database. A row's rowid is the ordinal of its journal
+# date, so the index can be kept in sync by date and searched within a date range using the rowid. A contentless
+# row can only be removed by passing the exact title and entry it was indexed with, which are read back from the
+# journal table before the journal is changed. The matched words and snippets of search results are marked in
+# Python from the journal text.
+JOURNAL_SEARCH_TABLE = "journal_fts"
+
+# Title matches count for more than entry matches when the results are ranked
+JOURNAL_SEARCH_TITLE_WEIGHT = 10.0
+JOURNAL_SEARCH_ENTRY_WEIGHT = 1.0
+
+# The number of words around the matches in an entry that make up a search result snippet
+JOURNAL_SEARCH_SNIPPET_WORDS = 12
+
+# The words as the index's unicode61 tokenizer splits them: runs of letters and digits
+_SEARCH_TOKEN = re.compile(r"[^\W_]+")
+
+_CREATE_JOURNAL_SEARCH_TABLE = text(
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {JOURNAL_SEARCH_TABLE} "
+    "USING fts5(journal_title, journal_entry, content = '', tokenize = 'unicode61 remove_diacritics 2')")
+_INSERT_JOURNAL_SEARCH_ROW = text(
+    f"INSERT INTO {JOURNAL_SEARCH_TABLE} (rowid, journal_title, journal_entry) "
+    "VALUES (:search_rowid, :journal_title, :journal_entry)")
+_DELETE_JOURNAL_SEARCH_ROW = text(
+    f"INSERT INTO {JOURNAL_SEARCH_TABLE} ({JOURNAL_SEARCH_TABLE}, rowid, journal_title, journal_entry) "
+    "VALUES ('delete', :search_rowid, :journal_title, :journal_entry)")
+# the journals of a list of dates, passed as one JSON array so the statement text is the same for any number of dates
+_SELECT_JOURNALS_BY_DATES = text(
+    "SELECT journal_date, journal_title, journal_entry FROM journal "
+    "WHERE journal_date IN (SELECT value FROM json_each(:journal_dates))"
+).columns(Journal.journal_date, Journal.journal_title, Journal.journal_entry)
+
 
 def insert_journal_data(title, entry, date):
     """
         This function is used for inserting data into the journal table
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-
-    with Session(engine) as session:
+    with DBConnection().session_scope() as session:
         firstEntry = Journal(
             journal_title=title,
             journal_entry=entry,
             journal_date=date
         )
         session.add(firstEntry)
-        session.commit()
+        session.flush()
+        _insert_journal_search_rows(session, [{'journal_date': date, 'journal_title': title, 'journal_entry': entry}])
 
 
 def get_all_journal_data():
     """
         This function returns all the journal data stored
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    journalList = []
-    for journal in session.query(Journal):
-        journalList.append(journal)
-
-    return journalList
+    with DBConnection().read_session() as session:
+        return session.query(Journal).options(undefer(Journal.journal_entry)).all()
 
 
 def get_all_journal_data_between_dates(date1, date2):
     """
         This function returns all the journal data between two dates
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    journalList = []
-    for journal in session.query(Journal).filter(Journal.journal_date.between(date1, date2)):
-        journalList.append(journal)
-    return journalList
+    with DBConnection().read_session() as session:
+        return session.query(Journal).options(undefer(Journal.journal_entry)) \
+            .filter(Journal.journal_date.between(date1, date2)).all()
+
+
+def iter_journal_logs(chunk_size=1000):
+    """
+    This function yields every journal log as a row of column values in date order, reading chunk_size rows at a
+    time instead of loading the whole table
+    :param chunk_size:
+    :return:
+    """
+    statement = select(*Journal.__table__.columns).order_by(Journal.journal_date)
+    yield from DBConnection().stream_rows(statement, chunk_size)
+
+
+def get_journal_log_dates(before_date=None, limit=50):
+    """
+    This function returns up to limit journal log dates, newest first. Pass the last date of the previous page as
+    before_date to get the next page. The query walks the primary key index so a page costs the same no matter
+    how many logs there are.
+    :param before_date:
+    :param limit:
+    :return:
+    """
+    statement = select(Journal.journal_date).order_by(Journal.journal_date.desc()).limit(limit)
+    if before_date is not None:
+        statement = statement.where(Journal.journal_date < before_date)
+    with DBConnection().read_session() as session:
+        return session.scalars(statement).all()
+
+
+def get_journal_log_summaries(before_date=None, limit=50, preview_length=JOURNAL_PREVIEW_LENGTH):
+    """
+    This function returns a page of journal summaries, newest first. A summary holds the journal_date,
+    journal_title, entry_length and the first preview_length characters of the entry as entry_preview. The length
+    and preview of entries stored as plain text are taken in SQL, so only the entries stored compressed are read
+    whole and decompressed. Pass the last date of the previous page as before_date to get the next page.
+    :param before_date:
+    :param limit:
+    :param preview_length:
+    :return: list of JournalSummary
+    """
+    condition = "WHERE journal_date < :before_date " if before_date is not None else ""
+    statement = text(
+        "SELECT journal_date, journal_title, "
+        "CASE WHEN typeof(journal_entry) = 'text' THEN length(journal_entry) END, "
+        "CASE WHEN typeof(journal_entry) = 'text' THEN substr(journal_entry, 1, :preview_length) "
+        "ELSE journal_entry END "
+        f"FROM journal {condition}ORDER BY journal_date DESC LIMIT :limit"
+    ).columns(Journal.journal_date)
+    parameters = {'preview_length': preview_length, 'limit': limit}
+    if before_date is not None:
+        parameters['before_date'] = before_date.isoformat()
+    with DBConnection().read_session() as session:
+        rows = session.execute(statement, parameters).all()
+    summaries = []
+    for journal_date, title, entry_length, entry_preview in rows:
+        if entry_length is None:
+            entry = decompress_text(entry_preview)
+            entry_length, entry_preview = len(entry), entry[:preview_length]
+        summaries.append(JournalSummary(journal_date, title, entry_length, entry_preview))
+    return summaries
 
 
 def get_journal_log_by_date(date):
@@ -56,34 +152,300 @@ def get_journal_log_by_date(date):
     :param date:
     :return:
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    return session.query(Journal).filter(Journal.journal_date == date).first()
+    with DBConnection().read_session() as session:
+        return session.query(Journal).options(undefer(Journal.journal_entry)) \
+            .filter(Journal.journal_date == date).first()
 
 
 def update_journal_log(title, entry, date):
     """
         This function updates a journal log
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    session.query(Journal).filter(Journal.journal_date == date).update({
-        'journal_title': title,
-        'journal_entry': entry
-    })
-    session.commit()
-    for journal in session.query(Journal):
-        print(journal)
+    with DBConnection().session_scope() as session:
+        _unindex_journals(session, [date])
+        updated = session.query(Journal).filter(Journal.journal_date == date).update({
+            'journal_title': title,
+            'journal_entry': entry
+        })
+        if updated:
+            _insert_journal_search_rows(session, [{'journal_date': date, 'journal_title': title,
+                                                   'journal_entry': entry}])
+
+
+def upsert_journal_logs(rows):
+    """
+    This function writes a batch of journal logs in one transaction with a single executemany upsert. A row whose
+    journal_date already exists replaces the stored title and entry, and a date repeated later in the batch
+    replaces the earlier row.
+    :param rows: list of dictionaries keyed by the Journal column names
+    :return:
+    """
+    if not rows:
+        return
+    # the search index must get exactly one row per date, the one the upsert leaves stored
+    rows = list({row['journal_date']: row for row in rows}.values())
+    with DBConnection().session_scope() as session:
+        _unindex_journals(session, [row['journal_date'] for row in rows])
+        statement = sqlite_insert(Journal)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Journal.journal_date],
+            set_={'journal_title': statement.excluded.journal_title,
+                  'journal_entry': statement.excluded.journal_entry})
+        session.execute(statement, rows)
+        _insert_journal_search_rows(session, rows)
 
 
 def delete_journal_log(date):
     """
         This function deletes a journal log
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    session.query(Journal).filter(Journal.journal_date == date).delete()
-    session.commit()
+    with DBConnection().session_scope() as session:
+        _unindex_journals(session, [date])
+        session.query(Journal).filter(Journal.journal_date == date).delete()
+
+
+def create_journal_search_index():
+    """
+    This function creates the journal search index if it does not exist and fills it when it is missing journals,
+    for databases that had journals before the index existed
+    :return:
+    """
+    with DBConnection().session_scope() as session:
+        session.execute(_CREATE_JOURNAL_SEARCH_TABLE)
+        indexed = session.execute(text(f"SELECT count(*) FROM {JOURNAL_SEARCH_TABLE}")).scalar_one()
+        stored = session.query(Journal.journal_date).count()
+    if indexed != stored:
+        rebuild_journal_search_index()
+
+
+def recreate_journal_search_index():
+    """
+    This function drops the journal search index and creates and fills it again, for databases whose index was
+    created with a different layout. VACUUM is run afterwards so the space of the old index is given back
+    :return:
+    """
+    with DBConnection().session_scope() as session:
+        session.execute(text(f"DROP TABLE IF EXISTS {JOURNAL_SEARCH_TABLE}"))
+        session.execute(_CREATE_JOURNAL_SEARCH_TABLE)
+    rebuild_journal_search_index()
+    with DBConnection().get_sqlalchemy_engine().connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("VACUUM")
+
+
+def rebuild_journal_search_index(chunk_size=1000):
+    """
+    This function empties the journal search index and indexes every journal again
+    :param chunk_size: the number of journals read and indexed at a time
+    :return:
+    """
+    columns = [column.name for column in Journal.__table__.columns]
+    with DBConnection().session_scope() as session:
+        session.execute(text(f"INSERT INTO {JOURNAL_SEARCH_TABLE} ({JOURNAL_SEARCH_TABLE}) VALUES ('delete-all')"))
+        chunk = []
+        for row in iter_journal_logs(chunk_size):
+            chunk.append(dict(zip(columns, row)))
+            if len(chunk) == chunk_size:
+                _insert_journal_search_rows(session, chunk)
+                chunk = []
+        _insert_journal_search_rows(session, chunk)
+
+
+def search_journal_logs(query, date1=None, date2=None, limit=50, highlight=('[', ']')):
+    """
+    This function searches the journal titles and entries with the full text index. Every word of the query must
+    appear in a journal for it to match, and the last letters of a word may be left off, so "run" finds "running".
+    The index only returns the dates and ranks of the matches, the titles and snippets are built from the journals.
+    :param query: the words to search for
+    :param date1: optional first date of the range to search
+    :param date2: optional last date of the range to search
+    :param limit: the maximum number of results
+    :param highlight: the text placed before and after each matched word in the title and snippet
+    :return: list of dictionaries with journal_date, journal_title, snippet and rank, best match first
+    """
+    match = build_journal_search_query(query)
+    if match is None:
+        return []
+    conditions = [f"{JOURNAL_SEARCH_TABLE} MATCH :match"]
+    parameters = {'match': match, 'limit': limit,
+                  'title_weight': JOURNAL_SEARCH_TITLE_WEIGHT, 'entry_weight': JOURNAL_SEARCH_ENTRY_WEIGHT}
+    if date1 is not None:
+        conditions.append("rowid >= :first_rowid")
+        parameters['first_rowid'] = _get_search_rowid(date1)
+    if date2 is not None:
+        conditions.append("rowid <= :last_rowid")
+        parameters['last_rowid'] = _get_search_rowid(date2)
+    statement = text(
+        f"SELECT rowid, bm25({JOURNAL_SEARCH_TABLE}, :title_weight, :entry_weight) AS rank "
+        f"FROM {JOURNAL_SEARCH_TABLE} WHERE {' AND '.join(conditions)} ORDER BY rank LIMIT :limit")
+    with DBConnection().read_session() as session:
+        ranks = session.execute(statement, parameters).all()
+        journals = _get_journals_by_dates(session, [date_type.fromordinal(rowid) for rowid, _ in ranks])
+    prefixes = [_fold_search_word(word) for word in _SEARCH_TOKEN.findall(query)]
+    results = []
+    for rowid, rank in ranks:
+        journal_date = date_type.fromordinal(rowid)
+        if journal_date not in journals:
+            continue
+        title, entry = journals[journal_date]
+        results.append({'journal_date': journal_date,
+                        'journal_title': _mark_search_matches(title, prefixes, highlight),
+                        'snippet': _mark_search_matches(entry, prefixes, highlight, JOURNAL_SEARCH_SNIPPET_WORDS),
+                        'rank': rank})
+    return results
+
+
+def build_journal_search_query(query):
+    """
+    This function turns the text typed by the user into an FTS5 query. Each word is quoted, so characters with a
+    meaning in the FTS5 query syntax are searched for literally, and is matched as a prefix.
+    :param query:
+    :return: the FTS5 query, or None if the text has no words to search for
+    """
+    words = re.findall(r"\w+", query or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _get_search_rowid(journal_date):
+    """
+    returns the search index rowid of the journal for a date
+    :param journal_date:
+    :return:
+    """
+    return journal_date.toordinal()
+
+
+def _insert_journal_search_rows(session, rows):
+    """
+    adds journals to the search index with one executemany insert
+    :param session:
+    :param rows: list of dictionaries keyed by the Journal column names
+    :return:
+    """
+    if rows:
+        session.execute(_INSERT_JOURNAL_SEARCH_ROW,
+                        [{'search_rowid': _get_search_rowid(row['journal_date']),
+                          'journal_title': row['journal_title'],
+                          'journal_entry': row['journal_entry']} for row in rows])
+
+
+def _get_journals_by_dates(session, dates):
+    """
+    returns the titles and entries of the journals of the given dates
+    :param session:
+    :param dates:
+    :return: dictionary of (journal_title, journal_entry) by journal_date
+    """
+    if not dates:
+        return {}
+    rows = session.execute(_SELECT_JOURNALS_BY_DATES,
+                           {'journal_dates': json.dumps([journal_date.isoformat() for journal_date in dates])})
+    return {journal_date: (title, entry) for journal_date, title, entry in rows}
+
+
+def _unindex_journals(session, dates):
+    """
+    removes the journals of the given dates from the search index, within the session's transaction. It must run
+    before the journals are changed, as the index needs the title and entry each journal was indexed with
+    :param session:
+    :param dates:
+    :return:
+    """
+    journals = _get_journals_by_dates(session, dates)
+    if journals:
+        session.execute(_DELETE_JOURNAL_SEARCH_ROW,
+                        [{'search_rowid': _get_search_rowid(journal_date), 'journal_title': title,
+                          'journal_entry': entry} for journal_date, (title, entry) in journals.items()])
+
+
+def _fold_search_word(word):
+    """
+    returns a word in lower case without diacritics, the way the search index compares words
+    :param word:
+    :return:
+    """
+    if word.isascii():
+        return word.lower()
+    return "".join(character for character in unicodedata.normalize('NFKD', word.casefold())
+                   if not unicodedata.combining(character))
+
+
+def _mark_search_matches(value, prefixes, highlight, snippet_words=None):
+    """
+    returns text with the words starting with one of the search prefixes placed between the highlight marks. When
+    snippet_words is given only the snippet_words words around the most matches are returned, with '...' where
+    text was left out
+    :param value:
+    :param prefixes: the folded words of the search query
+    :param highlight: the text placed before and after each matched word
+    :param snippet_words:
+    :return:
+    """
+    words = list(_SEARCH_TOKEN.finditer(value))
+    if not words:
+        return value if snippet_words is None else ""
+    matched = [_fold_search_word(word.group()).startswith(tuple(prefixes)) for word in words]
+    first, last = 0, len(words)
+    if snippet_words is not None and len(words) > snippet_words:
+        # the window of snippet_words words holding the most matches, the first one on a tie
+        count = best = sum(matched[:snippet_words])
+        for start in range(1, len(words) - snippet_words + 1):
+            count += matched[start + snippet_words - 1] - matched[start - 1]
+            if count > best:
+                first, best = start, count
+        last = first + snippet_words
+    parts = ["..." if first > 0 else ""]
+    position = words[first].start() if snippet_words is not None else 0
+    for word, is_match in zip(words[first:last], matched[first:last]):
+        if is_match:
+            parts += [value[position:word.start()], highlight[0], word.group(), highlight[1]]
+            position = word.end()
+    end = words[last - 1].end() if snippet_words is not None else len(value)
+    parts += [value[position:end], "..." if last < len(words) else ""]
+    return "".join(parts)
+
+
+def compress_journal_entries(chunk_size=500, vacuum=True):
+    """
+    This function stores the entries of existing journals compressed. Entries written before compression was
+    enabled, or while it was switched off, stay plain text until they are written again, so run this once to
+    shrink an existing database. Entries that are short or do not get smaller are left as they are.
+    :param chunk_size: the number of journals read and rewritten at a time
+    :param vacuum: run VACUUM afterwards so the space freed is given back and the database file shrinks
+    :return: dictionary with the number of journals compressed and the entry bytes before and after
+    """
+    threshold = CompressedText.COMPRESSION_THRESHOLD
+    stats = {'compressed': 0, 'bytes_before': 0, 'bytes_after': 0}
+    if threshold is None:
+        return stats
+    # only plain text entries long enough to be compressed have to be read. The rows are read and written as
+    # stored, without going through the Journal column types
+    select_plain_entries = text(
+        "SELECT journal_date, journal_entry FROM journal "
+        "WHERE journal_date > :after_date AND typeof(journal_entry) = 'text' "
+        "AND length(CAST(journal_entry AS BLOB)) >= :threshold ORDER BY journal_date LIMIT :chunk_size")
+    rewrite_entry = text("UPDATE journal SET journal_entry = :journal_entry WHERE journal_date = :journal_date")
+    with DBConnection().session_scope() as session:
+        last_date = ''
+        while True:
+            # one chunk is read, compressed and written at a time, so memory use does not grow with the table
+            rows = session.execute(select_plain_entries, {'threshold': threshold, 'after_date': last_date,
+                                                          'chunk_size': chunk_size}).all()
+            if not rows:
+                break
+            last_date = rows[-1][0]
+            changes = []
+            for journal_date, entry in rows:
+                compressed = compress_text(entry, threshold)
+                if isinstance(compressed, bytes):
+                    stats['compressed'] += 1
+                    stats['bytes_before'] += len(entry.encode('utf-8'))
+                    stats['bytes_after'] += len(compressed)
+                    changes.append({'journal_date': journal_date, 'journal_entry': compressed})
+            if changes:
+                session.execute(rewrite_entry, changes)
+    if vacuum and stats['compressed']:
+        with DBConnection().get_sqlalchemy_engine().connect() as connection:
+            connection.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("VACUUM")
+    return stats
@@ -0,0 +1,126 @@
+"""
+This script file holds the schema migrations of the wellness database.
+
+Every change to the schema is a numbered migration step. The steps applied to a database are recorded in the
+schema_version table, so startup only has to read the current version and run the steps that are missing. Every
+step is safe to run again: a step interrupted part way, or a database created before the schema_version table
+existed, is brought up to date by running the step again without losing data.
+
+To add a table, index or other structure append a new step to MIGRATIONS with the next version number. Never
+change or reorder the steps that are already released.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database.database import DBConnection, Base
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_TABLE = "schema_version"
+
+
+def create_log_tables():
+    """
+    creates the finance, mindfulness and journal tables that are missing
+    :return:
+    """
+    tables = [Base.metadata.tables[name] for name in ("finance", "mindfulness", "journal")]
+    Base.metadata.create_all(DBConnection().get_sqlalchemy_engine(), tables=tables)
+
+
+def add_finance_rollup():
+    """
+    creates the finance rollup table and fills it from the finance logs
+    :return:
+    """
+    from database.finance_data_persistence import rebuild_finance_rollup
+    Base.metadata.create_all(DBConnection().get_sqlalchemy_engine(), tables=[Base.metadata.tables["finance_rollup"]])
+    rebuild_finance_rollup()
+
+
+def add_mood_rollup():
+    """
+    stores the mood codes upper case, then creates the mood rollup table and fills it from the mood logs
+    :return:
+    """
+    from database.mindfulness_data_persistence import normalize_stored_moods, rebuild_mood_rollup
+    Base.metadata.create_all(DBConnection().get_sqlalchemy_engine(), tables=[Base.metadata.tables["mood_rollup"]])
+    normalize_stored_moods()
+    rebuild_mood_rollup()
+
+
+def add_journal_search_index():
+    """
+    creates the journal full text search index and fills it from the journals
+    :return:
+    """
+    from database.journal_data_persistence import create_journal_search_index
+    create_journal_search_index()
+
+
+def make_journal_search_index_contentless():
+    """
+    rebuilds the journal search index without its copy of every title and entry
+    :return:
+    """
+    from database.journal_data_persistence import recreate_journal_search_index
+    recreate_journal_search_index()
+
+
+# (version, description, step) in the order they are applied
+MIGRATIONS = [
+    (1, "create the finance, mindfulness and journal tables", create_log_tables),
+    (2, "add the finance rollup table", add_finance_rollup),
+    (3, "normalize mood codes and add the mood rollup table", add_mood_rollup),
+    (4, "add the journal search index", add_journal_search_index),
+    (5, "make the journal search index contentless", make_journal_search_index_contentless),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version():
+    """
+    returns the version of the newest migration applied to the database, 0 for a new database or one created
+    before migrations were recorded
+    :return:
+    """
+    with DBConnection().get_sqlalchemy_engine().connect() as connection:
+        has_version_table = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SCHEMA_VERSION_TABLE}).first() is not None
+        if not has_version_table:
+            return 0
+        return connection.execute(text(f"SELECT max(version) FROM {SCHEMA_VERSION_TABLE}")).scalar() or 0
+
+
+def upgrade_database():
+    """
+    brings the database schema up to date, running the migration steps the database has not had yet. When the
+    schema is current this is a single query.
+    :return: the list of versions applied
+    """
+    current_version = get_schema_version()
+    if current_version >= LATEST_SCHEMA_VERSION:
+        return []
+
+    engine = DBConnection().get_sqlalchemy_engine()
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+                                "version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT NOT NULL)"))
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current_version:
+            continue
+        logger.info("applying schema migration %d: %s", version, description)
+        step()
+        # the step is recorded once it finished, so a step that failed part way runs again next time
+        with engine.begin() as connection:
+            connection.execute(text(f"INSERT OR REPLACE INTO {SCHEMA_VERSION_TABLE} "
+                                    "(version, description, applied_at) VALUES (:version, :description, :applied_at)"),
+                               {'version': version, 'description': description,
+                                'applied_at': datetime.now().isoformat(timespec='seconds')})
+        applied.append(version)
+    return applied
@@ -1,55 +1,84 @@
 """
     This script file contains the functions related to mindfulness data persistence
 """
-from sqlalchemy.orm import Session
+from collections import Counter
+from datetime import date, timedelta
 
-from database.database import DBConnection, Mindfulness
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.database import DBConnection, Mindfulness, MoodRollup
+
+# The calendar periods the mood rollup table is kept for
+MOOD_PERIOD_TYPES = ('week', 'month')
+
+
+def normalize_mood(user_mood):
+    """
+    This function returns the stored form of a mood: the mood code without surrounding spaces in upper case
+    :param user_mood:
+    :return:
+    """
+    return user_mood.strip().upper()
 
 
 def insert_mindfulness_data(user_mood, log_date):
     """
     This function is used for inserting data into the mindfulness table
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-
-    with Session(engine) as session:
+    with DBConnection().session_scope() as session:
         firstEntry = Mindfulness(
-            user_mood=user_mood,
+            user_mood=normalize_mood(user_mood),
             log_date=log_date
         )
 
         session.add(firstEntry)
-        session.commit()
+        # flush so a duplicate date fails before the rollup is touched
+        session.flush()
+        _apply_mood_rollup_delta(session, log_date, firstEntry.user_mood, 1)
 
 
 def get_all_mindfulness_data():
     """
         This function is used for getting all mindfulness data
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    mindfulnessList = []
-    for mindfulness in session.query(Mindfulness):
-        mindfulnessList.append(mindfulness)
-
-    return mindfulnessList
+    with DBConnection().read_session() as session:
+        return session.query(Mindfulness).all()
 
 
 def get_all_mindfulness_data_between_dates(date1, date2):
     """
         This function returns all mindfulness data between two dates
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
+    with DBConnection().read_session() as session:
+        return session.query(Mindfulness).filter(Mindfulness.log_date.between(date1, date2)).all()
 
-    mindfulnessList = []
-    for mindfulness in session.query(Mindfulness).filter(Mindfulness.log_date.between(date1, date2)):
-        mindfulnessList.append(mindfulness)
 
-    return mindfulnessList
+def iter_mindfulness_logs(chunk_size=1000):
+    """
+    This function yields every mindfulness log as a row of column values in date order, reading chunk_size rows at a
+    time instead of loading the whole table
+    :param chunk_size:
+    :return:
+    """
+    statement = select(*Mindfulness.__table__.columns).order_by(Mindfulness.log_date)
+    yield from DBConnection().stream_rows(statement, chunk_size)
+
+
+def get_mindfulness_log_dates(before_date=None, limit=50):
+    """
+    This function returns up to limit mindfulness log dates, newest first. Pass the last date of the previous page as
+    before_date to get the next page. The query walks the primary key index so a page costs the same no matter
+    how many logs there are.
+    :param before_date:
+    :param limit:
+    :return:
+    """
+    statement = select(Mindfulness.log_date).order_by(Mindfulness.log_date.desc()).limit(limit)
+    if before_date is not None:
+        statement = statement.where(Mindfulness.log_date < before_date)
+    with DBConnection().read_session() as session:
+        return session.scalars(statement).all()
 
 
 def get_mindfulness_log_by_date(date):
@@ -58,29 +87,281 @@ def get_mindfulness_log_by_date(date):
     :param date:
     :return:
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    return session.query(Mindfulness).filter(Mindfulness.log_date == date).first()
+    with DBConnection().read_session() as session:
+        return session.query(Mindfulness).filter(Mindfulness.log_date == date).first()
+
+
+def get_mood_rows(date1=None, date2=None):
+    """
+    This function returns (log_date, user_mood) tuples in date order, without building Mindfulness objects. When
+    both dates are given only the logs between them are returned.
+    :param date1:
+    :param date2:
+    :return:
+    """
+    statement = select(Mindfulness.log_date, Mindfulness.user_mood).order_by(Mindfulness.log_date)
+    if date1 is not None and date2 is not None:
+        statement = statement.where(Mindfulness.log_date.between(date1, date2))
+    with DBConnection().read_session() as session:
+        return [tuple(row) for row in session.execute(statement)]
+
+
+def get_mindfulness_log_date_range():
+    """
+    This function returns the dates of the first and last mindfulness logs, (None, None) when there are none
+    :return:
+    """
+    with DBConnection().read_session() as session:
+        return tuple(session.execute(select(func.min(Mindfulness.log_date), func.max(Mindfulness.log_date))).one())
+
+
+def get_mood_counts_by_day(date1, date2):
+    """
+    This function returns the mood counts of every day between two dates that has logs as a list of
+    (date, dictionary of mood code to count) tuples in date order
+    :param date1:
+    :param date2:
+    :return:
+    """
+    statement = (select(Mindfulness.log_date, Mindfulness.user_mood, func.count())
+                 .where(Mindfulness.log_date.between(date1, date2))
+                 .group_by(Mindfulness.log_date, Mindfulness.user_mood)
+                 .order_by(Mindfulness.log_date))
+    series = {}
+    with DBConnection().read_session() as session:
+        for log_date, user_mood, mood_count in session.execute(statement):
+            series.setdefault(log_date, {})[user_mood] = mood_count
+    return list(series.items())
+
+
+def get_mood_counts(date1=None, date2=None):
+    """
+    This function counts the logged moods inside the database with a single GROUP BY query and returns a
+    dictionary of mood code to count. When both dates are given only the logs between them are counted.
+    :param date1:
+    :param date2:
+    :return:
+    """
+    statement = select(Mindfulness.user_mood, func.count()).group_by(Mindfulness.user_mood)
+    if date1 is not None and date2 is not None:
+        statement = statement.where(Mindfulness.log_date.between(date1, date2))
+    with DBConnection().read_session() as session:
+        return {user_mood: count for user_mood, count in session.execute(statement)}
+
+
+def normalize_stored_moods():
+    """
+    This function rewrites moods stored before mood codes were normalized so they group together
+    :return:
+    """
+    normalized_mood = func.upper(func.trim(Mindfulness.user_mood))
+    with DBConnection().session_scope() as session:
+        result = session.execute(update(Mindfulness)
+                                 .where(Mindfulness.user_mood != normalized_mood)
+                                 .values(user_mood=normalized_mood))
+        if result.rowcount:
+            _rebuild_mood_rollup(session)
 
 
 def update_mindfulness_log(mood, log_date):
     """
         This function updates the mindfulness log
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    session.query(Mindfulness).filter(Mindfulness.log_date == log_date).update({'user_mood': mood})
-    session.commit()
+    with DBConnection().session_scope() as session:
+        mindfulness = session.get(Mindfulness, log_date)
+        if mindfulness is None:
+            return
+        old_mood = mindfulness.user_mood
+        mindfulness.user_mood = normalize_mood(mood)
+        if old_mood != mindfulness.user_mood:
+            _apply_mood_rollup_delta(session, log_date, old_mood, -1)
+            _apply_mood_rollup_delta(session, log_date, mindfulness.user_mood, 1)
 
 
 def delete_mindfulness_log(date):
     """
         This function deletes the mindfulness log
     """
-    conn = DBConnection()
-    engine = conn.get_sqlalchemy_engine()
-    session = Session(engine)
-    session.query(Mindfulness).filter(Mindfulness.log_date == date).delete()
-    session.commit()
+    with DBConnection().session_scope() as session:
+        mindfulness = session.get(Mindfulness, date)
+        if mindfulness is None:
+            return
+        session.delete(mindfulness)
+        _apply_mood_rollup_delta(session, date, mindfulness.user_mood, -1)
+
+
+def upsert_mindfulness_logs(rows):
+    """
+    This function writes a batch of mindfulness logs in one transaction with a single executemany upsert. A row
+    whose log_date already exists replaces the stored mood. The mood rollup table is updated once per period and
+    mood touched by the batch rather than once per row.
+    :param rows: list of dictionaries keyed by the Mindfulness column names
+    :return:
+    """
+    if not rows:
+        return
+    rows = [dict(row, user_mood=normalize_mood(row['user_mood'])) for row in rows]
+    with DBConnection().session_scope() as session:
+        dates = {row['log_date'] for row in rows}
+        stored_moods = dict(session.execute(select(Mindfulness.log_date, Mindfulness.user_mood)
+                                            .where(Mindfulness.log_date.in_(dates))).all())
+
+        statement = sqlite_insert(Mindfulness)
+        statement = statement.on_conflict_do_update(index_elements=[Mindfulness.log_date],
+                                                    set_={'user_mood': statement.excluded.user_mood})
+        session.execute(statement, rows)
+
+        # add up what the batch changed per rollup period and mood
+        period_deltas = Counter()
+        for row in rows:
+            old_mood = stored_moods.get(row['log_date'])
+            if old_mood == row['user_mood']:
+                continue
+            for period_type in MOOD_PERIOD_TYPES:
+                period_key = get_mood_period_key(period_type, row['log_date'])
+                period_deltas[(period_type, period_key, row['user_mood'])] += 1
+                if old_mood is not None:
+                    period_deltas[(period_type, period_key, old_mood)] -= 1
+            # a date repeated later in the batch replaces this row
+            stored_moods[row['log_date']] = row['user_mood']
+        changed_periods = [{'period_type': period_type, 'period_key': period_key, 'user_mood': user_mood,
+                            'mood_count': count_delta}
+                           for (period_type, period_key, user_mood), count_delta in period_deltas.items()
+                           if count_delta != 0]
+        if changed_periods:
+            _apply_mood_period_deltas(session, changed_periods)
+
+
+def get_mood_period_key(period_type, log_date):
+    """
+    This function returns the rollup period key a date belongs to. Weeks are ISO weeks keyed 'YYYY-Www',
+    months are keyed 'YYYY-MM'. Keys of the same period type sort in calendar order.
+    :param period_type: 'week' or 'month'
+    :param log_date:
+    :return:
+    """
+    if period_type == 'week':
+        iso_year, iso_week, _ = log_date.isocalendar()
+        return f"{iso_year}-W{iso_week:02d}"
+    if period_type == 'month':
+        return log_date.strftime('%Y-%m')
+    raise ValueError(f"period_type must be one of {', '.join(MOOD_PERIOD_TYPES)}")
+
+
+def get_mood_period_start(period_type, period_key):
+    """
+    This function returns the first day of a rollup period
+    :param period_type: 'week' or 'month'
+    :param period_key:
+    :return:
+    """
+    year, part = period_key.split('-')
+    if period_type == 'week':
+        return date.fromisocalendar(int(year), int(part.lstrip('W')), 1)
+    if period_type == 'month':
+        return date(int(year), int(part), 1)
+    raise ValueError(f"period_type must be one of {', '.join(MOOD_PERIOD_TYPES)}")
+
+
+def shift_mood_period_key(period_type, period_key, offset):
+    """
+    This function returns the key of the period offset periods before (negative) or after (positive) a period
+    :param period_type: 'week' or 'month'
+    :param period_key:
+    :param offset:
+    :return:
+    """
+    start = get_mood_period_start(period_type, period_key)
+    if period_type == 'week':
+        return get_mood_period_key(period_type, start + timedelta(weeks=offset))
+    month_index = start.year * 12 + start.month - 1 + offset
+    return get_mood_period_key(period_type, date(month_index // 12, month_index % 12 + 1, 1))
+
+
+def get_mood_rollup_series(period_type, date1, date2):
+    """
+    This function returns the mood counts of every week or month between two dates as a list of
+    (period key, dictionary of mood code to count) tuples in calendar order. Periods without logs are included
+    with an empty dictionary. The counts come from the rollup table, so the cost depends on the number of
+    periods rather than the number of logs.
+    :param period_type: 'week' or 'month'
+    :param date1:
+    :param date2:
+    :return:
+    """
+    first_key = get_mood_period_key(period_type, date1)
+    last_key = get_mood_period_key(period_type, date2)
+    series = {}
+    period_key = first_key
+    while period_key <= last_key:
+        series[period_key] = {}
+        period_key = shift_mood_period_key(period_type, period_key, 1)
+
+    statement = (select(MoodRollup.period_key, MoodRollup.user_mood, MoodRollup.mood_count)
+                 .where(MoodRollup.period_type == period_type,
+                        MoodRollup.period_key.between(first_key, last_key)))
+    with DBConnection().read_session() as session:
+        for period_key, user_mood, mood_count in session.execute(statement):
+            series[period_key][user_mood] = mood_count
+    return list(series.items())
+
+
+def get_mood_rollup_counts(period_type, period_key):
+    """
+    This function returns the dictionary of mood code to count for a single week or month
+    :param period_type: 'week' or 'month'
+    :param period_key:
+    :return:
+    """
+    statement = (select(MoodRollup.user_mood, MoodRollup.mood_count)
+                 .where(MoodRollup.period_type == period_type, MoodRollup.period_key == period_key))
+    with DBConnection().read_session() as session:
+        return {user_mood: mood_count for user_mood, mood_count in session.execute(statement)}
+
+
+def rebuild_mood_rollup():
+    """
+    This function recalculates every mood rollup row from the mindfulness table. It is used to fill the rollup
+    table for databases created before the rollup table existed.
+    :return:
+    """
+    with DBConnection().session_scope() as session:
+        _rebuild_mood_rollup(session)
+
+
+def _rebuild_mood_rollup(session):
+    # ISO weeks cannot be computed by SQLite's strftime, so the periods are counted in python
+    counts = Counter()
+    for log_date, user_mood in session.execute(select(Mindfulness.log_date, Mindfulness.user_mood)):
+        for period_type in MOOD_PERIOD_TYPES:
+            counts[(period_type, get_mood_period_key(period_type, log_date), user_mood)] += 1
+    session.execute(delete(MoodRollup))
+    if counts:
+        session.execute(sqlite_insert(MoodRollup), [
+            {'period_type': period_type, 'period_key': period_key, 'user_mood': user_mood, 'mood_count': count}
+            for (period_type, period_key, user_mood), count in counts.items()])
+
+
+def _apply_mood_rollup_delta(session, log_date, user_mood, count_delta):
+    """
+    Adds count_delta to the mood's count in every period the log date belongs to. The addition happens inside
+    the database with an upsert so concurrent writers cannot lose an update.
+    """
+    _apply_mood_period_deltas(session, [
+        {'period_type': period_type, 'period_key': get_mood_period_key(period_type, log_date),
+         'user_mood': user_mood, 'mood_count': count_delta}
+        for period_type in MOOD_PERIOD_TYPES])
+
+
+def _apply_mood_period_deltas(session, period_deltas):
+    """
+    Adds each delta row (period_type, period_key, user_mood and mood_count) to its rollup row with a single
+    executemany upsert
+    """
+    statement = sqlite_insert(MoodRollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=[MoodRollup.period_type, MoodRollup.period_key, MoodRollup.user_mood],
+        set_={'mood_count': MoodRollup.mood_count + statement.excluded.mood_count})
+    session.execute(statement, period_deltas)
+    if any(period_delta['mood_count'] < 0 for period_delta in period_deltas):
+        session.execute(delete(MoodRollup).where(MoodRollup.mood_count <= 0))
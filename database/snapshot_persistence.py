@@ -0,0 +1,53 @@
+"""
+ This script contains the functions that read the finance, mood and journal logs of the same days together
+"""
+from collections import namedtuple
+
+from sqlalchemy import select, union
+
+from database.database import DBConnection, Finance, Journal, Mindfulness
+from database.finance_data_persistence import FINANCE_AMOUNT_COLUMNS
+
+# One day across the three logs. finance is a dictionary of the finance amounts, or None when no finance log was
+# made that day. user_mood and journal_title are None when the day has no mood log or journal.
+DailySnapshot = namedtuple('DailySnapshot', ['snapshot_date', 'finance', 'user_mood', 'journal_title'])
+
+
+def get_daily_snapshots(date1, date2):
+    """
+    This function returns the finance log, mood and journal title of every day between two dates that has at least
+    one of them, oldest first. The days of the three tables are combined with a UNION and each table is joined to
+    them once, so the whole range is read in a single query. The journal bodies are not read.
+    :param date1:
+    :param date2:
+    :return: list of DailySnapshot
+    """
+    days = union(
+        select(Finance.log_date.label('snapshot_date')).where(Finance.log_date.between(date1, date2)),
+        select(Mindfulness.log_date).where(Mindfulness.log_date.between(date1, date2)),
+        select(Journal.journal_date).where(Journal.journal_date.between(date1, date2)),
+    ).subquery('days')
+    statement = select(days.c.snapshot_date, Finance.log_date,
+                       *[getattr(Finance, column) for column in FINANCE_AMOUNT_COLUMNS],
+                       Mindfulness.user_mood, Journal.journal_title) \
+        .select_from(days) \
+        .outerjoin(Finance, Finance.log_date == days.c.snapshot_date) \
+        .outerjoin(Mindfulness, Mindfulness.log_date == days.c.snapshot_date) \
+        .outerjoin(Journal, Journal.journal_date == days.c.snapshot_date) \
+        .order_by(days.c.snapshot_date)
+    with DBConnection().read_session() as session:
+        rows = session.execute(statement).all()
+    return [DailySnapshot(snapshot_date,
+                          dict(zip(FINANCE_AMOUNT_COLUMNS, amounts)) if finance_date is not None else None,
+                          user_mood, journal_title)
+            for snapshot_date, finance_date, *amounts, user_mood, journal_title in rows]
+
+
+def get_daily_snapshot(date):
+    """
+    This function returns the finance log, mood and journal title of one day
+    :param date:
+    :return: DailySnapshot, or None if nothing was logged that day
+    """
+    snapshots = get_daily_snapshots(date, date)
+    return snapshots[0] if snapshots else None
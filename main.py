@@ -2,15 +2,24 @@
     This is the main file of the application. This is the file to be run to run the application
     In the command line, navigate to the directory where this file is housed.
     From the command line run python main.py
+    Set the WELLNESS_STARTUP_REPORT environment variable to print how long startup took
+    Set the WELLNESS_SLOW_QUERY_MS environment variable to change when a database query is logged as slow
+    Set the WELLNESS_PROFILE environment variable to time the screens, see wellness_service/profiling.py
 
 """
+import time
+
+# taken before the other imports so the startup report includes the time spent importing
+STARTUP_TIME = time.perf_counter()
+
 # initialize database
-from database.database import create_all_tables
+from database.migrations import upgrade_database
 from ui import WellnessApp
 
 if __name__ == '__main__':
 
-    #create_all_tables()
-    create_all_tables()
-    app = WellnessApp()
-    app.mainloop()
\ No newline at end of file
+    startup_phases = [("modules imported", time.perf_counter() - STARTUP_TIME)]
+    upgrade_database()
+    startup_phases.append(("database ready", time.perf_counter() - STARTUP_TIME))
+    app = WellnessApp(startup_time=STARTUP_TIME, startup_phases=startup_phases)
+    app.mainloop()
@@ -2,26 +2,53 @@
     This script file contains the GUI logic for the application. The application uses Tkinter to handle the GUI
     and matplotlib to display a pie chart of the user's data.
 """
+import difflib
+import os
 import random
 import re
+import time
 import tkinter as tk
 import tkinter.messagebox
 from datetime import datetime
 from tkinter import messagebox
 from tkinter import ttk
 
-import matplotlib.pyplot as plt
 import sqlalchemy.exc
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
+from database.database import DBConnection
 from database.enumerations import Mood
-from wellness_service.financial_wellness import insert_financial_wellness_data, get_all_financial_wellness_data, \
+from database.instrumentation import get_query_statistics, reset_query_statistics, estimate_percentile, \
+    set_slow_query_threshold, query_recorder, LATENCY_BUCKETS
+from wellness_service.background_worker import BackgroundWorker
+from wellness_service.dashboard import get_days_overview, get_month_range, step_month, get_total_expense
+from wellness_service.data_events import subscribe, ExternalChangeWatcher, FINANCE, MINDFULNESS, JOURNAL
+from wellness_service.financial_wellness import insert_financial_wellness_data, get_financial_wellness_dates, \
     get_financial_wellness_data, update_financial_wellness_data
-from wellness_service.journal import get_journal_logs, insert_journal_log, update_journal, get_journal_by_date
-from wellness_service.mindfulness import insert_mindfulness_log, get_mindfulness_data_history, get_mindfulness_data, \
-    update_mindfulness_data
-from wellness_service.wellness_visual import show_financial_wellness_pie_chart, show_mood_wellness_pie_chart, \
-    show_mood_wellness_pie_chart_date_filter, show_financial_wellness_by_date
+from wellness_service.journal import get_journal_summaries, insert_journal_log, update_journal, get_journal_by_date, \
+    search_journals
+from wellness_service.profiling import profiler, get_profile_output_path
+from wellness_service.mindfulness import insert_mindfulness_log, get_mindfulness_dates, get_mindfulness_data, \
+    update_mindfulness_data, get_mood_period, step_mood_period, get_mood_period_start_date
+from wellness_service.wellness_visual import draw_chart, prepare_financial_wellness_pie_chart, \
+    prepare_mood_wellness_pie_chart, prepare_mood_wellness_pie_chart_by_period, prepare_financial_trend_chart, \
+    prepare_mood_trend_chart
+
+# How often the GUI thread collects results from the background worker
+WORKER_POLL_INTERVAL_MS = 50
+
+# How often the database statistics used by the query planner are refreshed while the application is open
+OPTIMIZE_INTERVAL_MS = 60 * 60 * 1000
+
+# How often the GUI thread checks for logs written by other processes, such as the API server or the command line
+EXTERNAL_CHANGE_INTERVAL_MS = 2000
+
+# Set this environment variable to print how long each startup step took once the first window is shown
+STARTUP_REPORT_ENV = "WELLNESS_STARTUP_REPORT"
+
+# Characters marking the matched words in journal search results. They cannot be typed into a journal, so the
+# results screen can find them and replace them with highlighting
+SEARCH_MATCH_START = "\x02"
+SEARCH_MATCH_END = "\x03"
 
 # Wellness Quotes to be used by the Mindfulness page
 WELLNESS_QUOTES = [
@@ -40,45 +67,140 @@ class WellnessApp(tk.Tk):
         assists with the transitioning of frames
     """
 
-    def __init__(self):
+    def __init__(self, startup_time=None, startup_phases=None):
+        """
+        :param startup_time: the time.perf_counter() value the application started at, used by the startup report
+        :param startup_phases: (phase, seconds since startup_time) tuples recorded before the window was created
+        """
         super().__init__()
+        self.startup_time = startup_time if startup_time is not None else time.perf_counter()
+        self.startup_phases = list(startup_phases or [])
+        self.frame_build_times = {}
+        self.record_startup_phase("window created")
 
         self.title("Wellness Services")
         self.geometry("950x650")
 
-        container = ttk.Frame(self)
+        # Database queries and chart aggregation run on the worker so the window stays responsive
+        self.worker = BackgroundWorker()
+        self.current_frame_name = None
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(WORKER_POLL_INTERVAL_MS, self.poll_worker)
+        self.after(OPTIMIZE_INTERVAL_MS, self.optimize_database)
+        self.change_watcher = ExternalChangeWatcher(DBConnection().get_database_path())
+        self.after(EXTERNAL_CHANGE_INTERVAL_MS, self.check_external_changes)
+
+        self.container = ttk.Frame(self)
         # the fill option tells the manager that the widget should fill the whole space
         # Both means that the widget expands vertically and horizontally
         # Expand tells the manager to assign additional space to the widget box.
-        container.pack(fill="both", expand=True)
+        self.container.pack(fill="both", expand=True)
 
-        # Add all the frames to the frames dictionary. This helps to navigate between frames
+        # The frames dictionary helps to navigate between frames. A frame is only built the first time it is
+        # needed, so starting the application only pays for the Welcome Screen
         self.frames = {}
-        for F in (WelcomeScreen, FinancialScreen, DisplayFinancesScreen, UpdateFinancesScreen, MindfulScreen,
-                  DisplayMindfulnessScreen, UpdateMindfulnessScreen, JournalScreen, DisplayJournalsScreen,
-                  UpdateJournalScreen):
-            page_name = F.__name__
-            # The parent is the parent of the frame (the main window) and controller acts as a common point
-            # of interaction
-            frame = F(parent=container, controller=self)
-            self.frames[page_name] = frame
-            frame.grid(row=0, column=0, sticky="nsew")
+        self.frame_classes = {F.__name__: F for F in (WelcomeScreen, FinancialScreen, DisplayFinancesScreen,
+                                                      UpdateFinancesScreen, MindfulScreen, DisplayMindfulnessScreen,
+                                                      UpdateMindfulnessScreen, JournalScreen, DisplayJournalsScreen,
+                                                      UpdateJournalScreen, DashboardScreen, DiagnosticsScreen)}
 
         # When the application starts show the Welcome Screen
         self.show_frame("WelcomeScreen")
+        self.record_startup_phase("welcome screen built")
+        self.after_idle(self.finish_startup)
 
     def show_frame(self, page_name):
         """
             show_frame() uses the tkraise() function to raise the given page making it viewable
+            Work still pending for the page being left is cancelled
+        """
+        if self.current_frame_name is not None and self.current_frame_name != page_name:
+            self.worker.cancel(self.current_frame_name)
+        self.current_frame_name = page_name
+        with profiler.measure("show_frame", page_name):
+            frame = self.get_frame(page_name)
+            with profiler.measure("tkraise"):
+                frame.tkraise()
+
+    def poll_worker(self):
+        """
+            poll_worker() hands finished background work back to the screens that asked for it
+        """
+        self.after(WORKER_POLL_INTERVAL_MS, self.poll_worker)
+        self.worker.poll()
+
+    def optimize_database(self):
+        """
+            optimize_database() refreshes the query planner statistics on the background worker and schedules the
+            next refresh
+        """
+        self.worker.submit("optimize", DBConnection().optimize, lambda result: None)
+        self.after(OPTIMIZE_INTERVAL_MS, self.optimize_database)
+
+    def check_external_changes(self):
+        """
+            check_external_changes() marks every screen stale when another process wrote to the database, and
+            raises the current screen again so it shows the new logs
         """
-        frame = self.frames[page_name]
-        frame.tkraise()
+        self.after(EXTERNAL_CHANGE_INTERVAL_MS, self.check_external_changes)
+        if self.change_watcher.check() and self.current_frame_name is not None:
+            self.frames[self.current_frame_name].tkraise()
+
+    def on_close(self):
+        """
+            on_close() stops the background worker and refreshes the query planner statistics before the window
+            is destroyed. When the profiler is on its timings are written to a file
+        """
+        try:
+            self.worker.shutdown()
+            self.change_watcher.close()
+            DBConnection().optimize()
+            if profiler.enabled:
+                profiler.write_report(get_profile_output_path())
+        finally:
+            # the window closes even when the statistics or the timings could not be written
+            self.destroy()
 
     def get_frame(self, page_name):
         """
              get_frame() returns the frame name for the update screens
+             The frame is built the first time it is asked for
         """
-        return self.frames[page_name]
+        frame = self.frames.get(page_name)
+        if frame is None:
+            build_start = time.perf_counter()
+            # The parent is the parent of the frame (the main window) and controller acts as a common point
+            # of interaction
+            with profiler.measure("build", page_name):
+                frame = self.frame_classes[page_name](parent=self.container, controller=self)
+            self.frames[page_name] = frame
+            frame.grid(row=0, column=0, sticky="nsew")
+            self.frame_build_times[page_name] = time.perf_counter() - build_start
+        return frame
+
+    def record_startup_phase(self, phase):
+        """
+            record_startup_phase() notes how long after startup a phase finished
+        """
+        self.startup_phases.append((phase, time.perf_counter() - self.startup_time))
+
+    def finish_startup(self):
+        """
+            finish_startup() runs once the first window has been drawn and prints the startup report if it was asked for
+        """
+        self.record_startup_phase("first window shown")
+        if os.environ.get(STARTUP_REPORT_ENV):
+            print(self.get_startup_report())
+
+    def get_startup_report(self):
+        """
+            get_startup_report() returns the startup timings and the time spent building each frame as text
+        """
+        lines = ["Startup timing (ms since start):"]
+        lines += [f"  {seconds * 1000:9.1f}  {phase}" for phase, seconds in self.startup_phases]
+        lines.append("Frame build time (ms):")
+        lines += [f"  {seconds * 1000:9.1f}  {page_name}" for page_name, seconds in self.frame_build_times.items()]
+        return "\n".join(lines)
 
 
 def validate_date_for_create(date_str):
@@ -121,6 +243,219 @@ def validate_date_filter(date_str):
         return False
 
 
+def create_chart_canvas(parent):
+    """
+    This function creates the matplotlib figure and the Tk canvas it is drawn on.
+    matplotlib is imported here rather than at the top of the file so it is only loaded when the first screen with
+    a chart is opened
+    :param parent:
+    :return:
+    """
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(5, 4), dpi=100)
+    return figure, FigureCanvasTkAgg(figure, parent)
+
+
+def get_chart_width(canvas):
+    """
+    This function returns the width in pixels of the canvas a chart is drawn on, used to pick how many points a
+    trend chart draws
+    :param canvas:
+    :return:
+    """
+    width = canvas.get_tk_widget().winfo_width()
+    # the canvas has no size until it is first shown
+    return width if width > 1 else int(canvas.figure.get_figwidth() * canvas.figure.get_dpi())
+
+
+def get_trend_dates(start_date_entry, end_date_entry):
+    """
+    This function returns the range typed into a pair of date entries for a trend chart. When the entries do not
+    hold a range the trend covers every log
+    :param start_date_entry:
+    :param end_date_entry:
+    :return: (start date, end date), or (None, None) for every log
+    """
+    try:
+        start_date = datetime.strptime(start_date_entry.get(), "%Y-%m-%d").date()
+        end_date = datetime.strptime(end_date_entry.get(), "%Y-%m-%d").date()
+    except ValueError:
+        return None, None
+    if start_date >= end_date:
+        return None, None
+    return start_date, end_date
+
+
+class HistoryList(ttk.Frame):
+    """
+        HistoryList is the scrolling list of log dates shared by the Log History screens.
+        Only the first pages are loaded up front. The next page is fetched with a keyset query when the user
+        scrolls close to the bottom. The widgets are created once and refresh() only rewrites the rows that
+        changed since the last time the list was shown. When a table is given the list subscribes to its change
+        notifications and refresh_if_stale() skips the query entirely when nothing was written.
+    """
+    PAGE_SIZE = 50
+    # load the next page once the bottom of the view is past this fraction of the loaded rows
+    PREFETCH_THRESHOLD = 0.8
+
+    def __init__(self, parent, fetch_page, on_select, format_item=str, get_key=lambda item: item, table=None,
+                 worker=None, channel=None):
+        """
+        :param parent:
+        :param fetch_page: function(before_key, limit) returning the next items, newest first
+        :param on_select: function(item) called when the user clicks on a row
+        :param format_item: function(item) returning the text shown for a row
+        :param get_key: function(item) returning the key passed to fetch_page for the following page
+        :param table: the table whose changes make the list stale
+        :param worker: the BackgroundWorker used to fetch pages. Pages are fetched on the GUI thread without one
+        :param channel: the worker channel of the requests, usually the name of the screen holding the list
+        """
+        super().__init__(parent)
+        self.worker = worker
+        self.channel = channel
+        self.fetch_page = fetch_page
+        self.on_select = on_select
+        self.format_item = format_item
+        self.get_key = get_key
+        self.items = []
+        # nothing is fetched until the first refresh()
+        self.exhausted = True
+        self.load_pending = False
+        self.stale = True
+        if table is not None:
+            subscribe(table, self.mark_stale)
+
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL)
+        self.listbox = tk.Listbox(self, yscrollcommand=self.on_scroll)
+        self.scrollbar.config(command=self.listbox.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.pack(side=tk.LEFT, fill="both", expand=True)
+        self.listbox.bind("<<ListboxSelect>>", self.on_listbox_select)
+
+    def mark_stale(self, table, version):
+        """
+        Change notification callback. Only records that the list must be refreshed the next time it is shown
+        :param table:
+        :param version:
+        :return:
+        """
+        self.stale = True
+
+    def refresh_if_stale(self):
+        """
+        Refreshes the list only when its table changed since the last refresh
+        :return:
+        """
+        if self.stale:
+            self.refresh()
+
+    def refresh(self):
+        """
+        Re-fetches the rows that are currently loaded (at least one page plus a prefetched page) and updates
+        only the listbox rows that differ
+        :return:
+        """
+        self.stale = False
+        limit = max(len(self.items), self.PAGE_SIZE * 2)
+        self.run(lambda: list(self.fetch_page(None, limit)),
+                 lambda items: self.on_page_loaded(items, limit, replace=True))
+
+    def load_more(self):
+        """
+        Appends the next page of rows to the list
+        :return:
+        """
+        if self.exhausted or self.is_fetching():
+            self.load_pending = False
+            return
+        before_key = self.get_key(self.items[-1]) if self.items else None
+        self.run(lambda: list(self.fetch_page(before_key, self.PAGE_SIZE)),
+                 lambda items: self.on_page_loaded(items, self.PAGE_SIZE, replace=False))
+
+    def run(self, task, on_done):
+        """
+        Runs a page query on the background worker, or directly when the list has no worker
+        :param task:
+        :param on_done:
+        :return:
+        """
+        if self.worker is None:
+            on_done(task())
+        else:
+            self.worker.submit(self.channel, task, on_done, on_cancel=self.on_request_cancelled)
+
+    def is_fetching(self):
+        """
+        Returns True while a page request of the list is still running on the background worker
+        :return:
+        """
+        return self.worker is not None and self.worker.has_pending(self.channel)
+
+    def on_request_cancelled(self):
+        """
+        Called when a page request is cancelled before it finished, so the list is fetched again next time
+        :return:
+        """
+        self.stale = True
+        self.load_pending = False
+
+    def on_page_loaded(self, items, limit, replace):
+        """
+        Applies a fetched page to the list
+        :param items: the fetched items
+        :param limit: the number of items that was asked for
+        :param replace: True when the items replace the loaded rows, False when they are appended
+        :return:
+        """
+        self.load_pending = False
+        self.exhausted = len(items) < limit
+        self.apply_items(items if replace else self.items + items)
+
+    def apply_items(self, items):
+        """
+        Replaces the loaded rows with items, touching only the listbox rows that changed
+        :param items:
+        :return:
+        """
+        with profiler.measure("history list", self.channel):
+            old_labels = [self.format_item(item) for item in self.items]
+            new_labels = [self.format_item(item) for item in items]
+            matcher = difflib.SequenceMatcher(a=old_labels, b=new_labels, autojunk=False)
+            # apply the changes from the bottom up so the indexes of the earlier changes stay valid
+            for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+                if tag == 'equal':
+                    continue
+                if i2 > i1:
+                    self.listbox.delete(i1, i2 - 1)
+                if j2 > j1:
+                    self.listbox.insert(i1, *new_labels[j1:j2])
+        self.items = items
+
+    def on_scroll(self, first, last):
+        """
+        Called by the listbox when the view moves. Fetches the next page when the view nears the bottom
+        :param first:
+        :param last:
+        :return:
+        """
+        self.scrollbar.set(first, last)
+        if not self.exhausted and not self.load_pending and float(last) >= self.PREFETCH_THRESHOLD:
+            self.load_pending = True
+            self.after_idle(self.load_more)
+
+    def on_listbox_select(self, event):
+        """
+        event for when the user clicks on an item within the ListBox
+        :param event:
+        :return:
+        """
+        selected_index = self.listbox.curselection()
+        if selected_index:
+            self.on_select(self.items[selected_index[0]])
+
+
 class WelcomeScreen(ttk.Frame):
     """
         WelcomeScreen describes the Welcome Screen frame.
@@ -145,6 +480,295 @@ class WelcomeScreen(ttk.Frame):
                                         command=lambda: controller.show_frame("MindfulScreen"))
         mindfulness_button.pack(pady=10)
 
+        # When the user clicks this button, they are taken to the Dashboard showing every log of each day
+        dashboard_button = ttk.Button(self, text="Dashboard",
+                                      command=lambda: controller.show_frame("DashboardScreen"))
+        dashboard_button.pack(pady=10)
+
+        # When the user clicks this button, they are taken to the statistics of the database queries
+        diagnostics_button = ttk.Button(self, text="Diagnostics",
+                                        command=lambda: controller.show_frame("DiagnosticsScreen"))
+        diagnostics_button.pack(pady=10)
+
+
+class DiagnosticsScreen(ttk.Frame):
+    """
+        DiagnosticsScreen shows the database queries run since the application started: which screen asked for
+        them, which persistence function ran them, how often and how long they took. Selecting a row shows the SQL
+        and its latency histogram
+    """
+    COLUMNS = (("origin", "Screen", 150), ("call_site", "Function", 250), ("calls", "Calls", 60),
+               ("total", "Total ms", 80), ("mean", "Mean ms", 70), ("p95", "p95 ms", 70), ("max", "Max ms", 70),
+               ("rows", "Rows", 70), ("slow", "Slow", 50))
+
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        self.statistics = {}
+
+        self.create_widgets()
+
+    def create_widgets(self):
+        """
+        This function creates the widgets for the Diagnostics Screen
+        :return:
+        """
+        threshold_frame = ttk.Frame(self)
+        threshold_frame.pack(pady=10)
+        ttk.Label(threshold_frame, text="Log queries slower than (ms)").pack(side="left")
+        self.threshold_entry = ttk.Entry(threshold_frame, width=8)
+        self.threshold_entry.insert(0, f"{query_recorder.slow_query_seconds * 1000:g}")
+        self.threshold_entry.pack(side="left", padx=5)
+        ttk.Button(threshold_frame, text="Apply", command=lambda: self.apply_threshold()).pack(side="left")
+        ttk.Button(threshold_frame, text="Refresh", command=lambda: self.display_statistics()).pack(side="left",
+                                                                                                   padx=5)
+        ttk.Button(threshold_frame, text="Reset", command=lambda: self.reset_statistics()).pack(side="left")
+        ttk.Button(threshold_frame, text="UI Timings", command=lambda: self.display_ui_timings()).pack(side="left",
+                                                                                                      padx=5)
+        ttk.Button(threshold_frame, text="Save UI Timings", command=lambda: self.save_ui_timings()).pack(side="left")
+
+        table_frame = ttk.Frame(self)
+        table_frame.pack(fill="both", expand=True, padx=10)
+        self.query_table = ttk.Treeview(table_frame, columns=[column for column, _, _ in self.COLUMNS],
+                                        show="headings")
+        for column, heading, width in self.COLUMNS:
+            self.query_table.heading(column, text=heading)
+            self.query_table.column(column, width=width, anchor="w")
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.query_table.yview)
+        self.query_table.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.query_table.pack(side=tk.LEFT, fill="both", expand=True)
+        self.query_table.bind("<<TreeviewSelect>>", self.on_select)
+
+        self.detail_text = tk.Text(self, height=8, wrap="word")
+        self.detail_text.pack(fill="x", padx=10, pady=10)
+        self.detail_text.config(state="disabled")
+
+        back_button = ttk.Button(self, text="Back to Welcome",
+                                 command=lambda: self.controller.show_frame("WelcomeScreen"))
+        back_button.pack(pady=10)
+
+    def display_statistics(self):
+        """
+        This function fills the table with one row per statement, slowest in total first
+        :return:
+        """
+        self.query_table.delete(*self.query_table.get_children())
+        self.statistics = {}
+        for index, statistic in enumerate(get_query_statistics()):
+            row_id = str(index)
+            self.statistics[row_id] = statistic
+            p95 = estimate_percentile(statistic.histogram, 0.95)
+            self.query_table.insert("", tk.END, iid=row_id, values=(
+                statistic.origin, statistic.call_site, statistic.calls,
+                f"{statistic.total_seconds * 1000:.1f}",
+                f"{statistic.total_seconds * 1000 / statistic.calls:.2f}" if statistic.calls else "",
+                f"<{p95 * 1000:g}" if p95 not in (None, float('inf')) else ">1000",
+                f"{statistic.max_seconds * 1000:.2f}", statistic.rows, statistic.slow_calls))
+        self.show_detail("")
+
+    def on_select(self, event):
+        """
+        This function shows the SQL and the latency histogram of the selected statement
+        :param event:
+        :return:
+        """
+        selection = self.query_table.selection()
+        statistic = self.statistics.get(selection[0]) if selection else None
+        if statistic is None:
+            return
+        lines = [statistic.statement, ""]
+        previous_bound = 0
+        for bound, count in zip(LATENCY_BUCKETS, statistic.histogram):
+            if count:
+                upper = f"{bound * 1000:g} ms" if bound != float('inf') else "and more"
+                lines.append(f"{previous_bound * 1000:g} - {upper}: {count}")
+            previous_bound = bound
+        self.show_detail("\n".join(lines))
+
+    def show_detail(self, text, wrap="word"):
+        """
+        This function replaces the text below the table
+        :param text:
+        :param wrap: "word" to wrap long lines, "none" to keep the columns of a table aligned
+        :return:
+        """
+        self.detail_text.config(state="normal", wrap=wrap)
+        self.detail_text.delete("1.0", tk.END)
+        self.detail_text.insert("1.0", text)
+        self.detail_text.config(state="disabled")
+
+    def display_ui_timings(self):
+        """
+        This function shows the screen timings of the UI profiler below the table
+        :return:
+        """
+        if not profiler.enabled:
+            self.show_detail("The UI profiler is off. Start the application with the WELLNESS_PROFILE environment "
+                             "variable set to time the screens")
+            return
+        self.show_detail(profiler.format_report(), wrap="none")
+
+    def save_ui_timings(self):
+        """
+        This function writes the screen timings of the UI profiler to a JSON file
+        :return:
+        """
+        if not profiler.enabled:
+            self.display_ui_timings()
+            return
+        path = get_profile_output_path()
+        profiler.write_report(path)
+        messagebox.showinfo("UI Timings", f"The UI timings were written to {os.path.abspath(path)}")
+
+    def apply_threshold(self):
+        """
+        This function sets how long a query may take before it is logged as slow
+        :return:
+        """
+        try:
+            milliseconds = float(self.threshold_entry.get())
+        except ValueError:
+            messagebox.showerror("Invalid Input", "The slow query threshold must be a number of milliseconds")
+            return
+        set_slow_query_threshold(milliseconds / 1000)
+
+    def reset_statistics(self):
+        """
+        This function forgets the queries recorded so far
+        :return:
+        """
+        reset_query_statistics()
+        self.display_statistics()
+
+    def tkraise(self, aboveThis=None):
+        """
+        This overrides the tkraise function to show the queries run up to now
+        :param aboveThis:
+        :return:
+        """
+        super().tkraise(aboveThis)
+        self.display_statistics()
+
+
+class DashboardScreen(ttk.Frame):
+    """
+        DashboardScreen shows the finance log, mood and journal of every day of a month side by side. The whole
+        month is read with one query on the background worker
+    """
+    COLUMNS = (("date", "Date", 100), ("mood", "Mood", 100), ("income", "Income", 100),
+               ("expense", "Expenses", 100), ("journal", "Journal", 300))
+
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        today = datetime.now()
+        self.year, self.month = today.year, today.month
+        self.days_stale = True
+        for table in (FINANCE, MINDFULNESS, JOURNAL):
+            subscribe(table, self.mark_days_stale)
+
+        self.create_widgets()
+
+    def create_widgets(self):
+        """
+        This function creates the widgets for the Dashboard Screen
+        :return:
+        """
+        month_frame = ttk.Frame(self)
+        month_frame.pack(pady=10)
+        ttk.Button(month_frame, text="<", command=lambda: self.step_month(-1)).pack(side="left")
+        self.month_label = ttk.Label(month_frame, width=20, anchor="center")
+        self.month_label.pack(side="left", padx=10)
+        ttk.Button(month_frame, text=">", command=lambda: self.step_month(1)).pack(side="left")
+
+        self.instruction_label = ttk.Label(self, text="Double click on a day with a journal to open it")
+        self.instruction_label.pack()
+
+        table_frame = ttk.Frame(self)
+        table_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        self.day_table = ttk.Treeview(table_frame, columns=[column for column, _, _ in self.COLUMNS],
+                                      show="headings")
+        for column, heading, width in self.COLUMNS:
+            self.day_table.heading(column, text=heading)
+            self.day_table.column(column, width=width, anchor="w")
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.day_table.yview)
+        self.day_table.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.day_table.pack(side=tk.LEFT, fill="both", expand=True)
+        self.day_table.bind("<Double-1>", self.on_double_click)
+
+        back_button = ttk.Button(self, text="Back to Welcome",
+                                 command=lambda: self.controller.show_frame("WelcomeScreen"))
+        back_button.pack(pady=10)
+
+    def display_month(self):
+        """
+        This function reads the days of the month being viewed on the background worker
+        :return:
+        """
+        self.days_stale = False
+        self.month_label.config(text=datetime(self.year, self.month, 1).strftime("%B %Y"))
+        first_day, last_day = get_month_range(self.year, self.month)
+        self.controller.worker.submit("DashboardScreen",
+                                      lambda: get_days_overview(first_day, last_day, include_empty_days=True),
+                                      self.show_days, on_cancel=lambda: self.mark_days_stale(None, None))
+
+    def show_days(self, snapshots):
+        """
+        This function fills the table with one row per day
+        :param snapshots:
+        :return:
+        """
+        self.day_table.delete(*self.day_table.get_children())
+        for snapshot in snapshots:
+            finance = snapshot.finance
+            self.day_table.insert("", tk.END, iid=snapshot.snapshot_date.isoformat(), values=(
+                snapshot.snapshot_date.isoformat(),
+                snapshot.user_mood.capitalize() if snapshot.user_mood else "",
+                f"{finance['income'] or 0:.2f}" if finance else "",
+                f"{get_total_expense(finance):.2f}" if finance else "",
+                snapshot.journal_title or ""))
+
+    def on_double_click(self, event):
+        """
+        This function opens the journal of the day the user double clicked on
+        :param event:
+        :return:
+        """
+        row = self.day_table.identify_row(event.y)
+        if row and self.day_table.set(row, "journal"):
+            self.controller.get_frame("DisplayJournalsScreen").on_select(
+                datetime.strptime(row, "%Y-%m-%d").date())
+
+    def step_month(self, steps):
+        """
+        This function is called when the user presses the previous or next button to move between months
+        :param steps:
+        :return:
+        """
+        self.year, self.month = step_month(self.year, self.month, steps)
+        self.display_month()
+
+    def mark_days_stale(self, table, version):
+        """
+        Change notification callback. Records that the month must be read again the next time the frame is raised
+        :param table:
+        :param version:
+        :return:
+        """
+        self.days_stale = True
+
+    def tkraise(self, aboveThis=None):
+        """
+        This overrides the tkraise function to read the month again when a log changed since it was shown
+        :param aboveThis:
+        :return:
+        """
+        super().tkraise(aboveThis)
+        if self.days_stale:
+            self.display_month()
+
 
 class FinancialScreen(ttk.Frame):
     """
@@ -154,6 +778,8 @@ class FinancialScreen(ttk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
+        self.finances_stale = True
+        subscribe(FINANCE, self.mark_finances_stale)
 
         self.create_widgets()
         self.display_finances()
@@ -194,8 +820,8 @@ class FinancialScreen(ttk.Frame):
         self.misc_entry = ttk.Entry(self)
         self.misc_entry.grid(row=6, column=1, pady=10, padx=10)
 
-        self.figure = plt.Figure(figsize=(5, 4), dpi=100)
-        self.canvas = FigureCanvasTkAgg(self.figure, self)
+        self.figure, self.canvas = create_chart_canvas(self)
+        self.drawn_chart_key = None
         self.canvas.get_tk_widget().grid(row=0, column=2, rowspan=7, pady=10, padx=10)
 
         back_button = ttk.Button(self, text="Back to Welcome",
@@ -225,6 +851,9 @@ class FinancialScreen(ttk.Frame):
                                                           command=lambda: self.display_finances_date_filter())
         get_financial_data_between_dates_btn.grid(row=8, column=2, padx=10, pady=10)
 
+        show_trend_btn = ttk.Button(self, text="Show Trend Over Time", command=lambda: self.display_finances_trend())
+        show_trend_btn.grid(row=9, column=2, padx=10, pady=10)
+
     def submit_finances_pressed(self):
         """
         the function called when the user presses the submit button
@@ -254,12 +883,9 @@ class FinancialScreen(ttk.Frame):
          all the financial data that the user has put in
         :return:
         """
-        # clear the previous plot
-        self.figure.clear()
-        # plot the new pie chart
-        show_financial_wellness_pie_chart(self.figure)
-        # update the canvas
-        self.canvas.draw()
+        self.finances_stale = False
+        self.controller.worker.submit("FinancialScreen", prepare_financial_wellness_pie_chart, self.draw_chart,
+                                      on_cancel=lambda: self.mark_finances_stale(FINANCE, None))
 
     def display_finances_date_filter(self):
         """
@@ -267,20 +893,62 @@ class FinancialScreen(ttk.Frame):
         :return:
         """
         if self.start_date_entry.get() != '' and self.end_date_entry.get() != '':
-            self.figure.clear()
-            show_financial_wellness_by_date(self.figure,
-                                            datetime.strptime(self.start_date_entry.get(), "%Y-%m-%d").date(),
-                                            datetime.strptime(self.end_date_entry.get(), "%Y-%m-%d").date())
+            start_date = datetime.strptime(self.start_date_entry.get(), "%Y-%m-%d").date()
+            end_date = datetime.strptime(self.end_date_entry.get(), "%Y-%m-%d").date()
+            self.controller.worker.submit("FinancialScreen",
+                                          lambda: prepare_financial_wellness_pie_chart(start_date, end_date),
+                                          self.draw_chart)
+
+    def display_finances_trend(self):
+        """
+        This function displays the income and expenses over time, between the filter dates when a range is
+        entered and over every finance log otherwise
+        :return:
+        """
+        start_date, end_date = get_trend_dates(self.start_date_entry, self.end_date_entry)
+        width = get_chart_width(self.canvas)
+        self.controller.worker.submit("FinancialScreen",
+                                      lambda: prepare_financial_trend_chart(start_date, end_date, width),
+                                      self.draw_chart)
+
+    def draw_chart(self, chart):
+        """
+        This function draws a prepared chart on the frame once the background worker has built it
+        :param chart:
+        :return:
+        """
+        # the canvas already shows this chart, so there is nothing to lay out again
+        if chart['key'] == self.drawn_chart_key:
+            return
+        self.drawn_chart_key = chart['key']
+        # clear the previous plot
+        self.figure.clear()
+        # plot the new chart
+        with profiler.measure("draw_chart", type(self).__name__):
+            draw_chart(self.figure, chart)
+        # update the canvas
+        with profiler.measure("canvas.draw", type(self).__name__):
             self.canvas.draw()
 
     def tkraise(self, aboveThis=None):
         """
-        This overrides the tkraise function to refresh the pie chart every time the frame is raised
+        This overrides the tkraise function to refresh the pie chart when the finance data changed
+        since it was last drawn
         :param aboveThis:
         :return:
         """
         super().tkraise(aboveThis)
-        self.display_finances()
+        if self.finances_stale:
+            self.display_finances()
+
+    def mark_finances_stale(self, table, version):
+        """
+        Change notification callback. Records that the pie chart must be redrawn the next time the frame is raised
+        :param table:
+        :param version:
+        :return:
+        """
+        self.finances_stale = True
 
     def validate_inputs(self):
         """
@@ -337,31 +1005,26 @@ class DisplayFinancesScreen(ttk.Frame):
         self.instruction_label = ttk.Label(self, text="Click on the date to open the log")
         self.instruction_label.pack(padx=10, pady=10)
 
-        self.finance_listbox = tk.Listbox(self)
-        self.finance_listbox.pack(fill="both", expand=True, pady=10, padx=10)
-
-        for finance in get_all_financial_wellness_data():
-            self.finance_listbox.insert(tk.END, finance.log_date)
-
-        self.finance_listbox.bind("<<ListboxSelect>>", self.on_select)
+        self.finance_list = HistoryList(self, get_financial_wellness_dates, self.on_select, table=FINANCE,
+                                       worker=self.controller.worker, channel="DisplayFinancesScreen")
+        self.finance_list.pack(fill="both", expand=True, pady=10, padx=10)
 
         back_button = ttk.Button(self, text="Back to Financial",
                                  command=lambda: self.controller.show_frame("FinancialScreen"))
         back_button.pack(pady=10)
 
-    def on_select(self, event):
+    def on_select(self, selected_date):
         """
-        event for when the user clicks on an item within the ListBox
-        :param event:
+        event for when the user clicks on a date within the history list
+        :param selected_date:
         :return:
         """
-        selected_index = self.finance_listbox.curselection()
-        if selected_index:
-            selected_date = self.finance_listbox.get(selected_index)
-            finance = get_financial_wellness_data(selected_date)
+        finance = get_financial_wellness_data(selected_date)
+        if finance:
             update_frame = self.controller.get_frame("UpdateFinancesScreen")
             # remove all the data that may be in the frame and repopulate it with the
             # finance log's data
+            update_frame.date_entry.config(state=tk.NORMAL)
             update_frame.date_entry.delete(0, tk.END)
             update_frame.date_entry.insert(0, finance.log_date)
             update_frame.date_entry.config(state=tk.DISABLED)
@@ -386,19 +1049,14 @@ class DisplayFinancesScreen(ttk.Frame):
 
             self.controller.show_frame("UpdateFinancesScreen")
 
-    def clear_widgets(self):
+    def tkraise(self, aboveThis=None):
         """
-        clear widgets is used for removing all widgets from the frame
-        This function is necessary for the page data to be updated
+        override the tkraise function to refresh the history list when its data changed
+        :param aboveThis:
         :return:
         """
-        for widget in super().winfo_children():
-            widget.destroy()
-
-    def tkraise(self, aboveThis=None):
         super().tkraise(aboveThis)
-        self.clear_widgets()
-        self.create_widgets()
+        self.finance_list.refresh_if_stale()
 
 
 class UpdateFinancesScreen(ttk.Frame):
@@ -510,6 +1168,8 @@ class MindfulScreen(ttk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
+        self.moods_stale = True
+        subscribe(MINDFULNESS, self.mark_moods_stale)
         self.create_widgets()
         self.display_moods()
 
@@ -551,8 +1211,8 @@ class MindfulScreen(ttk.Frame):
         self.end_date_entry.insert(0, datetime.now().strftime('%Y-%m-%d'))
         self.end_date_entry.grid(row=5, column=1, pady=10, padx=10)
 
-        self.figure = plt.Figure(figsize=(5, 4), dpi=100)
-        self.canvas = FigureCanvasTkAgg(self.figure, self)
+        self.figure, self.canvas = create_chart_canvas(self)
+        self.drawn_chart_key = None
         self.canvas.get_tk_widget().grid(row=0, column=2, rowspan=4, pady=10, padx=10)
 
         display_mindfulness_button = ttk.Button(self, text="Log History",
@@ -563,6 +1223,9 @@ class MindfulScreen(ttk.Frame):
                                                           command=lambda: self.display_moods_between_dates())
         display_mood_chart_between_dates_btn.grid(row=7, column=1, pady=10, padx=10)
 
+        show_trend_btn = ttk.Button(self, text="Show mood trend", command=lambda: self.display_moods_trend())
+        show_trend_btn.grid(row=7, column=0, pady=10, padx=10)
+
         journal_button = ttk.Button(self, text="Journal",
                                     command=lambda: self.controller.show_frame("JournalScreen"))
         journal_button.grid(row=6, column=2, pady=10, padx=10)
@@ -571,6 +1234,23 @@ class MindfulScreen(ttk.Frame):
                                  command=lambda: self.controller.show_frame("WelcomeScreen"))
         back_button.grid(row=7, column=2, pady=10, padx=10)
 
+        # Step through the mood history one week or month at a time
+        ttk.Label(self, text="View by").grid(row=6, column=0, pady=10, padx=10)
+        self.period_type = 'month'
+        self.period_key = get_mood_period(self.period_type, datetime.now().date())
+        self.period_type_var = tk.StringVar(value=self.period_type)
+        period_type_dropdown = ttk.Combobox(self, textvariable=self.period_type_var, state='readonly')
+        period_type_dropdown['values'] = ['month', 'week']
+        period_type_dropdown.grid(row=6, column=1, pady=10, padx=10)
+        period_type_dropdown.bind("<<ComboboxSelected>>", lambda event: self.change_period_type())
+
+        previous_period_btn = ttk.Button(self, text="< Previous", command=lambda: self.step_period(-1))
+        previous_period_btn.grid(row=9, column=0, pady=10, padx=10)
+        self.period_label = ttk.Label(self, text=self.period_key)
+        self.period_label.grid(row=9, column=1, pady=10, padx=10)
+        next_period_btn = ttk.Button(self, text="Next >", command=lambda: self.step_period(1))
+        next_period_btn.grid(row=9, column=2, pady=10, padx=10)
+
     def submit_mood(self):
         """
         The function called when the user presses the submit button
@@ -591,11 +1271,9 @@ class MindfulScreen(ttk.Frame):
         This function displays the mood pie chart of all the entries the user has entered
         :return:
         """
-        self.figure.clear()
-        # plot the new pie chart
-        show_mood_wellness_pie_chart(self.figure)
-        # update the canvas
-        self.canvas.draw()
+        self.moods_stale = False
+        self.controller.worker.submit("MindfulScreen", prepare_mood_wellness_pie_chart, self.draw_chart,
+                                      on_cancel=lambda: self.mark_moods_stale(MINDFULNESS, None))
 
     def display_moods_between_dates(self):
         """
@@ -606,13 +1284,74 @@ class MindfulScreen(ttk.Frame):
         if self.start_date_entry.get() == '' or self.end_date_entry.get() == '':
             tkinter.messagebox.showinfo(title="Error", message="Please enter dates to be searched")
         else:
-            self.figure.clear()
-            show_mood_wellness_pie_chart_date_filter(self.figure,
-                                                     datetime.strptime(self.start_date_entry.get(), "%Y-%m-%d").date(),
-                                                     datetime.strptime(self.end_date_entry.get(), "%Y-%m-%d").date())
-            # update the canvas
+            start_date = datetime.strptime(self.start_date_entry.get(), "%Y-%m-%d").date()
+            end_date = datetime.strptime(self.end_date_entry.get(), "%Y-%m-%d").date()
+            self.controller.worker.submit("MindfulScreen",
+                                          lambda: prepare_mood_wellness_pie_chart(start_date, end_date),
+                                          self.draw_chart)
+
+    def display_moods_trend(self):
+        """
+        This function displays how often each mood was logged over time, between the filter dates when a range is
+        entered and over every mood log otherwise
+        :return:
+        """
+        start_date, end_date = get_trend_dates(self.start_date_entry, self.end_date_entry)
+        width = get_chart_width(self.canvas)
+        self.controller.worker.submit("MindfulScreen",
+                                      lambda: prepare_mood_trend_chart(start_date, end_date, width),
+                                      self.draw_chart)
+
+    def display_moods_for_period(self):
+        """
+        This function displays the mood pie chart of the selected week or month
+        :return:
+        """
+        self.period_label.config(text=self.period_key)
+        period_type = self.period_type
+        period_key = self.period_key
+        self.controller.worker.submit("MindfulScreen",
+                                      lambda: prepare_mood_wellness_pie_chart_by_period(period_type, period_key),
+                                      self.draw_chart)
+
+    def draw_chart(self, chart):
+        """
+        This function draws a prepared chart on the frame once the background worker has built it
+        :param chart:
+        :return:
+        """
+        # the canvas already shows this chart, so there is nothing to lay out again
+        if chart['key'] == self.drawn_chart_key:
+            return
+        self.drawn_chart_key = chart['key']
+        self.figure.clear()
+        # plot the new chart
+        with profiler.measure("draw_chart", type(self).__name__):
+            draw_chart(self.figure, chart)
+        # update the canvas
+        with profiler.measure("canvas.draw", type(self).__name__):
             self.canvas.draw()
 
+    def step_period(self, steps):
+        """
+        This function is called when the user presses the previous or next button to move between periods
+        :param steps:
+        :return:
+        """
+        self.period_key = step_mood_period(self.period_type, self.period_key, steps)
+        self.display_moods_for_period()
+
+    def change_period_type(self):
+        """
+        This function is called when the user switches between viewing by week and by month. The new period is
+        the one containing the first day of the period being viewed.
+        :return:
+        """
+        period_start = get_mood_period_start_date(self.period_type, self.period_key)
+        self.period_type = self.period_type_var.get()
+        self.period_key = get_mood_period(self.period_type, period_start)
+        self.display_moods_for_period()
+
     def replace_quote_label(self):
         """
         This function replaces the quote label every time the user re-navigates to the page
@@ -628,7 +1367,17 @@ class MindfulScreen(ttk.Frame):
         """
         super().tkraise(aboveThis)
         self.replace_quote_label()
-        self.display_moods()
+        if self.moods_stale:
+            self.display_moods()
+
+    def mark_moods_stale(self, table, version):
+        """
+        Change notification callback. Records that the pie chart must be redrawn the next time the frame is raised
+        :param table:
+        :param version:
+        :return:
+        """
+        self.moods_stale = True
 
     def validate_input(self):
         """
@@ -662,29 +1411,24 @@ class DisplayMindfulnessScreen(ttk.Frame):
         self.instruction_label = ttk.Label(self, text="Click on the date to open the log")
         self.instruction_label.pack(padx=10, pady=10)
 
-        self.mindfulness_listbox = tk.Listbox(self)
-        self.mindfulness_listbox.pack(fill="both", expand=True, pady=10, padx=10)
-
-        for mindful in get_mindfulness_data_history():
-            self.mindfulness_listbox.insert(tk.END, mindful.log_date)
-
-        self.mindfulness_listbox.bind("<<ListboxSelect>>", self.on_select)
+        self.mindfulness_list = HistoryList(self, get_mindfulness_dates, self.on_select, table=MINDFULNESS,
+                                           worker=self.controller.worker, channel="DisplayMindfulnessScreen")
+        self.mindfulness_list.pack(fill="both", expand=True, pady=10, padx=10)
 
         back_button = ttk.Button(self, text="Back to Mindful",
                                  command=lambda: self.controller.show_frame("MindfulScreen"))
         back_button.pack(pady=10)
 
-    def on_select(self, event):
+    def on_select(self, selected_date):
         """
-        event for when the user clicks on a ListBox item
-        :param event:
+        event for when the user clicks on a date within the history list
+        :param selected_date:
         :return:
         """
-        selected_index = self.mindfulness_listbox.curselection()
-        if selected_index:
-            selected_date = self.mindfulness_listbox.get(selected_index)
-            mindfulness = get_mindfulness_data(selected_date)
+        mindfulness = get_mindfulness_data(selected_date)
+        if mindfulness:
             update_frame = self.controller.get_frame("UpdateMindfulnessScreen")
+            update_frame.date_entry.config(state=tk.NORMAL)
             update_frame.date_entry.delete(0, tk.END)
             update_frame.date_entry.insert(0, mindfulness.log_date)
             update_frame.date_entry.config(state=tk.DISABLED)
@@ -692,23 +1436,14 @@ class DisplayMindfulnessScreen(ttk.Frame):
             update_frame.mood_dropdown.config(state='readonly')
             self.controller.show_frame("UpdateMindfulnessScreen")
 
-    def clear_widgets(self):
-        """
-        clear the widgets in the frame.
-        :return:
-        """
-        for widget in super().winfo_children():
-            widget.destroy()
-
     def tkraise(self, aboveThis=None):
         """
-        override the tkraise function to clear and create widgets to show the new data
+        override the tkraise function to refresh the history list when its data changed
         :param aboveThis:
         :return:
         """
         super().tkraise(aboveThis)
-        self.clear_widgets()
-        self.create_widgets()
+        self.mindfulness_list.refresh_if_stale()
 
 
 class UpdateMindfulnessScreen(ttk.Frame):
@@ -845,11 +1580,16 @@ class DisplayJournalsScreen(ttk.Frame):
     """
     This class describes the Display Journals Screen
     """
+    SEARCH_LIMIT = 50
 
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
+        self.search_query = ""
+        self.search_stale = False
+        self.search_result_dates = {}
         self.create_widgets()
+        subscribe(JOURNAL, self.mark_search_stale)
 
     def create_widgets(self):
         """
@@ -860,28 +1600,140 @@ class DisplayJournalsScreen(ttk.Frame):
         self.instruction_label = ttk.Label(self, text="Click on the date to open the log")
         self.instruction_label.pack(padx=10, pady=10)
 
-        self.journal_listbox = tk.Listbox(self)
-        self.journal_listbox.pack(fill="both", expand=True, pady=10, padx=10)
-
-        for journal in get_journal_logs():
-            self.journal_listbox.insert(tk.END, journal.journal_date)
-
-        self.journal_listbox.bind("<<ListboxSelect>>", self.on_select)
+        search_frame = ttk.Frame(self)
+        search_frame.pack(fill="x", padx=10)
+        self.search_entry = ttk.Entry(search_frame)
+        self.search_entry.pack(side="left", fill="x", expand=True)
+        self.search_entry.bind("<Return>", lambda event: self.search())
+        ttk.Button(search_frame, text="Search", command=self.search).pack(side="left", padx=5)
+        ttk.Button(search_frame, text="Clear", command=self.clear_search).pack(side="left")
+
+        # the search results replace the history list while a search is shown
+        self.search_results = tk.Text(self, height=15, width=60, wrap="word", cursor="arrow")
+        self.search_results.tag_configure("date", font=("TkDefaultFont", 10, "bold"))
+        self.search_results.tag_configure("match", background="yellow")
+
+        # the list only loads summaries, the entry body is read when a journal is opened
+        self.journal_list = HistoryList(self, get_journal_summaries,
+                                       lambda summary: self.on_select(summary.journal_date),
+                                       format_item=self.format_summary, get_key=lambda summary: summary.journal_date,
+                                       table=JOURNAL, worker=self.controller.worker, channel="DisplayJournalsScreen")
+        self.journal_list.pack(fill="both", expand=True, pady=10, padx=10)
 
         self.back_button = ttk.Button(self, text="Back to Journal",
                                       command=lambda: self.controller.show_frame("JournalScreen"))
         self.back_button.pack(pady=10)
 
-    def on_select(self, event):
+    @staticmethod
+    def format_summary(summary):
         """
-        When the user makes a selection from the listbox this function is called
-        :param event:
+        This function returns the history list text of a journal summary: the date, the title and the start of
+        the entry on one line
+        :param summary:
         :return:
         """
-        selected_index = self.journal_listbox.curselection()
-        if selected_index:
-            selected_date = self.journal_listbox.get(selected_index)
-            journal = get_journal_by_date(selected_date)
+        preview = " ".join((summary.entry_preview or "").split())
+        if (summary.entry_length or 0) > len(summary.entry_preview or ""):
+            preview += "..."
+        return f"{summary.journal_date}  {' '.join((summary.journal_title or '').split())}  -  {preview}"
+
+    def search(self):
+        """
+        This function is called when the user searches the journals. The search runs on the background worker
+        and the ranked results are shown in place of the history list
+        :return:
+        """
+        self.search_query = self.search_entry.get().strip()
+        if not self.search_query:
+            self.clear_search()
+            return
+        self.run_search()
+
+    def run_search(self):
+        """
+        This function submits the current search to the background worker
+        :return:
+        """
+        self.search_stale = False
+        query = self.search_query
+        self.controller.worker.submit("DisplayJournalsScreen.search",
+                                      lambda: search_journals(query, limit=self.SEARCH_LIMIT,
+                                                              highlight=(SEARCH_MATCH_START, SEARCH_MATCH_END)),
+                                      self.show_search_results)
+
+    def show_search_results(self, results):
+        """
+        This function writes the search results into the results box, highlighting the matched words. Clicking
+        a result opens the journal
+        :param results:
+        :return:
+        """
+        if not self.search_query:
+            return
+        self.instruction_label.config(text=f"{len(results)} journals match \"{self.search_query}\"" if results
+                                      else f"No journals match \"{self.search_query}\"")
+        self.search_results.config(state=tk.NORMAL)
+        self.search_results.delete("1.0", tk.END)
+        self.search_result_dates = {}
+        for index, result in enumerate(results):
+            tag = f"result{index}"
+            self.search_result_dates[tag] = result['journal_date']
+            self.search_results.insert(tk.END, f"{result['journal_date']}  ", ("date", tag))
+            self.insert_highlighted(result['journal_title'], ("date", tag))
+            self.search_results.insert(tk.END, "\n", tag)
+            self.insert_highlighted(result['snippet'], (tag,))
+            self.search_results.insert(tk.END, "\n\n", tag)
+            self.search_results.tag_bind(tag, "<Button-1>", lambda event, result_tag=tag:
+                                         self.on_select(self.search_result_dates[result_tag]))
+        self.search_results.config(state=tk.DISABLED)
+
+        if not self.search_results.winfo_ismapped():
+            self.journal_list.pack_forget()
+            self.search_results.pack(fill="both", expand=True, pady=10, padx=10, before=self.back_button)
+
+    def insert_highlighted(self, marked_text, tags):
+        """
+        This function inserts text returned by the search into the results box, giving the words between the
+        match markers the match tag
+        :param marked_text:
+        :param tags:
+        :return:
+        """
+        for part_index, part in enumerate(re.split(f"[{SEARCH_MATCH_START}{SEARCH_MATCH_END}]", marked_text)):
+            # the parts alternate between unmatched and matched text
+            self.search_results.insert(tk.END, part, tags + ("match",) if part_index % 2 else tags)
+
+    def clear_search(self):
+        """
+        This function clears the search and shows the history list again
+        :return:
+        """
+        self.controller.worker.cancel("DisplayJournalsScreen.search")
+        self.search_query = ""
+        self.search_entry.delete(0, tk.END)
+        self.instruction_label.config(text="Click on the date to open the log")
+        if self.search_results.winfo_ismapped():
+            self.search_results.pack_forget()
+            self.journal_list.pack(fill="both", expand=True, pady=10, padx=10, before=self.back_button)
+
+    def mark_search_stale(self, table, version):
+        """
+        Change notification callback. Records that the search results must be fetched again the next time the
+        frame is raised
+        :param table:
+        :param version:
+        :return:
+        """
+        self.search_stale = True
+
+    def on_select(self, selected_date):
+        """
+        When the user makes a selection from the history list or the search results this function is called
+        :param selected_date:
+        :return:
+        """
+        journal = get_journal_by_date(selected_date)
+        if journal:
             journal_frame = self.controller.get_frame("UpdateJournalScreen")
             journal_frame.date_entry.delete(0, tk.END)
             journal_frame.date_entry.insert(0, journal.journal_date)
@@ -892,23 +1744,16 @@ class DisplayJournalsScreen(ttk.Frame):
 
             self.controller.show_frame("UpdateJournalScreen")
 
-    def clear_widgets(self):
-        """
-        This function clears the widgets from the frame
-        :return:
-        """
-        for widget in super().winfo_children():
-            widget.destroy()
-
     def tkraise(self, aboveThis=None):
         """
-        override the tkraise function to clear and re-create the widgets to show new data
+        override the tkraise function to refresh the history list and the search results when the journals changed
         :param aboveThis:
         :return:
         """
         super().tkraise(aboveThis)
-        self.clear_widgets()
-        self.create_widgets()
+        self.journal_list.refresh_if_stale()
+        if self.search_query and self.search_stale:
+            self.run_search()
 
 
 class UpdateJournalScreen(ttk.Frame):
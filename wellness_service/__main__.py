@@ -0,0 +1,338 @@
+"""
+This script file is the command line interface of the wellness services, for logging and reports from scripts
+without opening the application window.
+
+    python -m wellness_service log-finance --income 120 --grocery 30 --food 12
+    python -m wellness_service log-mood happy --date 2024-05-01
+    python -m wellness_service journal add --title "A good day" --entry "Went for a walk"
+    python -m wellness_service journal search walk
+    python -m wellness_service report --from 2024-05-01 --to 2024-05-31
+    python -m wellness_service import finance finance.csv
+    python -m wellness_service export all exports/
+    python -m wellness_service compress-journals
+
+Only the database and service modules are imported, never tkinter or matplotlib, so a command starts quickly.
+Pass --db to use another database file than the application's.
+"""
+import argparse
+import json
+import sys
+from datetime import date
+
+import sqlalchemy.exc
+
+from database.database import DBConnection
+from database.enumerations import Mood
+from database.journal_data_persistence import compress_journal_entries
+from database.migrations import upgrade_database
+from wellness_service.data_export import export_all, export_domain, EXPORT_DOMAINS, EXPORT_FORMATS
+from wellness_service.data_import import import_file, DataImportError, IMPORT_DOMAINS
+from wellness_service.financial_wellness import insert_financial_wellness_data, update_financial_wellness_data, \
+    get_financial_wellness_data, calculate_financial_breakdown_by_date
+from wellness_service.journal import insert_journal_log, update_journal, get_journal_by_date, search_journals, \
+    get_journals_between_dates
+from wellness_service.mindfulness import insert_mindfulness_log, update_mindfulness_data, get_mindfulness_data, \
+    calculate_mood_breakdown_by_date
+
+
+class CommandError(Exception):
+    """
+    CommandError is raised by a command that cannot be carried out. The message is shown to the user
+    """
+    pass
+
+
+def parse_date(value):
+    """
+    argparse type for dates written YYYY-MM-DD
+    :param value:
+    :return:
+    """
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a date in YYYY-MM-DD format")
+
+
+def parse_mood(value):
+    """
+    argparse type for moods, in any case
+    :param value:
+    :return:
+    """
+    mood = value.strip().upper()
+    if mood not in Mood.__members__:
+        raise argparse.ArgumentTypeError(f"mood must be one of {', '.join(name.lower() for name in Mood.__members__)}")
+    return mood
+
+
+def save_log(exists, insert, update, replace, description):
+    """
+    inserts a log, or replaces the log of the same date when replace is set
+    :param exists: True when the date already has a log
+    :param insert: function writing a new log
+    :param update: function replacing the existing log
+    :param replace:
+    :param description: what is being saved, used in the messages
+    :return:
+    """
+    if exists and not replace:
+        raise CommandError(f"there is already a {description}, pass --replace to overwrite it")
+    try:
+        (update if exists else insert)()
+    except sqlalchemy.exc.IntegrityError:
+        raise CommandError(f"there is already a {description}, pass --replace to overwrite it")
+    print(("Replaced" if exists else "Saved") + f" the {description}")
+
+
+def log_finance(arguments):
+    """
+    saves the finance log of a day. At least one amount must be given, the others are 0
+    :param arguments: the parsed arguments of log-finance
+    :return:
+    """
+    amounts = (arguments.income, arguments.grocery, arguments.utility, arguments.rent, arguments.food,
+               arguments.misc)
+    if not any(amounts):
+        raise CommandError("a finance log needs at least one amount that is not 0, for example --income 120")
+    save_log(get_financial_wellness_data(arguments.date) is not None,
+             lambda: insert_financial_wellness_data(*amounts, arguments.date),
+             lambda: update_financial_wellness_data(*amounts, arguments.date),
+             arguments.replace, f"finance log for {arguments.date}")
+
+
+def log_mood(arguments):
+    """
+    saves the mood of a day
+    :param arguments: the parsed arguments of log-mood
+    :return:
+    """
+    save_log(get_mindfulness_data(arguments.date) is not None,
+             lambda: insert_mindfulness_log(arguments.mood, arguments.date),
+             lambda: update_mindfulness_data(arguments.mood, arguments.date),
+             arguments.replace, f"mood for {arguments.date}")
+
+
+def add_journal(arguments):
+    """
+    saves the journal of a day, reading the entry from standard input when --entry is not given
+    :param arguments: the parsed arguments of journal add
+    :return:
+    """
+    entry = arguments.entry if arguments.entry is not None else sys.stdin.read()
+    if not arguments.title.strip() or not entry.strip():
+        raise CommandError("a journal needs a title and an entry")
+    save_log(get_journal_by_date(arguments.date) is not None,
+             lambda: insert_journal_log(arguments.title, entry, arguments.date),
+             lambda: update_journal(arguments.title, entry, arguments.date),
+             arguments.replace, f"journal for {arguments.date}")
+
+
+def search_journal(arguments):
+    """
+    prints the journals matching the search words, best match first
+    :param arguments: the parsed arguments of journal search
+    :return:
+    """
+    date_range = (arguments.date_from or date.min, arguments.date_to or date.max) \
+        if arguments.date_from or arguments.date_to else None
+    results = search_journals(arguments.query, date_range, arguments.limit)
+    if arguments.json:
+        print(json.dumps(results, default=str, indent=2))
+        return
+    for result in results:
+        print(f"{result['journal_date']}  {result['journal_title']}\n    {result['snippet']}")
+    if not results:
+        print("No journal matches")
+
+
+def get_report(date_from, date_to):
+    """
+    returns the finance and mood breakdowns and the journal count of a date range
+    :param date_from:
+    :param date_to:
+    :return:
+    """
+    return {
+        'from': date_from,
+        'to': date_to,
+        'finance': calculate_financial_breakdown_by_date(date_from, date_to),
+        'mood': calculate_mood_breakdown_by_date(date_from, date_to),
+        'journals': len(get_journals_between_dates(date_from, date_to)),
+    }
+
+
+def format_report(report):
+    """
+    returns a report as text
+    :param report:
+    :return:
+    """
+    lines = [f"Report from {report['from']} to {report['to']}", "", "Finances:"]
+    finance = report['finance']
+    if 'no_entries' in finance:
+        lines.append("  no finance logs")
+    elif 'total_debt' in finance:
+        lines.append(f"  spent {-finance['total_debt']:.2f} more than was earned")
+    else:
+        lines.append(f"  {'income':<12}{finance['total_income']:>12.2f}")
+        lines.append(f"  {'expenses':<12}{finance['total_expense']:>12.2f}")
+        for key in ('grocery', 'utility', 'rent', 'food', 'misc', 'unspent'):
+            lines.append(f"  {key:<12}{finance['total_' + key]:>11.1f}%")
+    lines += ["", "Moods:"]
+    mood = report['mood']
+    if 'no_moods_logged' in mood:
+        lines.append("  no moods logged")
+    else:
+        lines.append(f"  {'logged':<12}{mood['total_moods_logged']:>12}")
+        for name in Mood.__members__:
+            lines.append(f"  {name.lower():<12}{mood[name.lower()]:>11.1f}%")
+    lines += ["", f"Journals: {report['journals']}"]
+    return "\n".join(lines)
+
+
+def report(arguments):
+    """
+    prints the report of a date range as text or JSON
+    :param arguments: the parsed arguments of report
+    :return:
+    """
+    if arguments.date_from > arguments.date_to:
+        raise CommandError("--from must not be after --to")
+    result = get_report(arguments.date_from, arguments.date_to)
+    print(json.dumps(result, default=str, indent=2) if arguments.json else format_report(result))
+
+
+def import_logs(arguments):
+    """
+    imports the logs of a domain from a file
+    :param arguments: the parsed arguments of import
+    :return:
+    """
+    try:
+        imported = import_file(arguments.domain, arguments.path, arguments.batch_size)
+    except (DataImportError, OSError) as error:
+        raise CommandError(str(error))
+    print(f"Imported {imported} {arguments.domain} logs")
+
+
+def export_logs(arguments):
+    """
+    exports the logs of a domain to a file, or of every domain to a directory
+    :param arguments: the parsed arguments of export
+    :return:
+    """
+    try:
+        if arguments.domain == 'all':
+            counts = export_all(arguments.path, arguments.format or 'csv')
+        else:
+            counts = {arguments.domain: export_domain(arguments.domain, arguments.path, arguments.format)}
+    except (ValueError, ImportError, OSError) as error:
+        raise CommandError(str(error))
+    for domain, count in counts.items():
+        print(f"Exported {count} {domain} logs")
+
+
+def compress_journals(arguments):
+    """
+    stores the journal entries written before compression was enabled compressed, and shrinks the database file
+    :param arguments: the parsed arguments of compress-journals
+    :return:
+    """
+    stats = compress_journal_entries(arguments.chunk_size, not arguments.no_vacuum)
+    if not stats['compressed']:
+        print("No journal entries left to compress")
+        return
+    print(f"Compressed {stats['compressed']} journal entries from {stats['bytes_before']} to "
+          f"{stats['bytes_after']} bytes")
+
+
+def build_parser():
+    """
+    returns the argument parser of the command line interface
+    :return:
+    """
+    parser = argparse.ArgumentParser(prog='python -m wellness_service',
+                                     description="Log and report wellness data without opening the application.")
+    parser.add_argument('--db', metavar='PATH', help="the database file to use instead of the application's")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    finance = commands.add_parser('log-finance', help="log the income and expenses of a day")
+    finance.add_argument('--date', type=parse_date, default=date.today(), help="YYYY-MM-DD, today by default")
+    for name in ('income', 'grocery', 'utility', 'rent', 'food', 'misc'):
+        finance.add_argument('--' + name, type=float, default=0.0,
+                             help=f"the {name} amount, 0 by default. At least one amount must be given")
+    finance.add_argument('--replace', action='store_true', help="overwrite the log of the day if there is one")
+    finance.set_defaults(handler=log_finance)
+
+    mood = commands.add_parser('log-mood', help="log the mood of a day")
+    mood.add_argument('mood', type=parse_mood, help=", ".join(name.lower() for name in Mood.__members__))
+    mood.add_argument('--date', type=parse_date, default=date.today(), help="YYYY-MM-DD, today by default")
+    mood.add_argument('--replace', action='store_true', help="overwrite the mood of the day if there is one")
+    mood.set_defaults(handler=log_mood)
+
+    journal = commands.add_parser('journal', help="write or search journals")
+    journal_commands = journal.add_subparsers(dest='journal_command', required=True)
+    add = journal_commands.add_parser('add', help="write the journal of a day")
+    add.add_argument('--title', required=True)
+    add.add_argument('--entry', help="the journal text, read from standard input when not given")
+    add.add_argument('--date', type=parse_date, default=date.today(), help="YYYY-MM-DD, today by default")
+    add.add_argument('--replace', action='store_true', help="overwrite the journal of the day if there is one")
+    add.set_defaults(handler=add_journal)
+    search = journal_commands.add_parser('search', help="search the journal titles and entries")
+    search.add_argument('query')
+    search.add_argument('--from', dest='date_from', type=parse_date, help="the first date to search")
+    search.add_argument('--to', dest='date_to', type=parse_date, help="the last date to search")
+    search.add_argument('--limit', type=int, default=20)
+    search.add_argument('--json', action='store_true', help="print the results as JSON")
+    search.set_defaults(handler=search_journal)
+
+    report_parser = commands.add_parser('report', help="summarize the finances, moods and journals of a date range")
+    report_parser.add_argument('--from', dest='date_from', type=parse_date, required=True)
+    report_parser.add_argument('--to', dest='date_to', type=parse_date, required=True)
+    report_parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    report_parser.set_defaults(handler=report)
+
+    import_parser = commands.add_parser('import', help="import logs from a .csv or .jsonl file")
+    import_parser.add_argument('domain', choices=list(IMPORT_DOMAINS))
+    import_parser.add_argument('path')
+    import_parser.add_argument('--batch-size', type=int, default=500)
+    import_parser.set_defaults(handler=import_logs)
+
+    export_parser = commands.add_parser('export', help="export logs to a file, or every domain to a directory")
+    export_parser.add_argument('domain', choices=list(EXPORT_DOMAINS) + ['all'])
+    export_parser.add_argument('path', help="the file to write, or the directory for all")
+    export_parser.add_argument('--format', choices=EXPORT_FORMATS,
+                               help="taken from the file extension by default, csv for all")
+    export_parser.set_defaults(handler=export_logs)
+
+    compress = commands.add_parser('compress-journals',
+                                   help="compress the journal entries of an existing database and shrink the file")
+    compress.add_argument('--chunk-size', type=int, default=500, help="the journals rewritten at a time")
+    compress.add_argument('--no-vacuum', action='store_true',
+                          help="skip the VACUUM that gives the space freed back to the file system")
+    compress.set_defaults(handler=compress_journals)
+    return parser
+
+
+def main(argv=None):
+    """
+    runs the command given on the command line
+    :param argv: the arguments, sys.argv[1:] by default
+    :return: the exit status, 0 on success and 1 when the command failed
+    """
+    arguments = build_parser().parse_args(argv)
+    try:
+        if arguments.db:
+            DBConnection().use_database(arguments.db)
+        upgrade_database()
+        arguments.handler(arguments)
+    except (CommandError, sqlalchemy.exc.SQLAlchemyError, ValueError, ArithmeticError, OSError) as error:
+        # errors of the services are reported like a refused command instead of with a traceback
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+This script file relates the user's moods to their spending.
+
+The finance and mood logs of a date range are loaded once into NumPy arrays with one slot per day, so every
+statistic is a handful of vectorized operations rather than a Python loop over the logs. Days without a finance log
+hold NaN and days without a mood hold -1, and each statistic only uses the days that have what it needs.
+The loaded arrays and the results are cached by date range and by the data versions of the finance and mindfulness
+tables, so asking again after nothing was written does not touch the database. The cache is shared by the UI worker
+and the API server threads: the cached arrays are read only, and every caller gets its own copy of a cached result.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+
+from database.enumerations import Mood
+from database.finance_data_persistence import FINANCE_AMOUNT_COLUMNS, get_finance_amount_rows
+from database.mindfulness_data_persistence import get_mood_rows
+from wellness_service.data_events import get_data_version, FINANCE, MINDFULNESS
+
+# The moods in the order of their codes in the mood arrays
+MOOD_NAMES = [mood.name for mood in Mood]
+MOOD_CODES = {name: code for code, name in enumerate(MOOD_NAMES)}
+
+# How pleasant each mood is, used to correlate moods with amounts spent
+MOOD_VALENCE = {
+    'HAPPY': 2.0,
+    'GRATEFUL': 2.0,
+    'CONTENT': 1.0,
+    'STRESSED': -1.0,
+    'FRUSTRATED': -1.0,
+    'SAD': -2.0,
+}
+_VALENCE_BY_CODE = np.array([MOOD_VALENCE[name] for name in MOOD_NAMES])
+
+# The spending measure used when none is given: the sum of the expense columns
+TOTAL_EXPENSE = 'total_expense'
+EXPENSE_COLUMNS = [column for column in FINANCE_AMOUNT_COLUMNS if column != 'income']
+
+ANALYTICS_CACHE_SIZE = 32
+
+# The finance and mood logs of a date range with one row per day from first_day on. amounts holds the finance
+# columns in FINANCE_AMOUNT_COLUMNS order (NaN on days without a finance log) and mood_codes the index of the mood
+# in MOOD_NAMES (-1 on days without a mood). Both arrays are read only.
+WellnessArrays = namedtuple('WellnessArrays', ['first_day', 'amounts', 'mood_codes'])
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _get_cached(key, build):
+    """
+    returns a copy of the cached value for key, building and caching it when it is missing. The data versions are
+    part of the key, so writing a log makes the old values unreachable and they age out of the cache. Two threads
+    missing the same key at once both build it, as ChartCache does.
+    :param key:
+    :param build:
+    :return:
+    """
+    key = key + (get_data_version(FINANCE), get_data_version(MINDFULNESS))
+    with _cache_lock:
+        value = _cache.get(key)
+        if value is not None:
+            _cache.move_to_end(key)
+            return _copy_result(value)
+    value = build()
+    with _cache_lock:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > ANALYTICS_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return _copy_result(value)
+
+
+def _copy_result(value):
+    """
+    returns a copy of a cached value the caller may change. Dictionaries and lists are copied, tuples, numbers and
+    the read only arrays are shared
+    """
+    if isinstance(value, dict):
+        return {key: _copy_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_result(item) if isinstance(item, (dict, list)) else item for item in value]
+    return value
+
+
+def clear_analytics_cache():
+    """
+    forgets every cached array and result
+    :return:
+    """
+    with _cache_lock:
+        _cache.clear()
+
+
+def load_wellness_arrays(date1=None, date2=None):
+    """
+    loads the finance and mood logs between two dates into arrays with one row per day. Without dates the range
+    runs from the first to the last log.
+    :param date1:
+    :param date2:
+    :return: WellnessArrays
+    """
+    return _get_cached(('arrays', date1, date2), lambda: _build_wellness_arrays(date1, date2))
+
+
+def _build_wellness_arrays(date1, date2):
+    finance_rows = get_finance_amount_rows(date1, date2)
+    mood_rows = get_mood_rows(date1, date2)
+    finance_days = np.fromiter((row[0].toordinal() for row in finance_rows), dtype=np.int64,
+                               count=len(finance_rows))
+    mood_days = np.fromiter((row[0].toordinal() for row in mood_rows), dtype=np.int64, count=len(mood_rows))
+
+    if date1 is not None and date2 is not None:
+        first_ordinal, last_ordinal = date1.toordinal(), date2.toordinal()
+    elif finance_rows or mood_rows:
+        logged_days = np.concatenate([finance_days, mood_days])
+        first_ordinal, last_ordinal = int(logged_days.min()), int(logged_days.max())
+    else:
+        return _read_only_arrays(None, np.empty((0, len(FINANCE_AMOUNT_COLUMNS))), np.empty(0, dtype=np.int8))
+
+    day_count = max(last_ordinal - first_ordinal + 1, 0)
+    amounts = np.full((day_count, len(FINANCE_AMOUNT_COLUMNS)), np.nan)
+    if finance_rows:
+        # None amounts become NaN
+        amounts[finance_days - first_ordinal] = np.array([row[1:] for row in finance_rows], dtype=float)
+    mood_codes = np.full(day_count, -1, dtype=np.int8)
+    if mood_rows:
+        mood_codes[mood_days - first_ordinal] = np.fromiter((MOOD_CODES.get(row[1], -1) for row in mood_rows),
+                                                            dtype=np.int8, count=len(mood_rows))
+    return _read_only_arrays(date.fromordinal(first_ordinal), amounts, mood_codes)
+
+
+def _read_only_arrays(first_day, amounts, mood_codes):
+    # the arrays are cached and shared by every caller, so they are made read only
+    amounts.flags.writeable = False
+    mood_codes.flags.writeable = False
+    return WellnessArrays(first_day, amounts, mood_codes)
+
+
+def get_spending_series(arrays, column=TOTAL_EXPENSE):
+    """
+    returns the amount spent each day: one expense column, or the sum of the expense columns for TOTAL_EXPENSE.
+    Days without a finance log are NaN.
+    :param arrays: WellnessArrays
+    :param column: TOTAL_EXPENSE or one of the finance column names
+    :return:
+    """
+    if column == TOTAL_EXPENSE:
+        expense_indexes = [FINANCE_AMOUNT_COLUMNS.index(name) for name in EXPENSE_COLUMNS]
+        expenses = arrays.amounts[:, expense_indexes]
+        logged = ~np.isnan(expenses).all(axis=1)
+        return np.where(logged, np.nansum(expenses, axis=1), np.nan)
+    if column not in FINANCE_AMOUNT_COLUMNS:
+        raise ValueError(f"column must be {TOTAL_EXPENSE} or one of {', '.join(FINANCE_AMOUNT_COLUMNS)}")
+    return arrays.amounts[:, FINANCE_AMOUNT_COLUMNS.index(column)]
+
+
+def get_valence_series(arrays):
+    """
+    returns the valence of each day's mood, NaN on days without a mood
+    :param arrays: WellnessArrays
+    :return:
+    """
+    return np.where(arrays.mood_codes >= 0, _VALENCE_BY_CODE[np.maximum(arrays.mood_codes, 0)], np.nan)
+
+
+def calculate_spending_by_mood(date1=None, date2=None, column=TOTAL_EXPENSE, lag=0):
+    """
+    calculates the average amount spent on the days with each mood
+    :param date1:
+    :param date2:
+    :param column: TOTAL_EXPENSE or one of the finance column names
+    :param lag: compare each mood with the spending this many days later
+    :return: dictionary keyed by the lower case mood names of {'average_spending', 'days'}. average_spending is
+    None for moods without any day to average
+    """
+    _check_lag(lag, 'lag')
+    return _get_cached(('spending_by_mood', date1, date2, column, lag),
+                       lambda: _spending_by_mood(*_get_lagged_pairs(load_wellness_arrays(date1, date2), column, lag)))
+
+
+def _check_lag(lag, name):
+    """
+    raises ValueError for a negative number of days between the mood and the spending
+    """
+    if lag < 0:
+        raise ValueError(f"{name} must not be negative")
+
+
+def _get_lagged_pairs(arrays, column, lag):
+    """
+    returns the mood codes and the spending lag days later, both limited to the days that have both
+    """
+    spending = get_spending_series(arrays, column)
+    day_count = len(spending)
+    mood_codes = arrays.mood_codes[:max(day_count - lag, 0)]
+    spending = spending[lag:]
+    paired = (mood_codes >= 0) & ~np.isnan(spending)
+    return mood_codes[paired], spending[paired]
+
+
+def _spending_by_mood(mood_codes, spending):
+    days = np.bincount(mood_codes, minlength=len(MOOD_NAMES))
+    totals = np.bincount(mood_codes, weights=spending, minlength=len(MOOD_NAMES))
+    return {name.lower(): {'average_spending': float(totals[code] / days[code]) if days[code] else None,
+                           'days': int(days[code])}
+            for code, name in enumerate(MOOD_NAMES)}
+
+
+def _correlate(x, y):
+    """
+    returns the Pearson correlation of two arrays, None when there are fewer than two values or one does not vary
+    """
+    if len(x) < 2:
+        return None
+    x = x - x.mean()
+    y = y - y.mean()
+    denominator = np.sqrt((x * x).sum() * (y * y).sum())
+    if denominator == 0:
+        return None
+    return float((x * y).sum() / denominator)
+
+
+def calculate_mood_spending_correlation(date1=None, date2=None, column=TOTAL_EXPENSE, lag=0):
+    """
+    calculates the correlation between how pleasant the mood of a day was and the amount spent lag days later.
+    A negative value means more is spent after unpleasant moods.
+    :param date1:
+    :param date2:
+    :param column: TOTAL_EXPENSE or one of the finance column names
+    :param lag:
+    :return: {'correlation', 'days'}. correlation is None when it cannot be calculated
+    """
+    _check_lag(lag, 'lag')
+
+    def build():
+        mood_codes, spending = _get_lagged_pairs(load_wellness_arrays(date1, date2), column, lag)
+        return {'correlation': _correlate(_VALENCE_BY_CODE[mood_codes], spending), 'days': len(spending)}
+    return _get_cached(('correlation', date1, date2, column, lag), build)
+
+
+def calculate_rolling_mood_spending_correlation(date1=None, date2=None, column=TOTAL_EXPENSE, window=30,
+                                                min_days=10):
+    """
+    calculates the correlation between mood valence and spending over a window of days ending on each day of the
+    range. The window sums are taken from cumulative sums, so the cost does not depend on the window length.
+    :param date1:
+    :param date2:
+    :param column: TOTAL_EXPENSE or one of the finance column names
+    :param window: the number of days in each window
+    :param min_days: the fewest days with both a mood and a finance log a window needs to get a correlation
+    :return: list of (last day of the window, correlation or None) tuples
+    """
+    return _get_cached(('rolling_correlation', date1, date2, column, window, min_days),
+                       lambda: _rolling_correlation(load_wellness_arrays(date1, date2), column, window, min_days))
+
+
+def _rolling_correlation(arrays, column, window, min_days):
+    valence = get_valence_series(arrays)
+    spending = get_spending_series(arrays, column)
+    day_count = len(spending)
+    if day_count < window:
+        return []
+    paired = ~np.isnan(valence) & ~np.isnan(spending)
+    x = np.where(paired, valence, 0.0)
+    y = np.where(paired, spending, 0.0)
+
+    def window_sums(values):
+        cumulative = np.concatenate([[0.0], np.cumsum(values, dtype=float)])
+        return cumulative[window:] - cumulative[:-window]
+
+    n = window_sums(paired)
+    sum_x, sum_y = window_sums(x), window_sums(y)
+    covariance = n * window_sums(x * y) - sum_x * sum_y
+    variance_x = n * window_sums(x * x) - sum_x * sum_x
+    variance_y = n * window_sums(y * y) - sum_y * sum_y
+    # the differences of cumulative sums leave rounding noise where a window does not vary at all
+    valid = (n >= min_days) & (variance_x > 1e-9 * np.maximum(n * n, 1)) & \
+            (variance_y > 1e-9 * np.maximum(sum_y * sum_y, 1))
+    correlation = np.full(len(n), np.nan)
+    correlation[valid] = covariance[valid] / np.sqrt(variance_x[valid] * variance_y[valid])
+    np.clip(correlation, -1.0, 1.0, out=correlation)
+
+    first_window_end = arrays.first_day + timedelta(days=window - 1)
+    return [(first_window_end + timedelta(days=offset), None if np.isnan(value) else float(value))
+            for offset, value in enumerate(correlation)]
+
+
+def calculate_mood_spending_lag_effects(date1=None, date2=None, column=TOTAL_EXPENSE, max_lag=7):
+    """
+    calculates how a mood relates to the spending on each of the following days
+    :param date1:
+    :param date2:
+    :param column: TOTAL_EXPENSE or one of the finance column names
+    :param max_lag: the largest number of days between the mood and the spending
+    :return: list of {'lag', 'correlation', 'days', 'spending_by_mood'} dictionaries for lags 0 to max_lag
+    """
+    _check_lag(max_lag, 'max_lag')
+
+    def build():
+        arrays = load_wellness_arrays(date1, date2)
+        effects = []
+        for lag in range(max_lag + 1):
+            mood_codes, spending = _get_lagged_pairs(arrays, column, lag)
+            effects.append({'lag': lag,
+                            'correlation': _correlate(_VALENCE_BY_CODE[mood_codes], spending),
+                            'days': len(spending),
+                            'spending_by_mood': _spending_by_mood(mood_codes, spending)})
+        return effects
+    return _get_cached(('lag_effects', date1, date2, column, max_lag), build)
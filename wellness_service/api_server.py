@@ -0,0 +1,594 @@
+"""
+This script file holds an optional HTTP/JSON server over the wellness services, so other local tools, or a phone
+on the same network, can read and write logs while the application is open. The application checks for changes
+made by other processes every few seconds and refreshes its screens.
+
+    python -m wellness_service.api_server --port 8765
+    python -m wellness_service.api_server --host 0.0.0.0 --token SECRET
+
+The server runs on asyncio and hands every database call to a thread pool, whose threads each get a session from
+the connection pool, so a slow request does not hold up the others. It only listens on localhost unless --host is
+given; when it listens on the network, set --token so clients must send "Authorization: Bearer <token>".
+
+Endpoints, with dates written YYYY-MM-DD and bodies and responses in JSON:
+    GET    /version                                   the data generation of the database
+    GET    /finance?from=&to=                         finance logs, every log without a range
+    GET    /finance/breakdown?from=&to=               the financial breakdown
+    GET    /finance/<date>                            PUT {"income": ..., "grocery_expense": ...,
+                                                      "utility_expense": ..., "rent": ..., "food_expense": ...,
+                                                      "misc_expense": ...} to write it, DELETE to remove it
+    GET    /mindfulness?from=&to=                     moods
+    GET    /mindfulness/breakdown?from=&to=           the mood breakdown, or ?period=week|month&key=
+    GET    /mindfulness/<date>                        PUT {"mood": "happy"} to write it, DELETE to remove it
+    GET    /journal?before=&limit=                    journal summaries, newest first
+    GET    /journal?q=&from=&to=                      journal search
+    GET    /journal/<date>                            PUT {"title": ..., "entry": ...} to write it, DELETE to remove it
+    GET    /days?from=&to=                            the finance log, mood and journal title of each day
+
+Every GET response has an ETag made of the data generation and the request path. The generation goes up whenever
+PRAGMA data_version shows that any connection, in this process or another, committed a change. A request with a
+matching If-None-Match is answered 304 without touching the database, and unchanged responses are served from a
+small cache.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from database.database import DBConnection
+from database.enumerations import Mood
+from database.finance_data_persistence import get_all_finance_data_between_dates, FINANCE_AMOUNT_COLUMNS
+from database.migrations import upgrade_database
+from database.mindfulness_data_persistence import get_all_mindfulness_data_between_dates, get_mood_period_key, \
+    get_mood_period_start
+from wellness_service.dashboard import get_days_overview
+from wellness_service.financial_wellness import calculate_financial_breakdown, calculate_financial_breakdown_by_date, \
+    get_all_financial_wellness_data, get_financial_wellness_data, insert_financial_wellness_data, \
+    update_financial_wellness_data, delete_financial_wellness_data
+from wellness_service.journal import get_journal_summaries, get_journal_by_date, get_journals_between_dates, \
+    search_journals, insert_journal_log, update_journal, delete_journal
+from wellness_service.mindfulness import calculate_mood_breakdown, calculate_mood_breakdown_by_date, \
+    calculate_mood_breakdown_for_period, get_mindfulness_data_history, get_mindfulness_data, insert_mindfulness_log, \
+    update_mindfulness_data, delete_mindfulness_data
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+
+# Requests larger than this are refused
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADER_LINES = 100
+
+# The number of GET responses kept for the current data generation
+RESPONSE_CACHE_SIZE = 256
+
+# The most journal summaries a page returns
+MAX_PAGE_SIZE = 500
+
+
+class ApiError(Exception):
+    """
+    ApiError is raised by a handler to answer with an error status and message
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class DataGeneration(object):
+    """
+    DataGeneration numbers the states of the database. It keeps its own connection and reads PRAGMA data_version,
+    which changes whenever another connection commits, so writes made through the server, by the application or by
+    any other process are all noticed. Only the event loop thread uses it.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.data_version = None
+        self.generation = 0
+        # changes on every start, so an ETag from an earlier run never matches
+        self.instance = uuid.uuid4().hex[:8]
+
+    def current(self):
+        """
+        Returns the generation, bumping it if the database changed since the last call
+        :return:
+        """
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.data_version:
+            self.data_version = data_version
+            self.generation += 1
+        return self.generation
+
+    def get_etag(self, generation, target):
+        """
+        Returns the ETag of a response for a generation and request path
+        :param generation:
+        :param target: the path and query string of the request
+        :return:
+        """
+        digest = hashlib.sha1(f"{self.instance}:{generation}:{target}".encode('utf-8')).hexdigest()[:20]
+        return f'"{digest}"'
+
+    def close(self):
+        self.connection.close()
+
+
+def to_json_data(value):
+    """
+    returns the values the services return as plain lists, dictionaries, strings and numbers. Named tuples become
+    objects rather than arrays, and model objects become objects of their columns
+    :param value:
+    :return:
+    """
+    if isinstance(value, date):
+        return value.isoformat()
+    if hasattr(value, '_asdict'):
+        return {name: to_json_data(item) for name, item in value._asdict().items()}
+    if hasattr(value, '__table__'):
+        return {column.name: to_json_data(getattr(value, column.name)) for column in value.__table__.columns}
+    if isinstance(value, dict):
+        return {key: to_json_data(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_data(item) for item in value]
+    return value
+
+
+def parse_date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be a date in YYYY-MM-DD format")
+
+
+def get_date_range(query):
+    """
+    returns the from and to dates of a query string, (None, None) when neither is given
+    :param query:
+    :return:
+    """
+    if 'from' not in query and 'to' not in query:
+        return None, None
+    date_from = parse_date(query['from'], 'from') if 'from' in query else date.min
+    date_to = parse_date(query['to'], 'to') if 'to' in query else date.max
+    if date_from > date_to:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "from must not be after to")
+    return date_from, date_to
+
+
+def get_int(query, name, default, maximum):
+    try:
+        value = int(query.get(name, default))
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be a whole number")
+    if not 0 < value <= maximum:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be between 1 and {maximum}")
+    return value
+
+
+def require_found(value, description):
+    if value is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, f"there is no {description}")
+    return value
+
+
+def save_log(exists, insert, update):
+    """
+    writes a log, replacing the log of the same date
+    :param exists: True when the date already has a log
+    :param insert:
+    :param update:
+    :return: (status, response)
+    """
+    if exists:
+        update()
+        return HTTPStatus.OK, {'updated': True}
+    insert()
+    return HTTPStatus.CREATED, {'created': True}
+
+
+def delete_log(exists, delete, description):
+    require_found(True if exists else None, description)
+    delete()
+    return HTTPStatus.OK, {'deleted': True}
+
+
+def list_finance(query, body):
+    date_from, date_to = get_date_range(query)
+    if date_from is None:
+        return get_all_financial_wellness_data()
+    return get_all_finance_data_between_dates(date_from, date_to)
+
+
+def finance_breakdown(query, body):
+    date_from, date_to = get_date_range(query)
+    if date_from is None:
+        return calculate_financial_breakdown()
+    return calculate_financial_breakdown_by_date(date_from, date_to)
+
+
+def get_finance(query, body, day):
+    return require_found(get_financial_wellness_data(day), f"finance log for {day}")
+
+
+def put_finance(query, body, day):
+    unknown = sorted(set(body) - set(FINANCE_AMOUNT_COLUMNS))
+    if unknown:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"unknown fields {', '.join(unknown)}, a finance log has "
+                                               f"{', '.join(FINANCE_AMOUNT_COLUMNS)}")
+    amounts = []
+    for column in FINANCE_AMOUNT_COLUMNS:
+        if column not in body:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"{column} is required, a finance log has "
+                                                   f"{', '.join(FINANCE_AMOUNT_COLUMNS)}")
+        value = body[column]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"{column} must be a number")
+        amounts.append(float(value))
+    if not any(amounts):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "a finance log needs at least one amount that is not 0")
+    return save_log(get_financial_wellness_data(day) is not None,
+                    lambda: insert_financial_wellness_data(*amounts, day),
+                    lambda: update_financial_wellness_data(*amounts, day))
+
+
+def delete_finance(query, body, day):
+    return delete_log(get_financial_wellness_data(day) is not None, lambda: delete_financial_wellness_data(day),
+                      f"finance log for {day}")
+
+
+def list_mindfulness(query, body):
+    date_from, date_to = get_date_range(query)
+    if date_from is None:
+        return get_mindfulness_data_history()
+    return get_all_mindfulness_data_between_dates(date_from, date_to)
+
+
+def mindfulness_breakdown(query, body):
+    if 'period' in query:
+        period, key = query['period'], query.get('key')
+        if period not in ('week', 'month') or key is None:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "period must be week or month, with the key of the period")
+        try:
+            valid = get_mood_period_key(period, get_mood_period_start(period, key)) == key
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "key must look like 2024-W05 for a week or 2024-05 for a month")
+        return calculate_mood_breakdown_for_period(period, key)
+    date_from, date_to = get_date_range(query)
+    if date_from is None:
+        return calculate_mood_breakdown()
+    return calculate_mood_breakdown_by_date(date_from, date_to)
+
+
+def get_mindfulness(query, body, day):
+    return require_found(get_mindfulness_data(day), f"mood for {day}")
+
+
+def put_mindfulness(query, body, day):
+    mood = str(body.get('mood', '')).strip().upper()
+    if mood not in Mood.__members__:
+        raise ApiError(HTTPStatus.BAD_REQUEST,
+                       f"mood must be one of {', '.join(name.lower() for name in Mood.__members__)}")
+    return save_log(get_mindfulness_data(day) is not None,
+                    lambda: insert_mindfulness_log(mood, day),
+                    lambda: update_mindfulness_data(mood, day))
+
+
+def delete_mindfulness(query, body, day):
+    return delete_log(get_mindfulness_data(day) is not None, lambda: delete_mindfulness_data(day),
+                      f"mood for {day}")
+
+
+def list_journals(query, body):
+    date_from, date_to = get_date_range(query)
+    if 'q' in query:
+        return search_journals(query['q'], (date_from, date_to) if date_from else None,
+                               get_int(query, 'limit', 50, MAX_PAGE_SIZE))
+    if date_from is not None:
+        return get_journals_between_dates(date_from, date_to)
+    before = parse_date(query['before'], 'before') if 'before' in query else None
+    return get_journal_summaries(before, get_int(query, 'limit', 50, MAX_PAGE_SIZE))
+
+
+def get_journal(query, body, day):
+    return require_found(get_journal_by_date(day), f"journal for {day}")
+
+
+def put_journal(query, body, day):
+    title, entry = body.get('title'), body.get('entry')
+    if not isinstance(title, str) or not isinstance(entry, str) or not title.strip() or not entry.strip():
+        raise ApiError(HTTPStatus.BAD_REQUEST, "a journal needs a title and an entry")
+    return save_log(get_journal_by_date(day) is not None,
+                    lambda: insert_journal_log(title, entry, day),
+                    lambda: update_journal(title, entry, day))
+
+
+def delete_journal_log(query, body, day):
+    return delete_log(get_journal_by_date(day) is not None, lambda: delete_journal(day), f"journal for {day}")
+
+
+def list_days(query, body):
+    date_from, date_to = get_date_range(query)
+    if date_from is None or date_from == date.min or date_to == date.max:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "from and to are required")
+    return get_days_overview(date_from, date_to)
+
+
+# path: {method: handler}. Handlers of /<domain>/<date> paths also get the date
+ROUTES = {
+    '/finance': {'GET': list_finance},
+    '/finance/breakdown': {'GET': finance_breakdown},
+    '/finance/<date>': {'GET': get_finance, 'PUT': put_finance, 'DELETE': delete_finance},
+    '/mindfulness': {'GET': list_mindfulness},
+    '/mindfulness/breakdown': {'GET': mindfulness_breakdown},
+    '/mindfulness/<date>': {'GET': get_mindfulness, 'PUT': put_mindfulness, 'DELETE': delete_mindfulness},
+    '/journal': {'GET': list_journals},
+    '/journal/<date>': {'GET': get_journal, 'PUT': put_journal, 'DELETE': delete_journal_log},
+    '/days': {'GET': list_days},
+}
+
+
+def find_route(path):
+    """
+    returns (methods dictionary, extra handler arguments) of a path
+    :param path:
+    :return:
+    """
+    path = path.rstrip('/') or '/'
+    if path in ROUTES:
+        return ROUTES[path], ()
+    domain, _, last = path.rpartition('/')
+    methods = ROUTES.get(domain + '/<date>')
+    if methods is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, f"there is no endpoint {path}")
+    return methods, (parse_date(last, 'the date in the path'),)
+
+
+class ApiServer(object):
+    """
+    ApiServer answers the HTTP requests. Request parsing and ETag checks run on the event loop, the handlers run
+    on the thread pool
+    """
+
+    def __init__(self, database_path, workers=DEFAULT_WORKERS, token=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wellness-api')
+        self.generation = DataGeneration(database_path)
+        self.token = token
+        self.response_cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves the requests of one connection until the client closes it or asks to
+        :param reader:
+        :param writer:
+        :return:
+        """
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload, extra_headers = await self.respond(method, target, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.write_response(writer, status, payload, extra_headers, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ApiError as error:
+            self.write_response(writer, error.status, {'error': error.message}, {}, False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        """
+        Reads one request
+        :param reader:
+        :return: (method, target, headers, body), or None when the client closed the connection
+        """
+        request_line = await self.read_line(reader)
+        if not request_line.strip():
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').split()
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "malformed request line")
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = (await self.read_line(reader)).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise ApiError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "too many headers")
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Content-Length must be a whole number")
+        if length < 0:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Content-Length must not be negative")
+        if length > MAX_BODY_BYTES:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "the body is too large")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    async def read_line(reader):
+        """
+        Reads one line of the request line or headers
+        :param reader:
+        :return:
+        """
+        try:
+            return await reader.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            # readline() raises ValueError when a line is longer than the stream's limit
+            raise ApiError(HTTPStatus.BAD_REQUEST, "a request line or header is too long")
+
+    async def respond(self, method, target, headers, body):
+        """
+        Returns (status, payload, extra headers) of a request
+        :param method:
+        :param target:
+        :param headers:
+        :param body:
+        :return:
+        """
+        if self.token is not None and headers.get('authorization') != f"Bearer {self.token}":
+            return HTTPStatus.UNAUTHORIZED, {'error': "a valid bearer token is required"}, {}
+        url = urlsplit(target)
+        path = unquote(url.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if path == '/version':
+                generation = self.generation.current()
+                return HTTPStatus.OK, {'generation': generation, 'instance': self.generation.instance}, {}
+            methods, arguments = find_route(path)
+            handler = methods.get(method)
+            if handler is None:
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"{method} is not allowed on {path}"}, \
+                    {'Allow': ", ".join(methods)}
+            if method == 'GET':
+                return await self.respond_cached(handler, target, headers, query, arguments)
+            try:
+                data = json.loads(body or b'{}')
+            except ValueError:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "the body must be JSON")
+            if not isinstance(data, dict):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "the body must be a JSON object")
+            status, payload = await self.run(handler, query, data, *arguments)
+            return status, payload, {}
+        except ApiError as error:
+            return error.status, {'error': error.message}, {}
+        except Exception as error:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(error).__name__}: {error}"}, {}
+
+    async def respond_cached(self, handler, target, headers, query, arguments):
+        """
+        Answers a GET request from the ETag or the response cache when the data did not change, and runs the handler
+        otherwise
+        :return: (status, payload, extra headers)
+        """
+        generation = self.generation.current()
+        etag = self.generation.get_etag(generation, target)
+        if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            return HTTPStatus.NOT_MODIFIED, None, {'ETag': etag}
+        with self.cache_lock:
+            cached = self.response_cache.get(target)
+            if cached is not None and cached[0] == generation:
+                self.response_cache.move_to_end(target)
+                return HTTPStatus.OK, cached[1], {'ETag': etag}
+        payload = await self.run(handler, query, None, *arguments)
+        # a write committed while the handler ran makes the response belong to the new generation
+        if self.generation.current() != generation:
+            return HTTPStatus.OK, payload, {}
+        encoded = self.encode(payload)
+        with self.cache_lock:
+            self.response_cache[target] = (generation, encoded)
+            self.response_cache.move_to_end(target)
+            while len(self.response_cache) > RESPONSE_CACHE_SIZE:
+                self.response_cache.popitem(last=False)
+        return HTTPStatus.OK, encoded, {'ETag': etag}
+
+    async def run(self, handler, *arguments):
+        """
+        Runs a handler on the thread pool
+        :param handler:
+        :param arguments:
+        :return:
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, handler, *arguments)
+
+    @staticmethod
+    def encode(payload):
+        return json.dumps(to_json_data(payload)).encode('utf-8')
+
+    def write_response(self, writer, status, payload, extra_headers, keep_alive):
+        """
+        Writes a response. payload is either JSON bytes already encoded, a value to encode or None for no body
+        :return:
+        """
+        if payload is None:
+            body = b''
+        elif isinstance(payload, bytes):
+            body = payload
+        else:
+            body = self.encode(payload)
+        status = HTTPStatus(status)
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}",
+                 "Content-Type: application/json; charset=utf-8",
+                 f"Content-Length: {len(body)}",
+                 # clients may keep responses but must check the ETag before using them
+                 "Cache-Control: no-cache",
+                 "Connection: " + ("keep-alive" if keep_alive else "close")]
+        lines += [f"{name}: {value}" for name, value in extra_headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.generation.close()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS, token=None):
+    """
+    Runs the server until it is cancelled
+    :param host:
+    :param port:
+    :param workers: the number of threads running database calls, the connection pool is sized to match
+    :param token: the bearer token clients must send, None to accept every client
+    :return:
+    """
+    connection = DBConnection()
+    if connection.POOL_SIZE < workers:
+        connection.set_pool_size(workers)
+    upgrade_database()
+    api_server = ApiServer(connection.get_database_path(), workers, token)
+    server = await asyncio.start_server(api_server.handle_connection, host, port)
+    addresses = ", ".join(f"{socket.getsockname()[0]}:{socket.getsockname()[1]}" for socket in server.sockets)
+    print(f"Serving the wellness API on {addresses}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        api_server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m wellness_service.api_server',
+                                     description="Serve the wellness services as a JSON API.")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help="the address to listen on, 0.0.0.0 for every network (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="(default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="the threads running database calls (default: %(default)s)")
+    parser.add_argument('--token', help="require clients to send this bearer token")
+    parser.add_argument('--db', metavar='PATH', help="the database file to use instead of the application's")
+    arguments = parser.parse_args(argv)
+    if arguments.db:
+        DBConnection().use_database(arguments.db)
+    if arguments.host not in ('127.0.0.1', 'localhost', '::1') and arguments.token is None:
+        print("Warning: listening on the network without --token, anyone on the network can read and change logs")
+    try:
+        asyncio.run(serve(arguments.host, arguments.port, arguments.workers, arguments.token))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
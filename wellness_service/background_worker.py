@@ -0,0 +1,144 @@
+"""
+This script file holds the background worker used to keep database queries and chart aggregation off the
+GUI thread. Tasks run on a small thread pool and their results are queued until the GUI thread collects them
+with poll(), so the callbacks always run on the thread that owns the widgets.
+"""
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database.instrumentation import query_origin
+from wellness_service.profiling import profiler
+
+
+class WorkerRequest(object):
+    """
+    WorkerRequest describes a task submitted to the BackgroundWorker
+    """
+
+    def __init__(self, request_id, channel, on_done, on_error, on_cancel):
+        self.request_id = request_id
+        self.channel = channel
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.cancelled = False
+        self.future = None
+        self.submitted_at = time.perf_counter()
+
+
+class BackgroundWorker(object):
+    """
+    BackgroundWorker runs tasks on a thread pool and hands their results back through poll().
+    Every task is submitted on a channel (for example the name of the screen that asked for it). Only the newest
+    request of a channel is kept: submitting again, or calling cancel(), cancels the older request so a result
+    that is no longer wanted is never delivered. submit(), cancel() and poll() must be called from the same thread.
+    """
+
+    def __init__(self, max_workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wellness-worker')
+        self.results = queue.Queue()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.request_ids = itertools.count(1)
+
+    def submit(self, channel, task, on_done, on_error=None, on_cancel=None):
+        """
+        Runs task() on a worker thread. on_done(result) or on_error(exception) is called by poll() once the task
+        finishes. on_cancel() is called if the request is cancelled before its result is delivered.
+        When on_error is not given the exception is raised from poll().
+        :param channel:
+        :param task:
+        :param on_done:
+        :param on_error:
+        :param on_cancel:
+        :return:
+        """
+        self.cancel(channel)
+        request = WorkerRequest(next(self.request_ids), channel, on_done, on_error, on_cancel)
+        with self.lock:
+            self.pending[channel] = request
+        request.future = self.executor.submit(self.run_task, request, task)
+        return request
+
+    def run_task(self, request, task):
+        """
+        Runs a task on a worker thread and queues the outcome. The statements the task runs are recorded under the
+        screen of its channel
+        :param request:
+        :param task:
+        :return:
+        """
+        if request.cancelled:
+            return
+        try:
+            with query_origin(request.channel.split('.')[0]):
+                result = task()
+            self.results.put((request, result, None))
+        except Exception as error:
+            self.results.put((request, None, error))
+
+    def cancel(self, channel):
+        """
+        Cancels the pending request of a channel. A task that has not started yet is skipped, and the result of a
+        task that is already running is thrown away.
+        :param channel:
+        :return:
+        """
+        with self.lock:
+            request = self.pending.pop(channel, None)
+        if request is None:
+            return
+        request.cancelled = True
+        if request.future is not None:
+            request.future.cancel()
+        if request.on_cancel is not None:
+            request.on_cancel()
+
+    def has_pending(self, channel):
+        """
+        Returns True when the channel has a request whose result has not been delivered yet
+        :param channel:
+        :return:
+        """
+        with self.lock:
+            return channel in self.pending
+
+    def poll(self):
+        """
+        Delivers the results of finished tasks by calling their callbacks on the calling thread. When the profiler
+        is on, the time from submit() to delivery and the time spent in the callback are recorded for the screen
+        :return:
+        """
+        while True:
+            try:
+                request, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return
+            with self.lock:
+                if request.cancelled or self.pending.get(request.channel) is not request:
+                    continue
+                del self.pending[request.channel]
+            screen = request.channel.split('.')[0]
+            profiler.record(screen, "worker wait", time.perf_counter() - request.submitted_at)
+            with profiler.measure("worker result", screen):
+                if error is None:
+                    request.on_done(result)
+                elif request.on_error is not None:
+                    request.on_error(error)
+                else:
+                    raise error
+
+    def shutdown(self):
+        """
+        Stops the worker threads. Tasks that have not started are dropped
+        :return:
+        """
+        with self.lock:
+            requests = list(self.pending.values())
+            self.pending.clear()
+        for request in requests:
+            request.cancelled = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
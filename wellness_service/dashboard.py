@@ -0,0 +1,65 @@
+"""
+This script file handles the functions for the dashboard, which shows the finance, mood and journal logs of each
+day side by side
+"""
+import calendar
+from datetime import date, timedelta
+
+from database.snapshot_persistence import get_daily_snapshots, get_daily_snapshot, DailySnapshot
+
+
+def get_day_overview(day):
+    """
+    get the finance log, mood and journal title of one day
+    :param day:
+    :return: DailySnapshot, or None if nothing was logged that day
+    """
+    return get_daily_snapshot(day)
+
+
+def get_days_overview(date1, date2, include_empty_days=False):
+    """
+    get the finance log, mood and journal title of each day between two dates in one query
+    :param date1:
+    :param date2:
+    :param include_empty_days: also return the days with nothing logged, so every day of the range is listed
+    :return: list of DailySnapshot, oldest first
+    """
+    snapshots = get_daily_snapshots(date1, date2)
+    if not include_empty_days:
+        return snapshots
+    logged_days = {snapshot.snapshot_date: snapshot for snapshot in snapshots}
+    return [logged_days.get(date1 + timedelta(days=offset), DailySnapshot(date1 + timedelta(days=offset),
+                                                                          None, None, None))
+            for offset in range((date2 - date1).days + 1)]
+
+
+def get_month_range(year, month):
+    """
+    get the first and last day of a month
+    :param year:
+    :param month:
+    :return: (first day, last day)
+    """
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def step_month(year, month, steps):
+    """
+    get the month a number of months before (negative steps) or after a month
+    :param year:
+    :param month:
+    :param steps:
+    :return: (year, month)
+    """
+    year_offset, month_index = divmod(month - 1 + steps, 12)
+    return year + year_offset, month_index + 1
+
+
+def get_total_expense(finance):
+    """
+    get the sum of the expense amounts of a day's finance log
+    :param finance: the finance dictionary of a DailySnapshot
+    :return:
+    """
+    return sum(amount or 0 for column, amount in finance.items() if column != 'income')
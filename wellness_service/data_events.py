@@ -0,0 +1,98 @@
+"""
+This script file holds the in process change notification bus. The wellness service write functions publish the
+table they changed, and screens subscribe so they only recompute charts and lists when their data has changed.
+Changes committed by other processes, such as the API server or the command line, are published by an
+ExternalChangeWatcher that the application checks periodically.
+"""
+import sqlite3
+import threading
+
+FINANCE = 'finance'
+MINDFULNESS = 'mindfulness'
+JOURNAL = 'journal'
+TABLES = (FINANCE, MINDFULNESS, JOURNAL)
+
+_lock = threading.Lock()
+_versions = {}
+_subscribers = {}
+
+
+def get_data_version(table):
+    """
+    returns the version of a table. The version goes up by one every time the table is changed
+    :param table:
+    :return:
+    """
+    with _lock:
+        return _versions.get(table, 0)
+
+
+def subscribe(table, callback):
+    """
+    registers callback(table, version) to be called whenever the table changes.
+    The callback runs on the thread that made the change, so it should only record that the data is stale.
+    :param table:
+    :param callback:
+    :return:
+    """
+    with _lock:
+        _subscribers.setdefault(table, []).append(callback)
+
+
+def unsubscribe(table, callback):
+    """
+    removes a callback registered with subscribe
+    :param table:
+    :param callback:
+    :return:
+    """
+    with _lock:
+        if callback in _subscribers.get(table, []):
+            _subscribers[table].remove(callback)
+
+
+def publish_data_change(table):
+    """
+    bumps the version of a table and notifies its subscribers. Called after a write has been committed
+    :param table:
+    :return:
+    """
+    with _lock:
+        version = _versions.get(table, 0) + 1
+        _versions[table] = version
+        callbacks = list(_subscribers.get(table, []))
+    for callback in callbacks:
+        callback(table, version)
+
+
+class ExternalChangeWatcher(object):
+    """
+    ExternalChangeWatcher publishes the changes committed by other processes, which never call publish_data_change()
+    in this one. It keeps its own connection and reads PRAGMA data_version, which changes whenever another
+    connection commits. SQLite does not say which table changed, so every table is published. Commits made through
+    this process's own connections move data_version as well, so they are published a second time by the next
+    check. Only the thread that created the watcher may use it.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.data_version = self.read_data_version()
+
+    def read_data_version(self):
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def check(self):
+        """
+        Publishes a change of every table if the database changed since the last check
+        :return: True when the database changed
+        """
+        data_version = self.read_data_version()
+        if data_version == self.data_version:
+            return False
+        self.data_version = data_version
+        for table in TABLES:
+            publish_data_change(table)
+        return True
+
+    def close(self):
+        self.connection.close()
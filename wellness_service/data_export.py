@@ -0,0 +1,208 @@
+"""
+This script file handles exporting the finance, mood and journal logs to files for backups or analysis.
+
+Rows are streamed from the database in chunks and written as they arrive, so memory use stays the same no matter
+how large the database is. The supported formats are
+    csv       a CSV file with a header row of column names
+    jsonl     JSON Lines, one JSON object per log
+    columnar  gzip compressed JSON Lines holding one row group per line, each row group storing its rows column
+              by column
+    parquet   Apache Parquet, written one row group per chunk. This needs the optional pyarrow package
+CSV and JSON Lines exports use the model column names, so they can be imported again with data_import.
+"""
+import csv
+import gzip
+import json
+import os
+from datetime import date
+
+from database.database import Finance, Journal, Mindfulness
+from database.finance_data_persistence import iter_finance_logs
+from database.journal_data_persistence import iter_journal_logs
+from database.mindfulness_data_persistence import iter_mindfulness_logs
+
+# The number of rows read from the database and written at a time
+DEFAULT_CHUNK_SIZE = 1000
+
+# domain name: (model, function streaming the rows)
+EXPORT_DOMAINS = {
+    'finance': (Finance, iter_finance_logs),
+    'mindfulness': (Mindfulness, iter_mindfulness_logs),
+    'journal': (Journal, iter_journal_logs),
+}
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'columnar', 'parquet')
+
+# file extension used for each format by export_all
+EXPORT_EXTENSIONS = {'csv': '.csv', 'jsonl': '.jsonl', 'columnar': '.columnar.jsonl.gz', 'parquet': '.parquet'}
+
+
+def get_export_format(path):
+    """
+    returns the export format matching the extension of a file name
+    :param path:
+    :return:
+    """
+    lower_path = str(path).lower()
+    for export_format, extension in EXPORT_EXTENSIONS.items():
+        if lower_path.endswith(extension):
+            return export_format
+    if lower_path.endswith('.gz'):
+        return 'columnar'
+    raise ValueError(f"{path}: cannot tell the export format, use one of {', '.join(EXPORT_FORMATS)}")
+
+
+def to_export_value(value):
+    """
+    converts a column value into a value that can be written to JSON
+    :param value:
+    :return:
+    """
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def chunked(rows, chunk_size):
+    """
+    yields lists of up to chunk_size rows
+    :param rows:
+    :param chunk_size:
+    :return:
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_csv(rows, columns, path):
+    """
+    writes rows to a CSV file with a header row
+    :param rows:
+    :param columns:
+    :param path:
+    :return: the number of rows written
+    """
+    written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([to_export_value(value) for value in row])
+            written += 1
+    return written
+
+
+def write_jsonl(rows, columns, path):
+    """
+    writes rows to a JSON Lines file, one object per row
+    :param rows:
+    :param columns:
+    :param path:
+    :return: the number of rows written
+    """
+    written = 0
+    with open(path, 'w', encoding='utf-8') as jsonl_file:
+        for row in rows:
+            jsonl_file.write(json.dumps(dict(zip(columns, map(to_export_value, row)))) + '\n')
+            written += 1
+    return written
+
+
+def write_columnar(rows, columns, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    writes rows to a gzip compressed JSON Lines file where each line is a row group of up to chunk_size rows
+    stored column by column: {"row_count": n, "columns": {"column name": [values...]}}.
+    The first line holds the list of column names.
+    :param rows:
+    :param columns:
+    :param path:
+    :param chunk_size:
+    :return: the number of rows written
+    """
+    written = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as columnar_file:
+        columnar_file.write(json.dumps({'columns': list(columns)}) + '\n')
+        for chunk in chunked(rows, chunk_size):
+            row_group = {column: [to_export_value(row[index]) for row in chunk]
+                         for index, column in enumerate(columns)}
+            columnar_file.write(json.dumps({'row_count': len(chunk), 'columns': row_group}) + '\n')
+            written += len(chunk)
+    return written
+
+
+def write_parquet(rows, columns, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    writes rows to a Parquet file, one row group per chunk. Needs the optional pyarrow package
+    :param rows:
+    :param columns:
+    :param path:
+    :param chunk_size:
+    :return: the number of rows written
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export needs the pyarrow package: pip install pyarrow")
+
+    written = 0
+    writer = None
+    try:
+        for chunk in chunked(rows, chunk_size):
+            table = pyarrow.table({column: [row[index] for row in chunk] for index, column in enumerate(columns)})
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            written += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pyarrow.parquet.write_table(pyarrow.table({column: [] for column in columns}), path)
+    return written
+
+
+def export_domain(domain, path, export_format=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    streams every log of a domain into a file
+    :param domain: 'finance', 'mindfulness' or 'journal'
+    :param path:
+    :param export_format: one of EXPORT_FORMATS, taken from the file extension when not given
+    :param chunk_size:
+    :return: the number of rows written
+    """
+    if domain not in EXPORT_DOMAINS:
+        raise ValueError(f"domain must be one of {', '.join(EXPORT_DOMAINS)}")
+    export_format = export_format or get_export_format(path)
+    model, iter_logs = EXPORT_DOMAINS[domain]
+    columns = [column.name for column in model.__table__.columns]
+    rows = iter_logs(chunk_size)
+    if export_format == 'csv':
+        return write_csv(rows, columns, path)
+    if export_format == 'jsonl':
+        return write_jsonl(rows, columns, path)
+    if export_format == 'columnar':
+        return write_columnar(rows, columns, path, chunk_size)
+    if export_format == 'parquet':
+        return write_parquet(rows, columns, path, chunk_size)
+    raise ValueError(f"export_format must be one of {', '.join(EXPORT_FORMATS)}")
+
+
+def export_all(directory, export_format='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    exports every domain into its own file in a directory, for example finance.csv
+    :param directory:
+    :param export_format: one of EXPORT_FORMATS
+    :param chunk_size:
+    :return: dictionary of domain to the number of rows written
+    """
+    os.makedirs(directory, exist_ok=True)
+    return {domain: export_domain(domain, os.path.join(directory, domain + EXPORT_EXTENSIONS[export_format]),
+                                  export_format, chunk_size)
+            for domain in EXPORT_DOMAINS}
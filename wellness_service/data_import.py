@@ -0,0 +1,168 @@
+"""
+This script file handles importing finance, mood and journal logs in bulk from CSV or JSON Lines files.
+
+Files are read one row at a time with generators and every row is validated against the model it is imported
+into. Valid rows are written in batches, each batch being a single transaction with one executemany upsert, so a
+row for a date that already has a log replaces that log.
+
+CSV files need a header row with the model's column names, for example
+    log_date,income,grocery_expense,utility_expense,rent,food_expense,misc_expense
+JSON Lines files hold one JSON object per line with the same keys.
+"""
+import csv
+import json
+from datetime import date, datetime
+from itertools import islice
+
+from database.database import Finance, Journal, Mindfulness
+from database.enumerations import Mood
+from database.finance_data_persistence import upsert_finance_logs
+from database.journal_data_persistence import upsert_journal_logs
+from database.mindfulness_data_persistence import upsert_mindfulness_logs, normalize_mood
+from wellness_service.data_events import publish_data_change, FINANCE, MINDFULNESS, JOURNAL
+
+# The number of rows written per transaction
+DEFAULT_BATCH_SIZE = 500
+
+# domain name: (model, function writing a batch of rows, table changed)
+IMPORT_DOMAINS = {
+    'finance': (Finance, upsert_finance_logs, FINANCE),
+    'mindfulness': (Mindfulness, upsert_mindfulness_logs, MINDFULNESS),
+    'journal': (Journal, upsert_journal_logs, JOURNAL),
+}
+
+
+class DataImportError(ValueError):
+    """
+    DataImportError is raised when a row of an import file is not valid. The message names the line of the file.
+    """
+    pass
+
+
+def read_csv_rows(path):
+    """
+    yields (line number, row dictionary) for every row of a CSV file with a header row
+    :param path:
+    :return:
+    """
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        reader = csv.DictReader(csv_file)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def read_jsonl_rows(path):
+    """
+    yields (line number, row dictionary) for every non blank line of a JSON Lines file
+    :param path:
+    :return:
+    """
+    with open(path, encoding='utf-8') as jsonl_file:
+        for line_number, line in enumerate(jsonl_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise DataImportError(f"line {line_number}: not valid JSON ({error.msg})")
+            if not isinstance(row, dict):
+                raise DataImportError(f"line {line_number}: expected a JSON object")
+            yield line_number, row
+
+
+def read_rows(path):
+    """
+    yields (line number, row dictionary) for every row of a .csv, .jsonl or .json (JSON Lines) file
+    :param path:
+    :return:
+    """
+    lower_path = str(path).lower()
+    if lower_path.endswith('.csv'):
+        return read_csv_rows(path)
+    if lower_path.endswith('.jsonl') or lower_path.endswith('.json'):
+        return read_jsonl_rows(path)
+    raise DataImportError(f"{path}: only .csv, .jsonl and .json files can be imported")
+
+
+def validate_row(model, row, line_number):
+    """
+    returns a copy of row with every column of the model converted to the column's python type.
+    Columns that are not part of the model are ignored.
+    :param model:
+    :param row:
+    :param line_number:
+    :return:
+    """
+    validated_row = {}
+    for column in model.__table__.columns:
+        value = row.get(column.name)
+        if value is None or (isinstance(value, str) and value.strip() == ''):
+            raise DataImportError(f"line {line_number}: {column.name} is missing")
+        python_type = column.type.python_type
+        try:
+            if python_type is date:
+                validated_row[column.name] = value if isinstance(value, date) else \
+                    datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+            elif python_type is float:
+                validated_row[column.name] = float(value)
+            else:
+                validated_row[column.name] = python_type(value)
+        except (TypeError, ValueError):
+            raise DataImportError(f"line {line_number}: {column.name} must be a {python_type.__name__}, "
+                                  f"got {value!r}")
+
+    if model is Mindfulness:
+        validated_row['user_mood'] = normalize_mood(validated_row['user_mood'])
+        if validated_row['user_mood'] not in Mood.__members__:
+            raise DataImportError(f"line {line_number}: user_mood must be one of {', '.join(Mood.__members__)}")
+    return validated_row
+
+
+def batched(rows, batch_size):
+    """
+    yields lists of up to batch_size items from rows
+    :param rows:
+    :param batch_size:
+    :return:
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_rows(domain, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    validates and writes (line number, row dictionary) pairs into the domain's table in batches.
+    Batches written before an invalid row stay written.
+    :param domain: 'finance', 'mindfulness' or 'journal'
+    :param rows:
+    :param batch_size:
+    :return: the number of rows imported
+    """
+    if domain not in IMPORT_DOMAINS:
+        raise DataImportError(f"domain must be one of {', '.join(IMPORT_DOMAINS)}")
+    model, write_batch, table = IMPORT_DOMAINS[domain]
+    validated_rows = (validate_row(model, row, line_number) for line_number, row in rows)
+    imported = 0
+    try:
+        for batch in batched(validated_rows, batch_size):
+            write_batch(batch)
+            imported += len(batch)
+    finally:
+        if imported:
+            publish_data_change(table)
+    return imported
+
+
+def import_file(domain, path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    imports a .csv or .jsonl file of logs into the domain's table
+    :param domain: 'finance', 'mindfulness' or 'journal'
+    :param path:
+    :param batch_size:
+    :return: the number of rows imported
+    """
+    return import_rows(domain, read_rows(path), batch_size)
@@ -1,17 +1,24 @@
 """
 This script file handles the retrieval and processing in finance data
 """
-from database.finance_data_persistence import get_all_finance_data, get_all_finance_data_between_dates, \
-    insert_finance_data, update_finance_log, delete_finance_log, get_finance_log_by_date
+from datetime import date
+
+from database.finance_data_persistence import get_all_finance_data, insert_finance_data, update_finance_log, \
+    delete_finance_log, get_finance_log_by_date, get_finance_rollup_totals, get_finance_totals, \
+    get_finance_totals_grouped, get_finance_log_dates, get_finance_log_date_range, FINANCE_AMOUNT_COLUMNS
+from wellness_service.data_events import publish_data_change, FINANCE
 
 
 def calculate_financial_breakdown():
     """
     This function returns a dictionary containing all financial logs
+    The totals are read from the all time rollup row instead of loading every finance log
     """
-    # Get the data
-    finance = get_all_finance_data()
-    return get_finance_breakdown_dictionary(finance)
+    totals = get_finance_rollup_totals()
+    if totals is None:
+        # the rollup row is missing when there are no logs or the rollup has not been built yet
+        totals = get_finance_totals()
+    return get_finance_breakdown_dictionary_from_totals(totals, totals['entry_count'])
 
 
 def calculate_financial_breakdown_by_date(date1, date2):
@@ -21,8 +28,53 @@ def calculate_financial_breakdown_by_date(date1, date2):
     :param date2:
     :return:
     """
-    finance = get_all_finance_data_between_dates(date1, date2)
-    return get_finance_breakdown_dictionary(finance)
+    totals = get_finance_totals(date1, date2)
+    return get_finance_breakdown_dictionary_from_totals(totals, totals['entry_count'])
+
+
+def calculate_financial_breakdown_grouped(date1, date2, group_by='month'):
+    """
+    This function returns a list of (bucket, financial breakdown dictionary) tuples between two dates,
+    one per day, week or month that has finance logs
+    :param date1:
+    :param date2:
+    :param group_by: 'day', 'week', 'month' or 'year'
+    :return:
+    """
+    return [(bucket, get_finance_breakdown_dictionary_from_totals(totals, totals['entry_count']))
+            for bucket, totals in get_finance_totals_grouped(date1, date2, group_by)]
+
+
+def calculate_financial_trend(date1, date2, group_by='month'):
+    """
+    This function returns a list of (first day of the bucket, totals dictionary) tuples between two dates, one per
+    day, week, month or year that has finance logs. The totals are the amounts summed per finance column, not the
+    percentages of the pie chart breakdown, so every bucket can be plotted on the same axis
+    :param date1:
+    :param date2:
+    :param group_by: 'day', 'week', 'month' or 'year'
+    :return:
+    """
+    return [(get_bucket_start_date(bucket), totals)
+            for bucket, totals in get_finance_totals_grouped(date1, date2, group_by)]
+
+
+def get_bucket_start_date(bucket):
+    """
+    This function returns the first day of a grouped finance bucket keyed 'YYYY-MM-DD', 'YYYY-MM' or 'YYYY'
+    :param bucket:
+    :return:
+    """
+    parts = [int(part) for part in bucket.split('-')]
+    return date(*(parts + [1] * (3 - len(parts))))
+
+
+def get_financial_wellness_date_range():
+    """
+    This function returns the dates of the first and last finance logs, (None, None) when there are none
+    :return:
+    """
+    return get_finance_log_date_range()
 
 
 def get_finance_breakdown_dictionary(finances):
@@ -31,22 +83,28 @@ def get_finance_breakdown_dictionary(finances):
     :param finances:
     :return:
     """
-    total_income = 0
-    total_grocery = 0
-    total_utility = 0
-    total_rent = 0
-    total_food = 0
-    total_misc = 0
-    # In order to display the data in the pie chart, the data must sum up to 100.
-    if len(finances) != 0:
+    totals = {column: 0 for column in FINANCE_AMOUNT_COLUMNS}
+    for finance in finances:
+        for column in FINANCE_AMOUNT_COLUMNS:
+            totals[column] += getattr(finance, column)
+    return get_finance_breakdown_dictionary_from_totals(totals, len(finances))
 
-        for finance in finances:
-            total_income += finance.income
-            total_grocery += finance.grocery_expense
-            total_utility += finance.utility_expense
-            total_rent += finance.rent
-            total_food += finance.food_expense
-            total_misc += finance.misc_expense
+
+def get_finance_breakdown_dictionary_from_totals(totals, entry_count):
+    """
+    This function creates the financial breakdown dictionary from the summed finance columns
+    :param totals: dictionary of the summed finance columns keyed by column name
+    :param entry_count: the number of finance logs that were summed
+    :return:
+    """
+    # In order to display the data in the pie chart, the data must sum up to 100.
+    if entry_count != 0:
+        total_income = totals['income']
+        total_grocery = totals['grocery_expense']
+        total_utility = totals['utility_expense']
+        total_rent = totals['rent']
+        total_food = totals['food_expense']
+        total_misc = totals['misc_expense']
 
         total_expense = total_grocery + total_utility + total_rent + total_food + total_misc
         # if the user has over spent, return a dictionary containing the amount over spent
@@ -54,6 +112,11 @@ def get_finance_breakdown_dictionary(finances):
             return {
                 'total_debt': total_income - total_expense
             }
+        elif total_income == 0:
+            # logs whose amounts are all 0 have nothing to break down
+            return {
+                'no_entries': 100
+            }
         else:
             financial_breakdown_dictionary = {'total_income': total_income,
                                               'total_grocery': ((total_grocery / total_income) * 100),
@@ -83,6 +146,7 @@ def insert_financial_wellness_data(income, grocery, utility, rent, food, misc, d
     :return:
     """
     insert_finance_data(income, grocery, utility, rent, food, misc, date)
+    publish_data_change(FINANCE)
 
 
 def update_financial_wellness_data(income, grocery, utility, rent, food, misc, date):
@@ -98,6 +162,7 @@ def update_financial_wellness_data(income, grocery, utility, rent, food, misc, d
     :return:
     """
     update_finance_log(income, grocery, utility, rent, food, misc, date)
+    publish_data_change(FINANCE)
 
 
 def delete_financial_wellness_data(date):
@@ -107,6 +172,7 @@ def delete_financial_wellness_data(date):
     :return:
     """
     delete_finance_log(date)
+    publish_data_change(FINANCE)
 
 
 def get_financial_wellness_data(date):
@@ -124,3 +190,13 @@ def get_all_financial_wellness_data():
     :return:
     """
     return get_all_finance_data()
+
+
+def get_financial_wellness_dates(before_date=None, limit=50):
+    """
+    Returns a page of finance log dates, newest first
+    :param before_date: the last date of the previous page
+    :param limit:
+    :return:
+    """
+    return get_finance_log_dates(before_date, limit)
@@ -2,7 +2,9 @@
 This script file handles the functions for interacting with the journal
 """
 from database.journal_data_persistence import insert_journal_data, get_all_journal_data, get_journal_log_by_date, \
-    get_all_journal_data_between_dates, update_journal_log, delete_journal_log
+    get_all_journal_data_between_dates, update_journal_log, delete_journal_log, get_journal_log_dates, \
+    search_journal_logs, get_journal_log_summaries
+from wellness_service.data_events import publish_data_change, JOURNAL
 
 
 def insert_journal_log(title, entry, date):
@@ -14,6 +16,7 @@ def insert_journal_log(title, entry, date):
     :return:
     """
     insert_journal_data(title, entry, date)
+    publish_data_change(JOURNAL)
 
 
 def get_journal_logs():
@@ -24,6 +27,27 @@ def get_journal_logs():
     return get_all_journal_data()
 
 
+def get_journal_dates(before_date=None, limit=50):
+    """
+    get a page of journal dates, newest first
+    :param before_date: the last date of the previous page
+    :param limit:
+    :return:
+    """
+    return get_journal_log_dates(before_date, limit)
+
+
+def get_journal_summaries(before_date=None, limit=50):
+    """
+    get a page of journal summaries (date, title, entry length and entry preview), newest first, without loading
+    the entry bodies
+    :param before_date: the last date of the previous page
+    :param limit:
+    :return:
+    """
+    return get_journal_log_summaries(before_date, limit)
+
+
 def get_journal_by_date(date):
     """
     Get the journal log by date
@@ -33,6 +57,19 @@ def get_journal_by_date(date):
     return get_journal_log_by_date(date)
 
 
+def search_journals(query, date_range=None, limit=50, highlight=('[', ']')):
+    """
+    search the journal titles and entries, best match first
+    :param query: the words to search for
+    :param date_range: optional (first date, last date) tuple limiting the search
+    :param limit: the maximum number of results
+    :param highlight: the text placed before and after each matched word
+    :return: list of dictionaries with journal_date, journal_title, snippet and rank
+    """
+    date1, date2 = date_range if date_range else (None, None)
+    return search_journal_logs(query, date1, date2, limit, highlight)
+
+
 def get_journals_between_dates(date1, date2):
     """
     get journals between dates
@@ -52,6 +89,7 @@ def update_journal(title, entry, date):
     :return:
     """
     update_journal_log(title, entry, date)
+    publish_data_change(JOURNAL)
 
 
 def delete_journal(date):
@@ -61,3 +99,4 @@ def delete_journal(date):
     :return:
     """
     delete_journal_log(date)
+    publish_data_change(JOURNAL)
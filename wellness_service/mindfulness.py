@@ -1,8 +1,15 @@
 """
 This script file handles the interactions for getting and processing the mindfulness data
 """
-from database.mindfulness_data_persistence import get_all_mindfulness_data, get_all_mindfulness_data_between_dates, \
-    get_mindfulness_log_by_date, insert_mindfulness_data, update_mindfulness_log, delete_mindfulness_log
+from collections import Counter
+from datetime import date
+
+from database.enumerations import Mood
+from database.mindfulness_data_persistence import get_all_mindfulness_data, get_mindfulness_log_by_date, \
+    insert_mindfulness_data, update_mindfulness_log, delete_mindfulness_log, get_mood_counts, normalize_mood, \
+    get_mood_period_key, get_mood_period_start, shift_mood_period_key, get_mood_rollup_series, get_mood_rollup_counts, \
+    get_mindfulness_log_dates, get_mood_counts_by_day, get_mindfulness_log_date_range
+from wellness_service.data_events import publish_data_change, MINDFULNESS
 
 
 def get_mindfulness_breakdown_dictionary(mindfulness):
@@ -11,47 +18,28 @@ def get_mindfulness_breakdown_dictionary(mindfulness):
     :param mindfulness:
     :return:
     """
-    total_moods_logged = 0
-    total_happy = 0
-    total_sad = 0
-    total_frustrated = 0
-    total_content = 0
-    total_stressed = 0
-    total_grateful = 0
-    if len(mindfulness) != 0:
-        for mindful in mindfulness:
-            total_moods_logged += 1
-            if mindful.user_mood.upper() == 'HAPPY':
-                total_happy += 1
-            elif mindful.user_mood.upper() == 'SAD':
-                total_sad += 1
-            elif mindful.user_mood.upper() == 'FRUSTRATED':
-                total_frustrated += 1
-            elif mindful.user_mood.upper() == 'CONTENT':
-                total_content += 1
-            elif mindful.user_mood.upper() == 'STRESSED':
-                total_stressed += 1
-            elif mindful.user_mood.upper() == 'GRATEFUL':
-                total_grateful += 1
-            else:
-                continue
-
-        mood_breakdown_dictionary = {
-            'total_moods_logged': total_moods_logged,
-            'happy': (total_happy / total_moods_logged) * 100,
-            'sad': (total_sad / total_moods_logged) * 100,
-            'frustrated': (total_frustrated / total_moods_logged) * 100,
-            'content': (total_content / total_moods_logged) * 100,
-            'stressed': (total_stressed / total_moods_logged) * 100,
-            'grateful': (total_grateful / total_moods_logged) * 100
-        }
+    return build_mood_histogram(Counter(normalize_mood(mindful.user_mood) for mindful in mindfulness))
 
-        return mood_breakdown_dictionary
-    else:
+
+def build_mood_histogram(mood_counts):
+    """
+    This function turns a dictionary of mood code to count into the pie chart dictionary. There is one
+    percentage per Mood, keyed by the lower case mood name. Moods that are not part of the Mood enumeration
+    count towards the total but get no slice.
+    :param mood_counts:
+    :return:
+    """
+    total_moods_logged = sum(mood_counts.values())
+    if total_moods_logged == 0:
         return {
             'no_moods_logged': 100
         }
 
+    mood_breakdown_dictionary = {'total_moods_logged': total_moods_logged}
+    for mood in Mood:
+        mood_breakdown_dictionary[mood.name.lower()] = (mood_counts.get(mood.name, 0) / total_moods_logged) * 100
+    return mood_breakdown_dictionary
+
 
 def get_mindfulness_data_history():
     """
@@ -61,13 +49,22 @@ def get_mindfulness_data_history():
     return get_all_mindfulness_data()
 
 
+def get_mindfulness_dates(before_date=None, limit=50):
+    """
+    returns a page of mindfulness log dates, newest first
+    :param before_date: the last date of the previous page
+    :param limit:
+    :return:
+    """
+    return get_mindfulness_log_dates(before_date, limit)
+
+
 def calculate_mood_breakdown():
     """
         returns a dictionary containing the mindfulness label and data for the pie chart
     :return:
     """
-    mindfulness = get_all_mindfulness_data()
-    return get_mindfulness_breakdown_dictionary(mindfulness)
+    return build_mood_histogram(get_mood_counts())
 
 
 def calculate_mood_breakdown_by_date(date1, date2):
@@ -77,8 +74,94 @@ def calculate_mood_breakdown_by_date(date1, date2):
     :param date2:
     :return:
     """
-    mindfulness = get_all_mindfulness_data_between_dates(date1, date2)
-    return get_mindfulness_breakdown_dictionary(mindfulness)
+    return build_mood_histogram(get_mood_counts(date1, date2))
+
+
+def calculate_mood_breakdown_by_period(period_type, date1, date2):
+    """
+    returns a list of (period key, mood breakdown dictionary) tuples, one per week or month between two dates.
+    Weeks are ISO weeks keyed 'YYYY-Www' and months are keyed 'YYYY-MM'.
+    :param period_type: 'week' or 'month'
+    :param date1:
+    :param date2:
+    :return:
+    """
+    return [(period_key, build_mood_histogram(mood_counts))
+            for period_key, mood_counts in get_mood_rollup_series(period_type, date1, date2)]
+
+
+def calculate_mood_trend(date1, date2, group_by='month'):
+    """
+    returns the number of times each mood was logged per day, week, month or year between two dates as a list of
+    (first day of the bucket, dictionary of lower case mood name to count) tuples. Weeks and months come from the
+    mood rollup table and include the periods without logs, days only include the days with logs.
+    :param date1:
+    :param date2:
+    :param group_by: 'day', 'week', 'month' or 'year'
+    :return:
+    """
+    if group_by == 'day':
+        series = get_mood_counts_by_day(date1, date2)
+    elif group_by == 'year':
+        years = {}
+        for period_key, mood_counts in get_mood_rollup_series('month', date1, date2):
+            year_counts = years.setdefault(date(int(period_key[:4]), 1, 1), Counter())
+            year_counts.update(mood_counts)
+        series = list(years.items())
+    else:
+        series = [(get_mood_period_start(group_by, period_key), mood_counts)
+                  for period_key, mood_counts in get_mood_rollup_series(group_by, date1, date2)]
+    return [(bucket_start, {mood.name.lower(): mood_counts.get(mood.name, 0) for mood in Mood})
+            for bucket_start, mood_counts in series]
+
+
+def get_mindfulness_date_range():
+    """
+    returns the dates of the first and last mindfulness logs, (None, None) when there are none
+    :return:
+    """
+    return get_mindfulness_log_date_range()
+
+
+def calculate_mood_breakdown_for_period(period_type, period_key):
+    """
+    returns the mood breakdown dictionary of a single week or month
+    :param period_type: 'week' or 'month'
+    :param period_key:
+    :return:
+    """
+    return build_mood_histogram(get_mood_rollup_counts(period_type, period_key))
+
+
+def get_mood_period(period_type, date):
+    """
+    returns the key of the week or month a date belongs to
+    :param period_type: 'week' or 'month'
+    :param date:
+    :return:
+    """
+    return get_mood_period_key(period_type, date)
+
+
+def step_mood_period(period_type, period_key, steps):
+    """
+    returns the key of the week or month the given number of steps before (negative) or after (positive) a period
+    :param period_type: 'week' or 'month'
+    :param period_key:
+    :param steps:
+    :return:
+    """
+    return shift_mood_period_key(period_type, period_key, steps)
+
+
+def get_mood_period_start_date(period_type, period_key):
+    """
+    returns the first day of a week or month
+    :param period_type: 'week' or 'month'
+    :param period_key:
+    :return:
+    """
+    return get_mood_period_start(period_type, period_key)
 
 
 def get_mindfulness_data(date):
@@ -98,6 +181,7 @@ def insert_mindfulness_log(mood, date):
     :return:
     """
     insert_mindfulness_data(mood, date)
+    publish_data_change(MINDFULNESS)
 
 
 def update_mindfulness_data(mood, date):
@@ -108,6 +192,7 @@ def update_mindfulness_data(mood, date):
     :return:
     """
     update_mindfulness_log(mood, date)
+    publish_data_change(MINDFULNESS)
 
 
 def delete_mindfulness_data(date):
@@ -117,3 +202,4 @@ def delete_mindfulness_data(date):
     :return:
     """
     delete_mindfulness_log(date)
+    publish_data_change(MINDFULNESS)
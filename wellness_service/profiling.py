@@ -0,0 +1,237 @@
+"""
+This script file holds the UI profiler, which measures how responsive the screens feel.
+
+Profiling is off unless the WELLNESS_PROFILE environment variable is set. When it is on, raising a screen, building
+it, laying out and drawing its charts, filling its history list, delivering background results to it and every
+database statement run for it are timed. The timings are kept per screen and phase and reported as percentiles in
+the Diagnostics screen, and written as JSON to the file named by WELLNESS_PROFILE_OUTPUT when the window closes.
+
+Measurements nest: a measure() without a screen belongs to the screen of the measure() around it, so the chart
+functions can time tight_layout() without knowing which screen they draw for.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+from database.instrumentation import add_statement_listener
+
+# Set this environment variable to turn the profiler on
+PROFILE_ENV = "WELLNESS_PROFILE"
+# Set this environment variable to the file the timings are written to when the application closes
+PROFILE_OUTPUT_ENV = "WELLNESS_PROFILE_OUTPUT"
+DEFAULT_PROFILE_OUTPUT = "wellness_profile.json"
+
+# The newest timings kept per screen and phase for the percentiles. The count, total and maximum cover every timing
+PROFILE_SAMPLE_LIMIT = 5000
+PROFILE_PERCENTILES = (50, 90, 99)
+
+# The phase database statements are recorded under
+DATABASE_PHASE = "database"
+
+# The screen of timings taken outside any measure()
+UNKNOWN_SCREEN = "unknown"
+
+# The timings of one phase of one screen, in seconds
+PhaseTimings = namedtuple('PhaseTimings', ['screen', 'phase', 'count', 'total_seconds', 'percentiles',
+                                           'max_seconds'])
+
+_NOT_MEASURING = nullcontext()
+
+
+class PhaseSamples(object):
+    """
+    PhaseSamples holds the timings of one phase of one screen: the running count, total and maximum of every
+    timing, and the newest PROFILE_SAMPLE_LIMIT timings for the percentiles
+    """
+    __slots__ = ('count', 'total_seconds', 'max_seconds', 'window')
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.window = deque(maxlen=PROFILE_SAMPLE_LIMIT)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.window.append(seconds)
+
+
+def get_percentile(sorted_samples, percentile):
+    """
+    returns the nearest rank percentile of samples sorted in ascending order
+    :param sorted_samples:
+    :param percentile: 0 to 100
+    :return:
+    """
+    rank = max(math.ceil(percentile / 100 * len(sorted_samples)), 1)
+    return sorted_samples[rank - 1]
+
+
+class UIProfiler(object):
+    """
+    UIProfiler collects timings per screen and phase. It is shared by the GUI thread and the background workers
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.listening = False
+
+    def enable(self):
+        """
+        Starts recording timings, including the database statements
+        :return:
+        """
+        self.enabled = True
+        if not self.listening:
+            add_statement_listener(self.record_statement)
+            self.listening = True
+
+    def disable(self):
+        """
+        Stops recording timings. The timings recorded are kept
+        :return:
+        """
+        self.enabled = False
+
+    def measure(self, phase, screen=None):
+        """
+        Returns a context manager timing its block as a phase of a screen. It does nothing when the profiler is off
+        :param phase: for example 'tkraise' or 'canvas.draw'
+        :param screen: the screen the work is for, by default the screen of the enclosing measure()
+        :return:
+        """
+        if not self.enabled:
+            return _NOT_MEASURING
+        return self._measure(phase, screen)
+
+    @contextmanager
+    def _measure(self, phase, screen):
+        screens = self.get_screen_stack()
+        screen = screen or (screens[-1] if screens else UNKNOWN_SCREEN)
+        screens.append(screen)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(screen, phase, time.perf_counter() - start)
+            screens.pop()
+
+    def get_screen_stack(self):
+        """
+        Returns the screens of the measurements open on the current thread, innermost last
+        :return:
+        """
+        screens = getattr(self.local, 'screens', None)
+        if screens is None:
+            screens = self.local.screens = []
+        return screens
+
+    def record(self, screen, phase, seconds):
+        """
+        Adds a timing to a phase of a screen
+        :param screen:
+        :param phase:
+        :param seconds:
+        :return:
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            samples = self.samples.get((screen, phase))
+            if samples is None:
+                samples = self.samples[(screen, phase)] = PhaseSamples()
+            samples.add(seconds)
+
+    def record_statement(self, origin, call_site, seconds):
+        """
+        Statement listener. Records a database statement under the screen being measured on this thread, or the
+        screen the statement was run for
+        :param origin:
+        :param call_site:
+        :param seconds:
+        :return:
+        """
+        if not self.enabled:
+            return
+        screens = self.get_screen_stack()
+        self.record(screens[-1] if screens else origin, DATABASE_PHASE, seconds)
+
+    def get_timings(self):
+        """
+        Returns the PhaseTimings of every screen and phase recorded, sorted by screen and slowest phase first. The
+        percentiles are those of the newest PROFILE_SAMPLE_LIMIT timings
+        :return:
+        """
+        with self.lock:
+            samples = {key: (entry.count, entry.total_seconds, entry.max_seconds, sorted(entry.window))
+                       for key, entry in self.samples.items()}
+        timings = [PhaseTimings(screen, phase, count, total_seconds,
+                                {percentile: get_percentile(window, percentile) for percentile in PROFILE_PERCENTILES},
+                                max_seconds)
+                   for (screen, phase), (count, total_seconds, max_seconds, window) in samples.items() if window]
+        return sorted(timings, key=lambda timing: (timing.screen, -timing.total_seconds))
+
+    def format_report(self):
+        """
+        Returns the timings as a text table in milliseconds
+        :return:
+        """
+        headings = "".join(f"{'p' + str(percentile):>9}" for percentile in PROFILE_PERCENTILES)
+        lines = [f"{'Screen':<26}{'Phase':<16}{'Count':>7}{'Total':>10}{headings}{'Max':>9}"]
+        for timing in self.get_timings():
+            percentiles = "".join(f"{timing.percentiles[percentile] * 1000:9.2f}"
+                                  for percentile in PROFILE_PERCENTILES)
+            lines.append(f"{timing.screen:<26}{timing.phase:<16}{timing.count:>7}{timing.total_seconds * 1000:10.1f}"
+                         f"{percentiles}{timing.max_seconds * 1000:9.2f}")
+        return "\n".join(lines)
+
+    def write_report(self, path):
+        """
+        Writes the timings to a JSON file, in milliseconds
+        :param path:
+        :return:
+        """
+        report = {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'screens': {},
+        }
+        for timing in self.get_timings():
+            report['screens'].setdefault(timing.screen, {})[timing.phase] = {
+                'count': timing.count,
+                'total_ms': timing.total_seconds * 1000,
+                **{f"p{percentile}_ms": value * 1000 for percentile, value in timing.percentiles.items()},
+                'max_ms': timing.max_seconds * 1000,
+            }
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+    def reset(self):
+        """
+        Forgets every timing recorded
+        :return:
+        """
+        with self.lock:
+            self.samples.clear()
+
+
+profiler = UIProfiler()
+if os.environ.get(PROFILE_ENV):
+    profiler.enable()
+
+
+def get_profile_output_path():
+    """
+    returns the file the timings are written to
+    :return:
+    """
+    return os.environ.get(PROFILE_OUTPUT_ENV) or DEFAULT_PROFILE_OUTPUT
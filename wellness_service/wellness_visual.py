@@ -1,23 +1,102 @@
 """
-This script file contains the functions for setting up a pie chart to be used for displaying wellness data
+This script file contains the functions for setting up the pie and trend charts used for displaying wellness data
+
+Each chart is built in two steps. The prepare functions query and aggregate the data and return a chart
+dictionary. They do not touch matplotlib, so they can run on a background thread. draw_pie_chart then draws a
+chart dictionary onto a figure and must run on the GUI thread.
+
+Prepared charts are kept in a bounded LRU cache keyed by chart type, arguments and the version of the table
+they were built from, so raising a screen again or repeating a filter does not query or aggregate again.
+
+Trend charts plot the data over time. The logs are summed into day, week, month or year buckets, picking the
+smallest bucket that keeps the number of points within what the canvas width can show, so a trend over years
+draws a few hundred points instead of one per day.
 """
-from wellness_service.financial_wellness import calculate_financial_breakdown, calculate_financial_breakdown_by_date
+import threading
+from collections import OrderedDict
+
+from wellness_service.data_events import get_data_version, FINANCE, MINDFULNESS
+from wellness_service.financial_wellness import calculate_financial_breakdown, calculate_financial_breakdown_by_date, \
+    calculate_financial_trend, get_financial_wellness_date_range
 from wellness_service.mindfulness import calculate_mood_breakdown, \
-    calculate_mood_breakdown_by_date
+    calculate_mood_breakdown_by_date, calculate_mood_breakdown_for_period, calculate_mood_trend, \
+    get_mindfulness_date_range
+from wellness_service.profiling import profiler
 
 
-def show_financial_wellness_pie_chart(figure):
+FINANCIAL_PIE_CHART = 'financial_pie'
+MOOD_PIE_CHART = 'mood_pie'
+MOOD_PERIOD_PIE_CHART = 'mood_period_pie'
+FINANCIAL_TREND_CHART = 'financial_trend'
+MOOD_TREND_CHART = 'mood_trend'
+
+# The trend buckets from smallest to largest and their approximate length in days
+TREND_GROUPS = (('day', 1), ('week', 7), ('month', 30.44), ('year', 365.25))
+# The horizontal space each point of a trend line gets. The bucket is picked so the points are at least this far
+# apart on the canvas
+TREND_PIXELS_PER_POINT = 4
+DEFAULT_CHART_WIDTH = 600
+
+# The finance columns whose summed amounts are drawn as stacked areas on the financial trend chart, and their labels
+FINANCIAL_TREND_EXPENSES = (('grocery_expense', 'grocery'), ('utility_expense', 'utility'), ('rent', 'rent'),
+                            ('food_expense', 'food'), ('misc_expense', 'misc'))
+
+
+class ChartCache(object):
     """
-    This function accepts a figure to add the subplot to and gets the pie chart ready to be displayed.
-    This returns all existing financial wellness data the user has entered
-    :param figure:
+    ChartCache is a thread safe least recently used cache of prepared chart dictionaries.
+    Once it holds max_entries charts the least recently used chart is evicted.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build_chart):
+        """
+        Returns the chart cached under key, building and caching it with build_chart() on a miss
+        :param key:
+        :param build_chart:
+        :return:
+        """
+        with self.lock:
+            chart = self.entries.get(key)
+            if chart is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return chart
+            self.misses += 1
+        chart = dict(build_chart(), key=key)
+        with self.lock:
+            self.entries[key] = chart
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return chart
+
+    def clear(self):
+        """
+        Removes every cached chart
+        :return:
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+chart_cache = ChartCache()
+
+
+def get_financial_pie_chart(finance_dictionary):
+    """
+    This function turns a financial breakdown dictionary into a chart dictionary
+    :param finance_dictionary:
     :return:
     """
-    finance_dictionary = calculate_financial_breakdown()
     labels = []
     data = []
-    # add a subplot to the figure (1x1 grid, first subplot)
-    plt = figure.add_subplot(1, 1, 1)
     for finance in finance_dictionary:
         if finance == 'total_debt':
             labels.append(f"{finance}: {finance_dictionary[finance]}")
@@ -27,12 +106,231 @@ def show_financial_wellness_pie_chart(figure):
             if finance_dictionary[finance] != 0:
                 labels.append(finance)
                 data.append(finance_dictionary[finance])
+    return {'labels': labels, 'data': data, 'legend_title': "Expenses", 'title': "Financial Wellness"}
+
+
+def get_mood_pie_chart(mood_dictionary, title="Mood Wellness"):
+    """
+    This function turns a mood breakdown dictionary into a chart dictionary
+    :param mood_dictionary:
+    :param title:
+    :return:
+    """
+    labels = []
+    data = []
+    for item in mood_dictionary:
+        if item != 'total_moods_logged':
+            if mood_dictionary[item] == 0:
+                continue
+            else:
+                labels.append(item)
+                data.append(mood_dictionary[item])
+    return {'labels': labels, 'data': data, 'legend_title': "Moods", 'title': title}
+
+
+def prepare_financial_wellness_pie_chart(date1=None, date2=None):
+    """
+    This function returns the chart dictionary of the financial wellness pie chart. When both dates are given
+    only the financial data between them is used, otherwise all the financial data the user has entered.
+    :param date1:
+    :param date2:
+    :return:
+    """
+    key = (FINANCIAL_PIE_CHART, date1, date2, get_data_version(FINANCE))
+    if date1 is not None and date2 is not None:
+        return chart_cache.get_or_build(
+            key, lambda: get_financial_pie_chart(calculate_financial_breakdown_by_date(date1, date2)))
+    return chart_cache.get_or_build(key, lambda: get_financial_pie_chart(calculate_financial_breakdown()))
+
+
+def prepare_mood_wellness_pie_chart(date1=None, date2=None):
+    """
+    This function returns the chart dictionary of the mood pie chart. When both dates are given only the mood
+    data between them is used, otherwise all the mood data the user has entered.
+    :param date1:
+    :param date2:
+    :return:
+    """
+    key = (MOOD_PIE_CHART, date1, date2, get_data_version(MINDFULNESS))
+    if date1 is not None and date2 is not None:
+        return chart_cache.get_or_build(
+            key, lambda: get_mood_pie_chart(calculate_mood_breakdown_by_date(date1, date2)))
+    return chart_cache.get_or_build(key, lambda: get_mood_pie_chart(calculate_mood_breakdown()))
+
+
+def prepare_mood_wellness_pie_chart_by_period(period_type, period_key):
+    """
+    This function returns the chart dictionary of the mood pie chart of a single week or month
+    :param period_type: 'week' or 'month'
+    :param period_key:
+    :return:
+    """
+    key = (MOOD_PERIOD_PIE_CHART, period_type, period_key, get_data_version(MINDFULNESS))
+    return chart_cache.get_or_build(key, lambda: get_mood_pie_chart(
+        calculate_mood_breakdown_for_period(period_type, period_key), f"Mood Wellness {period_key}"))
+
+
+def choose_trend_group(date1, date2, width_pixels=DEFAULT_CHART_WIDTH):
+    """
+    This function picks the smallest bucket that draws the range between two dates with at most one point every
+    TREND_PIXELS_PER_POINT pixels
+    :param date1:
+    :param date2:
+    :param width_pixels: the width of the canvas the chart is drawn on
+    :return: 'day', 'week', 'month' or 'year'
+    """
+    max_points = max(width_pixels // TREND_PIXELS_PER_POINT, 1)
+    range_days = (date2 - date1).days + 1
+    for group_by, group_days in TREND_GROUPS:
+        if range_days / group_days <= max_points:
+            return group_by
+    return TREND_GROUPS[-1][0]
+
+
+def get_trend_range(date1, date2, get_date_range):
+    """
+    This function returns the range a trend chart covers: the dates given, or the first to the last log
+    :param date1:
+    :param date2:
+    :param get_date_range: function returning the dates of the first and last logs
+    :return:
+    """
+    if date1 is not None and date2 is not None:
+        return date1, date2
+    return get_date_range()
+
+
+def get_financial_trend_chart(trend, group_by):
+    """
+    This function turns a list of (bucket start, totals dictionary) tuples into a trend chart dictionary with the
+    amount spent in each expense column as stacked areas and the income as a line
+    :param trend:
+    :param group_by:
+    :return:
+    """
+    return {'kind': 'trend',
+            'dates': [bucket_start for bucket_start, _ in trend],
+            'areas': [(label, [totals[column] or 0 for _, totals in trend])
+                      for column, label in FINANCIAL_TREND_EXPENSES],
+            'lines': [('income', [totals['income'] or 0 for _, totals in trend])],
+            'legend_title': "Finances", 'title': f"Financial Trend by {group_by}", 'y_label': "Amount"}
+
+
+def get_mood_trend_chart(trend, group_by):
+    """
+    This function turns a list of (bucket start, mood count dictionary) tuples into a trend chart dictionary with
+    the count of each mood as stacked areas
+    :param trend:
+    :param group_by:
+    :return:
+    """
+    moods = list(trend[0][1]) if trend else []
+    return {'kind': 'trend',
+            'dates': [bucket_start for bucket_start, _ in trend],
+            'areas': [(mood, [mood_counts[mood] for _, mood_counts in trend]) for mood in moods],
+            'lines': [],
+            'legend_title': "Moods", 'title': f"Mood Trend by {group_by}", 'y_label': "Moods logged"}
+
+
+def prepare_financial_trend_chart(date1=None, date2=None, width_pixels=DEFAULT_CHART_WIDTH):
+    """
+    This function returns the chart dictionary of the income and expenses over time. Without dates the chart
+    covers every finance log.
+    :param date1:
+    :param date2:
+    :param width_pixels: the width of the canvas the chart is drawn on, used to pick the bucket size
+    :return:
+    """
+    date1, date2 = get_trend_range(date1, date2, get_financial_wellness_date_range)
+    if date1 is None:
+        return dict(get_financial_trend_chart([], 'day'), key=(FINANCIAL_TREND_CHART, None))
+    group_by = choose_trend_group(date1, date2, width_pixels)
+    key = (FINANCIAL_TREND_CHART, date1, date2, group_by, get_data_version(FINANCE))
+    return chart_cache.get_or_build(
+        key, lambda: get_financial_trend_chart(calculate_financial_trend(date1, date2, group_by), group_by))
+
 
-    plt.pie(data, labels=labels)
-    plt.legend(title="Expenses", bbox_to_anchor=(0.90, 0.5))
-    plt.set_title("Financial Wellness")
+def prepare_mood_trend_chart(date1=None, date2=None, width_pixels=DEFAULT_CHART_WIDTH):
+    """
+    This function returns the chart dictionary of how often each mood was logged over time. Without dates the
+    chart covers every mood log.
+    :param date1:
+    :param date2:
+    :param width_pixels: the width of the canvas the chart is drawn on, used to pick the bucket size
+    :return:
+    """
+    date1, date2 = get_trend_range(date1, date2, get_mindfulness_date_range)
+    if date1 is None:
+        return dict(get_mood_trend_chart([], 'day'), key=(MOOD_TREND_CHART, None))
+    group_by = choose_trend_group(date1, date2, width_pixels)
+    key = (MOOD_TREND_CHART, date1, date2, group_by, get_data_version(MINDFULNESS))
+    return chart_cache.get_or_build(
+        key, lambda: get_mood_trend_chart(calculate_mood_trend(date1, date2, group_by), group_by))
+
+
+def draw_chart(figure, chart):
+    """
+    This function draws a pie or trend chart dictionary onto a figure
+    :param figure:
+    :param chart:
+    :return:
+    """
+    if chart.get('kind') == 'trend':
+        draw_trend_chart(figure, chart)
+    else:
+        draw_pie_chart(figure, chart)
+
+
+def draw_trend_chart(figure, chart):
+    """
+    This function accepts a figure to add the subplot to and draws a trend chart dictionary onto it
+    :param figure:
+    :param chart:
+    :return:
+    """
+    plt = figure.add_subplot(1, 1, 1)
+    plt.set_title(chart['title'])
+    if not chart['dates']:
+        plt.text(0.5, 0.5, "Nothing logged yet", ha='center', va='center', transform=plt.transAxes)
+        plt.set_axis_off()
+        return
+    if chart['areas']:
+        plt.stackplot(chart['dates'], *[values for _, values in chart['areas']],
+                      labels=[label for label, _ in chart['areas']], alpha=0.8)
+    for label, values in chart['lines']:
+        plt.plot(chart['dates'], values, label=label, color='black', linewidth=1.5)
+    plt.set_ylabel(chart['y_label'])
+    plt.legend(title=chart['legend_title'], loc='upper left', fontsize='small')
+    figure.autofmt_xdate()
+    with profiler.measure("tight_layout"):
+        figure.tight_layout()
+
+
+def draw_pie_chart(figure, chart):
+    """
+    This function accepts a figure to add the subplot to and draws a chart dictionary onto it
+    :param figure:
+    :param chart:
+    :return:
+    """
+    # add a subplot to the figure (1x1 grid, first subplot)
+    plt = figure.add_subplot(1, 1, 1)
+    plt.pie(chart['data'], labels=chart['labels'])
+    plt.legend(title=chart['legend_title'], bbox_to_anchor=(0.90, 0.5))
+    plt.set_title(chart['title'])
     # tight_layout() adjusts the subplots parameters to fit properly
-    figure.tight_layout()
+    with profiler.measure("tight_layout"):
+        figure.tight_layout()
+
+
+def show_financial_wellness_pie_chart(figure):
+    """
+    This function accepts a figure to add the subplot to and gets the pie chart ready to be displayed.
+    This returns all existing financial wellness data the user has entered
+    :param figure:
+    :return:
+    """
+    draw_pie_chart(figure, prepare_financial_wellness_pie_chart())
 
 
 def show_financial_wellness_by_date(figure, date1, date2):
@@ -44,22 +342,7 @@ def show_financial_wellness_by_date(figure, date1, date2):
         :param figure:
         :return:
         """
-    finance_dictionary = calculate_financial_breakdown_by_date(date1, date2)
-    labels = []
-    data = []
-    # add a subplot to the figure (1x1 grid, first subplot)
-    plt = figure.add_subplot(1, 1, 1)
-    for finance in finance_dictionary:
-        if finance != 'total_income' and finance != 'total_expense':
-            if finance_dictionary[finance] != 0:
-                labels.append(finance)
-                data.append(finance_dictionary[finance])
-
-    plt.pie(data, labels=labels)
-    plt.legend(title="Expenses", bbox_to_anchor=(0.90, 0.5))
-    plt.set_title("Financial Wellness")
-    # tight_layout() adjusts the subplots parameters to fit properly
-    figure.tight_layout()
+    draw_pie_chart(figure, prepare_financial_wellness_pie_chart(date1, date2))
 
 
 def show_mood_wellness_pie_chart(figure):
@@ -69,23 +352,7 @@ def show_mood_wellness_pie_chart(figure):
     :param figure:
     :return:
     """
-    mood_dictionary = calculate_mood_breakdown()
-    labels = []
-    data = []
-    # add a subplot to the figure (1x1 grid, first subplot)
-    plt = figure.add_subplot(1, 1, 1)
-    for item in mood_dictionary:
-        if item != 'total_moods_logged':
-            if mood_dictionary[item] == 0:
-                continue
-            else:
-                labels.append(item)
-                data.append(mood_dictionary[item])
-    plt.pie(data, labels=labels)
-    plt.legend(title="Moods", bbox_to_anchor=(0.90, 0.5))
-    plt.set_title("Mood Wellness")
-    # tight_layout() adjusts the subplots parameters to fit properly
-    figure.tight_layout()
+    draw_pie_chart(figure, prepare_mood_wellness_pie_chart())
 
 
 def show_mood_wellness_pie_chart_date_filter(figure, date1, date2):
@@ -96,20 +363,40 @@ def show_mood_wellness_pie_chart_date_filter(figure, date1, date2):
     :param date2:
     :return:
     """
-    mood_dictionary = calculate_mood_breakdown_by_date(date1, date2)
-    labels = []
-    data = []
-    # add a subplot to the figure (1x1 grid, first subplot)
-    plt = figure.add_subplot(1, 1, 1)
-    for item in mood_dictionary:
-        if item != 'total_moods_logged':
-            if mood_dictionary[item] == 0:
-                continue
-            else:
-                labels.append(item)
-                data.append(mood_dictionary[item])
-    plt.pie(data, labels=labels)
-    plt.legend(title="Moods", bbox_to_anchor=(0.90, 0.5))
-    plt.set_title("Mood Wellness")
-    # tight_layout() adjusts the subplots parameters to fit properly
-    figure.tight_layout()
+    draw_pie_chart(figure, prepare_mood_wellness_pie_chart(date1, date2))
+
+
+def show_mood_wellness_pie_chart_by_period(figure, period_type, period_key):
+    """
+    This function prepares the pie chart containing the mood data of a single week or month. The counts are read
+    from the mood rollup table.
+    :param figure:
+    :param period_type: 'week' or 'month'
+    :param period_key:
+    :return:
+    """
+    draw_pie_chart(figure, prepare_mood_wellness_pie_chart_by_period(period_type, period_key))
+
+
+def show_financial_trend_chart(figure, date1=None, date2=None, width_pixels=DEFAULT_CHART_WIDTH):
+    """
+    This function accepts a figure to add the subplot to and draws the income and expenses over time
+    :param figure:
+    :param date1:
+    :param date2:
+    :param width_pixels:
+    :return:
+    """
+    draw_trend_chart(figure, prepare_financial_trend_chart(date1, date2, width_pixels))
+
+
+def show_mood_trend_chart(figure, date1=None, date2=None, width_pixels=DEFAULT_CHART_WIDTH):
+    """
+    This function accepts a figure to add the subplot to and draws how often each mood was logged over time
+    :param figure:
+    :param date1:
+    :param date2:
+    :param width_pixels:
+    :return:
+    """
+    draw_trend_chart(figure, prepare_mood_trend_chart(date1, date2, width_pixels))